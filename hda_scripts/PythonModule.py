@@ -1,30 +1,112 @@
 import sys
+import os
+import time
+import types
+import marshal
+import hashlib
+import threading
 import hou
-import importlib
-import toolutils
 
-hda_manager = toolutils.createModuleFromSection("hda_manager", kwargs["type"], "hda_manager")
-sys.modules["hda_manager"] = hda_manager
+startTime = time.perf_counter()
 
-houdini_node_manager = toolutils.createModuleFromSection("houdini_node_manager", kwargs["type"], "houdini_node_manager")
-sys.modules["houdini_node_manager"] = houdini_node_manager
+# Modules stored in the HDA sections, in dependency order.
+# They are registered as lazy modules: a section is compiled and run on the first attribute access,
+# so loading the HDA in a hip file costs nothing until something uses them.
+MODULE_SECTIONS = [
+    "export_profiler",
+    "hda_manager",
+    "houdini_node_manager",
+    "gnode",
+    "output_writer",
+    "render_pool",
+    "template_compiler",
+    "render_manager",
+    "network_box_index",
+    "spatial_index",
+    "scene_snapshot",
+    "debug_writer",
+    "node_graph",
+    "export_cache",
+    "export_pipeline",
+    "extract_functions",
+    "watch_manager",
+    "main"
+]
 
-gnode = toolutils.createModuleFromSection("gnode", kwargs["type"], "gnode")
-sys.modules["gnode"] = gnode
+loadLock = threading.RLock()
+loadTimes = {} # module name -> (load time in seconds, True if the bytecode came from the cache)
 
-render_manager = toolutils.createModuleFromSection("render_manager", kwargs["type"], "render_manager")
-sys.modules["render_manager"] = render_manager
+def getBytecodeFolder():
+    return os.path.join(hou.homeHoudiniDirectory(), "houdini2chat", "bytecode")
 
-node_graph = toolutils.createModuleFromSection("node_graph", kwargs["type"], "node_graph")
-sys.modules["node_graph"] = node_graph
+def compileSection(nodeType, section_name):
+    """
+    Returns (code, cached) for a module section. The compiled code is cached across sessions,
+    keyed on a hash of the section content and on the Python version.
+    """
+    source = nodeType.definition().sections()[section_name].contents()
+    key = hashlib.sha1(source.encode("utf-8")).hexdigest()
+    cacheFilename = os.path.join(getBytecodeFolder(), f"{section_name}-{key}.{sys.implementation.cache_tag}.bin")
+    try:
+        with open(cacheFilename, "rb") as f:
+            return marshal.load(f), True
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    code = compile(source, f"opdef:{nodeType.nameWithCategory()}?{section_name}", "exec")
+    try:
+        os.makedirs(os.path.dirname(cacheFilename), exist_ok=True)
+        tempFilename = f"{cacheFilename}.{os.getpid()}.partial"
+        with open(tempFilename, "wb") as f:
+            marshal.dump(code, f)
+        os.replace(tempFilename, cacheFilename)
+    except OSError:
+        pass # read-only home folder, the section is compiled again next session
+    return code, False
 
-extract_functions = toolutils.createModuleFromSection("extract_functions", kwargs["type"], "extract_functions")
-sys.modules["extract_functions"] = extract_functions
+class LazySectionModule(types.ModuleType):
+    """
+    Module created from an HDA section on first attribute access (same as toolutils.createModuleFromSection).
+    """
+    def __init__(self, name, nodeType):
+        super().__init__(name)
+        self.__dict__["_sectionType"] = nodeType
+        self.__dict__["_sectionLoaded"] = False
 
-main = toolutils.createModuleFromSection("main", kwargs["type"], "main")
-sys.modules["main"] = extract_functions
+    def __getattr__(self, attr):
+        if attr.startswith("__") or self.__dict__["_sectionLoaded"]:
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{attr}'")
+        self._load_section()
+        return getattr(self, attr)
+
+    def _load_section(self):
+        with loadLock:
+            if self.__dict__["_sectionLoaded"]:
+                return
+            self.__dict__["_sectionLoaded"] = True
+            start = time.perf_counter()
+            try:
+                code, cached = compileSection(self.__dict__["_sectionType"], self.__name__)
+                exec(code, self.__dict__)
+            except BaseException:
+                self.__dict__["_sectionLoaded"] = False
+                raise
+            # includes the sections loaded by its imports
+            loadTimes[self.__name__] = (time.perf_counter() - start, cached)
+
+for section_name in MODULE_SECTIONS:
+    sys.modules[section_name] = LazySectionModule(section_name, kwargs["type"])
+    globals()[section_name] = sys.modules[section_name]
+
+registrationTime = time.perf_counter() - startTime
+
+def loadReport():
+    """
+    Time spent registering the modules, and loading each one used so far.
+    """
+    loads = ", ".join(f"{name} {seconds * 1000:.1f}ms{' (cached)' if cached else ''}" for name, (seconds, cached) in loadTimes.items())
+    return f"registration {registrationTime * 1000:.2f}ms, loaded: {loads if loads else 'none'}"
 
 def handleAction(action_value):
     hda_node = hou.pwd()
-    hda_node.parm("action_selected").set(action_value)    
-    main.main()
\ No newline at end of file
+    hda_node.parm("action_selected").set(action_value)
+    main.main()
@@ -0,0 +1,159 @@
+import itertools
+import json
+import queue
+import threading
+import weakref
+
+class DebugBundle:
+    """
+    Append-only JSON Lines file holding the debug stages of the graphs of one export (see NodeGraph.save_network).
+    The calling thread only takes a cheap copy of the graph state, a background thread serializes it.
+    The first stage of a graph is stored in full, the next ones as a delta against the previous stage.
+
+    Each line is a record: {"graph", "stage", "seq", "base", "attrs", "nodes", "removed_nodes", "added_edges", "removed_edges"}
+    where base is the seq of the previous stage of the graph (None for a full record). See DebugBundleReader.
+    """
+    _active = None
+    _STOP = object()
+
+    def __init__(self, filename, default=None, queueDepth=256):
+        self.filename = filename
+        self.default = default # json default function for the values json cannot encode (ex. houdini_node_manager.serialize_value)
+        self.queue = queue.Queue(maxsize=queueDepth)
+        self.thread = None
+        self.error = None
+        self.keys = weakref.WeakKeyDictionary() # graph -> key in the bundle
+        self.keysLock = threading.Lock()
+        self.keyCounter = itertools.count() # graphs are collected during the export, len(self.keys) would reuse keys
+        self.previous = {} # graph key -> (seq, attrs fragments, node fragments, edges) of its last stage
+        self.seq = 0
+
+    @staticmethod
+    def start(filename, default=None):
+        bundle = DebugBundle(filename, default)
+        bundle.thread = threading.Thread(target=bundle.run, name="DebugBundle.writer", daemon=True)
+        bundle.thread.start()
+        DebugBundle._active = bundle
+        return bundle
+
+    @staticmethod
+    def current():
+        return DebugBundle._active
+
+    def close(self):
+        if DebugBundle._active is self:
+            DebugBundle._active = None
+        if self.thread is not None:
+            self.queue.put(DebugBundle._STOP)
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def graph_key(self, graph, name):
+        with self.keysLock:
+            key = self.keys.get(graph)
+            if key is None:
+                key = f"{next(self.keyCounter)}:{name}"
+                self.keys[graph] = key
+            return key
+
+    def submit(self, graph, stage, attrs, nodes, edges):
+        """
+        Queues a stage of a graph. attrs, nodes (path -> GNode) and edges must be copies the caller does not change anymore.
+        """
+        self.queue.put((self.graph_key(graph, attrs.get("name")), stage, attrs, nodes, edges))
+
+    def run(self):
+        try:
+            with open(self.filename, "w") as f:
+                while True:
+                    entry = self.queue.get()
+                    if entry is DebugBundle._STOP:
+                        return
+                    if self.error is None:
+                        f.write(self.encode(*entry))
+                        f.write("\n")
+        except Exception as error:
+            self.error = error
+            # keep draining, so submitting threads never block on a dead writer
+            while self.queue.get() is not DebugBundle._STOP:
+                pass
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(",", ":"), default=self.default)
+
+    def encode(self, key, stage, attrs, nodes, edges):
+        attrFragments = {name: self.dumps(value) for name, value in attrs.items()}
+        nodeFragments = {path: self.dumps(gNode.toDict()) for path, gNode in nodes.items()}
+        previous = self.previous.get(key)
+        self.seq += 1
+        if previous is None:
+            base = None
+            changedAttrs, changedNodes = attrFragments, nodeFragments
+            removedNodes, addedEdges, removedEdges = [], edges, []
+        else:
+            base, previousAttrs, previousNodes, previousEdges = previous
+            changedAttrs = {name: fragment for name, fragment in attrFragments.items() if previousAttrs.get(name) != fragment}
+            changedNodes = {path: fragment for path, fragment in nodeFragments.items() if previousNodes.get(path) != fragment}
+            removedNodes = [path for path in previousNodes if path not in nodeFragments]
+            edgeSet, previousEdgeSet = set(edges), set(previousEdges)
+            addedEdges = [edge for edge in edges if edge not in previousEdgeSet]
+            removedEdges = [edge for edge in previousEdges if edge not in edgeSet]
+        self.previous[key] = (self.seq, attrFragments, nodeFragments, edges)
+        # fragments are already encoded, the record is assembled around them
+        return ('{"graph":' + self.dumps(key) + ',"stage":' + self.dumps(stage) + ',"seq":' + str(self.seq) +
+                ',"base":' + self.dumps(base) +
+                ',"attrs":{' + ",".join(self.dumps(name) + ":" + fragment for name, fragment in changedAttrs.items()) + '}' +
+                ',"nodes":{' + ",".join(self.dumps(path) + ":" + fragment for path, fragment in changedNodes.items()) + '}' +
+                ',"removed_nodes":' + self.dumps(removedNodes) +
+                ',"added_edges":' + self.dumps(addedEdges) + ',"removed_edges":' + self.dumps(removedEdges) + '}')
+
+class DebugBundleReader:
+    """
+    Rebuilds the stages of a DebugBundle file. Only the line offsets are read up front,
+    a stage is rebuilt on demand by applying the deltas of its graph up to it.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.records = {} # graph key -> [(stage, seq, offset)]
+        with open(filename, "rb") as f:
+            offset = 0
+            for line in f:
+                head = json.loads(line)
+                self.records.setdefault(head["graph"], []).append((head["stage"], head["seq"], offset))
+                offset += len(line)
+
+    def graphs(self):
+        return list(self.records)
+
+    def stages(self, graph_key):
+        return [stage for stage, _, _ in self.records[graph_key]]
+
+    def read_record(self, f, offset):
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def get_stage(self, graph_key, stage, occurrence=0):
+        """
+        Returns the graph state at the stage (the occurrence-th one, for stages saved several times),
+        as the dictionary save_network writes: graph attributes, "gNodes" (path -> node dict) and "edges".
+        """
+        matches = [i for i, (name, _, _) in enumerate(self.records[graph_key]) if name == stage]
+        if len(matches) <= occurrence:
+            raise KeyError(f"{graph_key} has no stage {stage} #{occurrence}")
+        last = matches[occurrence]
+        attrs, nodes, edges = {}, {}, []
+        with open(self.filename, "rb") as f:
+            for _, _, offset in self.records[graph_key][:last + 1]:
+                record = self.read_record(f, offset)
+                attrs.update(record["attrs"])
+                for path in record["removed_nodes"]:
+                    nodes.pop(path, None)
+                nodes.update(record["nodes"])
+                removed = {tuple(edge) for edge in record["removed_edges"]}
+                edges = [edge for edge in edges if tuple(edge) not in removed] + record["added_edges"]
+        data = dict(attrs)
+        data["gNodes"] = nodes
+        data["edges"] = edges
+        return data
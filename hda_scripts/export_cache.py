@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import hda_manager as hda
+
+class ExportCache:
+    """
+    Persistent incremental export cache, stored as a SQLite file in the state folder of the project location.
+    It keeps a content hash per node (type, name, parm values, inputs, note), a rolled-up hash per
+    graph unit and the rendered text of each unit. On re-export only the units whose hash changed
+    are rendered again, the others are spliced back from the cache.
+    The node hashes are also rolled up per network: a network whose hash did not change is not composed
+    at all, its recorded output (see main.recordNetwork) is restored from the cache.
+    """
+    FILENAME = "cache.sqlite"
+    # bump when the hashed data or the rendered output changes shape, to drop old entries
+    VERSION = 2
+
+    def __init__(self, folder, hdaSettings=None):
+        self.hdaSettings = hdaSettings if hdaSettings else hda.HDAManager.current()
+        self.filename = os.path.join(folder, ExportCache.FILENAME)
+        self.connection = None
+        self.lock = threading.RLock()
+        self.run_id = time.time()
+        self.node_hashes = {} # node path -> hash, computed once per run
+        self.unit_keys = {} # unit key -> number of times used in this run
+        self.exported_parents = set()
+        self.stats = {"dirty_nodes": 0, "clean_nodes": 0, "rendered_units": 0, "cached_units": 0,
+                      "built_networks": 0, "cached_networks": 0}
+
+    def open(self):
+        if not os.path.exists(os.path.dirname(self.filename)):
+            os.makedirs(os.path.dirname(self.filename))
+        # connection is shared by the export threads, access is serialized with self.lock
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+            cursor.execute("CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, hash TEXT)")
+            cursor.execute("CREATE TABLE IF NOT EXISTS units (unit_key TEXT PRIMARY KEY, parent_path TEXT, "
+                           "hash TEXT, text TEXT, run_id REAL)")
+            cursor.execute("CREATE TABLE IF NOT EXISTS networks (parent_path TEXT PRIMARY KEY, hash TEXT, output TEXT)")
+            row = cursor.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+            if row is None or row[0] != str(ExportCache.VERSION):
+                cursor.execute("DELETE FROM nodes")
+                cursor.execute("DELETE FROM units")
+                cursor.execute("DELETE FROM networks")
+                cursor.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('version', ?)", (str(ExportCache.VERSION),))
+            self.connection.commit()
+        return self
+
+    def close(self):
+        if self.connection is None:
+            return
+        with self.lock:
+            # drop the units of the exported networks that were not produced by this run
+            for parent_path in self.exported_parents:
+                self.connection.execute("DELETE FROM units WHERE parent_path = ? AND run_id != ?",
+                                        (parent_path, self.run_id))
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+        self.hdaSettings.consoleLogDebug(f"======= ExportCache.close: {self.stats}")
+
+# ==================================
+# ========= Hashing
+# ==================================
+
+    @staticmethod
+    def hash_data(data):
+        text = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def node_content(record):
+        return {
+            "type": record["type"],
+            "name": record["name"],
+            "comment": record["comment"],
+            "inputs": record["inputs"],
+            "outputs": record["outputs"],
+            "block_path": record.get("block_path"),
+            "properties": record["properties"]
+        }
+
+    def track_snapshot(self, snapshot):
+        """
+        Hashes all the nodes of a snapshot and compares them with the previous export.
+        Called for every snapshot of the export, including the ones kept by watch mode:
+        their hashes are kept in the snapshot, so only the nodes captured again are hashed.
+        """
+        self.exported_parents.add(snapshot.parent_path)
+        rows = []
+        with self.lock:
+            cursor = self.connection.cursor()
+            for node_path, record in snapshot.nodes.items():
+                node_hash = snapshot.nodeHashes.get(node_path)
+                if node_hash is None:
+                    node_hash = ExportCache.hash_data(ExportCache.node_content(record))
+                    snapshot.nodeHashes[node_path] = node_hash
+                self.node_hashes[node_path] = node_hash
+                row = cursor.execute("SELECT hash FROM nodes WHERE path = ?", (node_path,)).fetchone()
+                if row is not None and row[0] == node_hash:
+                    self.stats["clean_nodes"] += 1
+                else:
+                    self.stats["dirty_nodes"] += 1
+                    rows.append((node_path, node_hash))
+            cursor.executemany("INSERT OR REPLACE INTO nodes (path, hash) VALUES (?, ?)", rows)
+            self.connection.commit()
+        self.hdaSettings.consoleLogDebug(f"======= ExportCache.track_snapshot: {snapshot.parent_path} {len(rows)} dirty nodes")
+
+    def network_hash(self, snapshot, extra=None):
+        """
+        Rolled-up hash of a tracked snapshot (see track_snapshot): node hashes and positions,
+        network boxes, sticky notes and the export settings given as extra.
+        """
+        nodes = [(node_path, snapshot.nodeHashes.get(node_path), record["position"], record["network_box"])
+                 for node_path, record in snapshot.nodes.items()]
+        data = {
+            "parent_name": snapshot.parent_name,
+            "parent_type": snapshot.parent_type,
+            "nodes": nodes,
+            "network_boxes": snapshot.network_boxes,
+            "sticky_notes": snapshot.sticky_notes,
+            "extra": extra
+        }
+        return ExportCache.hash_data(data)
+
+    def unit_key(self, graph):
+        key = f"{graph.parent_path}|{graph.name}|{graph.loop_id}"
+        with self.lock:
+            count = self.unit_keys.get(key, 0)
+            self.unit_keys[key] = count + 1
+        return f"{key}#{count}"
+
+    def unit_hash(self, graph, extra=None):
+        """
+        Rolled-up hash of a graph unit: member node hashes, notes, edges, branches and the render settings.
+        """
+        nodes = []
+        for node_path, gNode in graph.gNodes.items():
+            nodes.append((node_path, self.node_hashes.get(gNode.getOriginalPath()), gNode.getNote()))
+        data = {
+            "name": graph.name,
+            "is_loop_graph": graph.is_loop_graph,
+            "loop_end": graph.loop_end,
+            "begin_nodes": graph.begin_nodes,
+            "nodes": nodes,
+            "edges": list(graph.edges),
+            "branches": graph.branches,
+            "cycles": graph.cycles,
+            "notes": graph.notes,
+            "export_this_node": self.hdaSettings.exportThisNode,
+            "extra": extra
+        }
+        return ExportCache.hash_data(data)
+
+# ==================================
+# ========= Networks
+# ==================================
+
+    def get_network(self, parent_path, network_hash):
+        """
+        Returns the recorded output of the network if its hash did not change, None otherwise.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT hash, output FROM networks WHERE parent_path = ?", (parent_path,)).fetchone()
+            if row is None or row[0] != network_hash:
+                self.stats["built_networks"] += 1
+                return None
+            # its units are still valid, they are not dropped by close()
+            self.connection.execute("UPDATE units SET run_id = ? WHERE parent_path = ?", (self.run_id, parent_path))
+            self.stats["cached_networks"] += 1
+            return json.loads(row[1])
+
+    def put_network(self, parent_path, network_hash, output):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO networks (parent_path, hash, output) VALUES (?, ?, ?)",
+                                    (parent_path, network_hash, json.dumps(output)))
+
+# ==================================
+# ========= Units
+# ==================================
+
+    def get_unit(self, unit_key, unit_hash):
+        with self.lock:
+            row = self.connection.execute("SELECT hash, text FROM units WHERE unit_key = ?", (unit_key,)).fetchone()
+            if row is None or row[0] != unit_hash:
+                return None
+            self.connection.execute("UPDATE units SET run_id = ? WHERE unit_key = ?", (self.run_id, unit_key))
+            self.stats["cached_units"] += 1
+            return row[1]
+
+    def put_unit(self, unit_key, parent_path, unit_hash, text):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO units (unit_key, parent_path, hash, text, run_id) "
+                                    "VALUES (?, ?, ?, ?, ?)", (unit_key, parent_path, unit_hash, text, self.run_id))
+            self.stats["rendered_units"] += 1
+
+    def render_unit(self, graph, renderFunction, extra=None):
+        """
+        Returns the cached text of the unit if its hash did not change, otherwise renders and stores it.
+        """
+        unit_key = self.unit_key(graph)
+        unit_hash = self.unit_hash(graph, extra)
+        text = self.get_unit(unit_key, unit_hash)
+        if text is None:
+            text = renderFunction(graph)
+            self.put_unit(unit_key, graph.parent_path, unit_hash, text)
+        return text
+
+    def render_units(self, graphs, renderFunction, extra=None):
+        """
+        Same as render_unit for a list of graphs, the units that changed are rendered together:
+        renderFunction(graphs) returns their texts in order.
+        """
+        texts = []
+        missing = [] # (index, unit_key, unit_hash) of the units to render
+        for graph in graphs:
+            unit_key = self.unit_key(graph)
+            unit_hash = self.unit_hash(graph, extra)
+            texts.append(self.get_unit(unit_key, unit_hash))
+            if texts[-1] is None:
+                missing.append((len(texts) - 1, unit_key, unit_hash))
+        if missing:
+            rendered = renderFunction([graphs[index] for index, _, _ in missing])
+            for (index, unit_key, unit_hash), text in zip(missing, rendered):
+                texts[index] = text
+                self.put_unit(unit_key, graphs[index].parent_path, unit_hash, text)
+        return texts
@@ -0,0 +1,95 @@
+import queue
+import threading
+
+class ExportPipeline:
+    """
+    Producer/consumer pipeline of an export.
+    The calling thread (the Houdini main thread) produces one payload per item, ex. a scene snapshot per network,
+    into a bounded queue. Worker threads process the payloads (graph decomposition, rendering), and a writer
+    thread consumes the results in item order, so the written files are the same as with a serial run.
+    """
+    _STOP = object()
+
+    def __init__(self, produce, process, consume, workers=2, queueDepth=2):
+        self.produce = produce # produce(item) -> payload, runs on the calling thread
+        self.process = process # process(item, payload) -> result, runs on a worker thread
+        self.consume = consume # consume(item, result), runs on the writer thread in item order
+        self.workers = max(1, int(workers))
+        self.queueDepth = max(1, int(queueDepth))
+        self.errors = []
+
+    def run(self, items):
+        """
+        Runs the pipeline on items, returns the results in item order.
+        The first error raised by any stage is raised again once all threads stopped.
+        """
+        items = list(items)
+        work = queue.Queue(maxsize=self.queueDepth)
+        results = {} # item index -> result
+        done = threading.Condition()
+        failed = threading.Event()
+
+        def worker():
+            while True:
+                entry = work.get()
+                if entry is ExportPipeline._STOP:
+                    return
+                index, item, payload = entry
+                try:
+                    result = self.process(item, payload) if not failed.is_set() else None
+                except Exception as error:
+                    self.fail(error, failed)
+                    result = None
+                with done:
+                    results[index] = result
+                    done.notify_all()
+
+        def writer():
+            for index, item in enumerate(items):
+                with done:
+                    while index not in results:
+                        done.wait()
+                    result = results[index]
+                if failed.is_set():
+                    continue
+                try:
+                    self.consume(item, result)
+                except Exception as error:
+                    self.fail(error, failed)
+
+        threads = [threading.Thread(target=worker, name=f"ExportPipeline.worker{i}", daemon=True)
+                   for i in range(self.workers)]
+        threads.append(threading.Thread(target=writer, name="ExportPipeline.writer", daemon=True))
+        for thread in threads:
+            thread.start()
+        produced = 0
+        try:
+            for index, item in enumerate(items):
+                payload = None
+                if not failed.is_set():
+                    try:
+                        payload = self.produce(item)
+                    except Exception as error:
+                        self.fail(error, failed)
+                # blocks while the workers are behind by queueDepth payloads
+                work.put((index, item, payload))
+                produced += 1
+        finally:
+            if produced < len(items):
+                # interrupted, release the writer waiting for the missing items
+                failed.set()
+                with done:
+                    for index in range(produced, len(items)):
+                        results.setdefault(index, None)
+                    done.notify_all()
+            for _ in range(self.workers):
+                work.put(ExportPipeline._STOP)
+            for thread in threads:
+                thread.join()
+        if self.errors:
+            raise self.errors[0]
+        return [results[index] for index in range(len(items))]
+
+    def fail(self, error, failed):
+        self.errors.append(error)
+        failed.set()
@@ -0,0 +1,126 @@
+import contextlib
+import datetime
+import json
+import threading
+import time
+
+class ExportProfiler:
+    """
+    Wall and CPU time, and counters, of the stages of an export (snapshot, graph building, rendering, file I/O...).
+    A stage adds up over all its calls, on any thread. The CPU time is the one of the thread running the stage.
+    Stages can nest: "wall" includes the nested stages, "self" excludes them.
+    The running profiler is process wide (see start), the module functions stage/count do nothing without one.
+    """
+    _active = None
+
+    def __init__(self, name=""):
+        self.name = name
+        self.lock = threading.Lock()
+        self.stages = {} # stage name -> record, in first call order
+        self.local = threading.local() # per thread stack of the running stages
+        self.startedAt = datetime.datetime.now()
+        self.startWall = time.perf_counter()
+        self.startCpu = time.process_time()
+        self.wall = None
+        self.cpu = None
+
+    @staticmethod
+    def start(name=""):
+        ExportProfiler._active = ExportProfiler(name)
+        return ExportProfiler._active
+
+    @staticmethod
+    def current():
+        return ExportProfiler._active
+
+    def stop(self):
+        self.wall = time.perf_counter() - self.startWall
+        self.cpu = time.process_time() - self.startCpu
+        if ExportProfiler._active is self:
+            ExportProfiler._active = None
+        return self
+
+    def get_record(self, name):
+        record = self.stages.get(name)
+        if record is None:
+            with self.lock:
+                record = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "self": 0.0, "cpu": 0.0, "counters": {}})
+        return record
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        frame = [0.0] # wall time of the nested stages
+        stack.append(frame)
+        startWall = time.perf_counter()
+        startCpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - startWall
+            cpu = time.thread_time() - startCpu
+            stack.pop()
+            if stack:
+                stack[-1][0] += wall
+            record = self.get_record(name)
+            with self.lock:
+                record["calls"] += 1
+                record["wall"] += wall
+                record["self"] += wall - frame[0]
+                record["cpu"] += cpu
+
+    def count(self, stage_name, counter, n=1):
+        counters = self.get_record(stage_name)["counters"]
+        with self.lock:
+            counters[counter] = counters.get(counter, 0) + n
+
+    def report(self):
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.startWall
+        cpu = self.cpu if self.cpu is not None else time.process_time() - self.startCpu
+        with self.lock:
+            stages = {name: {"calls": record["calls"],
+                             "wall_s": round(record["wall"], 6),
+                             "self_s": round(record["self"], 6),
+                             "cpu_s": round(record["cpu"], 6),
+                             "counters": dict(record["counters"])}
+                      for name, record in self.stages.items()}
+        return {
+            "export": self.name,
+            "started": self.startedAt.isoformat(timespec="seconds"),
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "stages": stages
+        }
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=4)
+
+    def summary(self):
+        """
+        Returns the report as a text table, one line per stage.
+        """
+        report = self.report()
+        lines = [f"{'stage':<28}{'calls':>8}{'wall ms':>12}{'self ms':>12}{'cpu ms':>12}  counters"]
+        for name, stage in report["stages"].items():
+            counters = ", ".join(f"{key}={value}" for key, value in stage["counters"].items())
+            lines.append(f"{name:<28}{stage['calls']:>8}{stage['wall_s'] * 1000:>12.1f}{stage['self_s'] * 1000:>12.1f}"
+                         f"{stage['cpu_s'] * 1000:>12.1f}  {counters}")
+        lines.append(f"{'export':<28}{'':>8}{report['wall_s'] * 1000:>12.1f}{'':>12}{report['cpu_s'] * 1000:>12.1f}")
+        return "\n".join(lines)
+
+_NO_STAGE = contextlib.nullcontext()
+
+def stage(name):
+    """
+    Times the enclosed block as a stage of the running export, if it is profiled.
+    """
+    profiler = ExportProfiler._active
+    return profiler.stage(name) if profiler is not None else _NO_STAGE
+
+def count(stage_name, counter, n=1):
+    profiler = ExportProfiler._active
+    if profiler is not None:
+        profiler.count(stage_name, counter, n)
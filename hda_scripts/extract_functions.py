@@ -1,9 +1,70 @@
 import hou
+import os
 import json
 import re
+import hashlib
+import concurrent.futures
 import hda_manager as hdaSettings
+import houdini_node_manager as hnm
 import keyword
 
+class NodeTypeCatalog:
+    """
+    On disk cache of the extracted node types, one file per category in the Houdini user preferences folder.
+    The extraction only depends on the Houdini build and the installed HDAs: a category is reused as is while the
+    Houdini version and the loaded HDA libraries are unchanged, otherwise only the node types whose definition
+    changed are extracted again (see ParmTemplateCache.type_key).
+    """
+    VERSION = 1
+
+    def __init__(self, folder=None):
+        self.folder = folder if folder else os.path.join(hou.homeHoudiniDirectory(), "houdini2chat", "catalog")
+        self.houdiniVersion = hou.applicationVersionString()
+        self.libraries = NodeTypeCatalog.libraries_fingerprint()
+        self.stats = {"reused_types": 0, "extracted_types": 0, "fetched_help": 0}
+
+    @staticmethod
+    def libraries_fingerprint():
+        fingerprint = hashlib.sha1()
+        for path in sorted(hou.hda.loadedFiles()):
+            try:
+                stat = os.stat(path)
+                fingerprint.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+            except OSError:
+                # definitions embedded in the hip file
+                for definition in hou.hda.definitionsInFile(path):
+                    fingerprint.update(f"{path}|{definition.nodeTypeName()}|{definition.modificationTime()}\n".encode("utf-8"))
+        return fingerprint.hexdigest()
+
+    @staticmethod
+    def type_fingerprint(node_type):
+        return str(hnm.ParmTemplateCache.type_key(node_type)[1])
+
+    def filename(self, category):
+        return os.path.join(self.folder, f"{category.lower()}.json")
+
+    def load(self, category):
+        """
+        Returns the cached node types of a category (type name -> entry), and True if they are all still valid.
+        """
+        try:
+            with open(self.filename(category), "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}, False
+        if cache.get("version") != NodeTypeCatalog.VERSION or cache.get("houdini") != self.houdiniVersion:
+            return {}, False
+        return cache["types"], cache.get("libraries") == self.libraries
+
+    def save(self, category, types):
+        os.makedirs(self.folder, exist_ok=True)
+        filename = self.filename(category)
+        tempFilename = f"{filename}.{os.getpid()}.partial"
+        with open(tempFilename, "w", encoding="utf-8") as f:
+            json.dump({"version": NodeTypeCatalog.VERSION, "houdini": self.houdiniVersion, "libraries": self.libraries,
+                       "types": types}, f, separators=(",", ":"))
+        os.replace(tempFilename, filename)
+
 class ExtractFunctions:
     # Static exclusion list for parameter types (only the type string, e.g. "parmTemplateType.type")
     EXCLUDED_PARAM_TYPES = ["FolderSet", "Button", "Folder", "Separator", "Label", "Data" ]    
@@ -17,9 +78,13 @@ class ExtractFunctions:
         "Menu": "enum",
         # Add more mappings as needed
     }    
+
+    # Optional parm template methods, read only when the template class has them (see get_template_methods)
+    OPTIONAL_TEMPLATE_METHODS = ["defaultValue", "help", "numComponents", "namingScheme", "isHidden"]
+    _templateMethods = {} # parm template class -> set of the optional methods it has
     
     def __init__(self):
-        self.hdaSettings = hdaSettings.HDAManager()
+        self.hdaSettings = hdaSettings.HDAManager.current()
         pass
 
     @staticmethod
@@ -40,52 +105,115 @@ class ExtractFunctions:
         return sanitized
 
     def extract_all_node_types(self):
-        # Loop through all available categories from Houdini
-        for category in hou.nodeTypeCategories().keys():
-            self.extractNodeTypes(category)
+        """
+        Extracts the node types of all categories. Node types come from the catalog cache when unchanged,
+        the files are written by worker threads while the next categories are extracted.
+        """
+        catalog = NodeTypeCatalog()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.hdaSettings.catalogWorkers),
+                                                   thread_name_prefix="NodeTypeCatalog") as executor:
+            saves = []
+            # Loop through all available categories from Houdini
+            for category in hou.nodeTypeCategories().keys():
+                data, types = self.collectNodeTypes(category, catalog)
+                saves.append(executor.submit(self.saveNodeTypes, category, data, catalog, types))
+            for save in saves:
+                save.result()
+        self.hdaSettings.consoleLogInfo(f"===== ExtractFunctions.extract_all_node_types: {catalog.stats}")
 
     def extractNodeTypes(self, category="Sop"):
-        node_category = hou.nodeTypeCategories()[category]
+        catalog = NodeTypeCatalog()
+        data, types = self.collectNodeTypes(category, catalog)
+        self.saveNodeTypes(category, data, catalog, types)
+        self.hdaSettings.consoleLogDebug(f"===== ExtractFunctions.extractNodeTypes {category}: {catalog.stats}")
+        return data
+
+    def collectNodeTypes(self, category, catalog):
+        """
+        Returns the node types data of a category, and the catalog entries to save (type name -> entry).
+        Parms are extracted first for the changed node types only, the embedded help in a second pass
+        for the entries that don't have it yet.
+        """
+        node_types = hou.nodeTypeCategories()[category].nodeTypes()
+        cached, allValid = catalog.load(category)
+        types = {}
+        for name, node_type in node_types.items():
+            entry = cached.get(name)
+            fingerprint = None
+            if entry is not None and not allValid:
+                fingerprint = NodeTypeCatalog.type_fingerprint(node_type)
+                if entry["fingerprint"] != fingerprint:
+                    entry = None
+            if entry is None:
+                entry = {"fingerprint": fingerprint or NodeTypeCatalog.type_fingerprint(node_type),
+                         "info": self.extractNodeType(node_type),
+                         "help": None}
+                catalog.stats["extracted_types"] += 1
+            else:
+                catalog.stats["reused_types"] += 1
+            types[name] = entry
+
+        if self.hdaSettings.catalogHelp:
+            for name, entry in types.items():
+                if entry["help"] is None:
+                    entry["help"] = node_types[name].embeddedHelp()
+                    catalog.stats["fetched_help"] += 1
+
         data = {}
+        for name, entry in types.items():
+            info = entry["info"]
+            data[info["name"]] = {"name": info["name"], "description": info["description"], "help": entry["help"],
+                                  "parameters": info["parameters"]}
+        return data, types
+
+    @staticmethod
+    def get_template_methods(parm_template):
+        methods = ExtractFunctions._templateMethods.get(type(parm_template))
+        if methods is None:
+            methods = {name for name in ExtractFunctions.OPTIONAL_TEMPLATE_METHODS if callable(getattr(parm_template, name, None))}
+            ExtractFunctions._templateMethods[type(parm_template)] = methods
+        return methods
+
+    def extractNodeType(self, node_type):
+        node_info = {
+            "name": node_type.name(),
+            "description": node_type.description(),
+            "parameters": []
+        }
+        for parm_template in node_type.parmTemplates():
+            # Determine parameter type
+            param_type = str(parm_template.type()).split('.')[-1]  # Strip the first part of the type value
+            # Skip parameters whose types are in the exclusion list
+            if param_type in ExtractFunctions.EXCLUDED_PARAM_TYPES:
+                continue
 
-        for node_type in node_category.nodeTypes().values():
-            help_text = node_type.embeddedHelp()            
-            node_info = {
-                "name": node_type.name(),
-                "description": node_type.description(),
-                "help": help_text,
-                "parameters": []
+            # Map parameter type if it exists in the mapping list
+            param_type = ExtractFunctions.PARAM_TYPE_MAPPING.get(param_type, param_type)
+
+            methods = ExtractFunctions.get_template_methods(parm_template)
+            parm_info = {
+                "name": parm_template.name(),
+                "label": parm_template.label(),
+                "default_value": parm_template.defaultValue() if "defaultValue" in methods else "No default",
+                "help": parm_template.help() if "help" in methods else "No help available",
+                "type": param_type,
+                "numComponents": parm_template.numComponents() if "numComponents" in methods else "Unknown",
+                "namingScheme": str(parm_template.namingScheme()) if "namingScheme" in methods else "Unknown",
+                "isHidden": parm_template.isHidden() if "isHidden" in methods else False,
             }
-            for parm_template in node_type.parmTemplates():
-                # Determine parameter type
-                param_type = (str(parm_template.type()) if hasattr(parm_template, "type") and callable(parm_template.type)
-                              else "Unknown")
-                param_type = param_type.split('.')[-1]  # Strip the first part of the type value
-                # Skip parameters whose types are in the exclusion list
-                if param_type in ExtractFunctions.EXCLUDED_PARAM_TYPES:
-                    continue
-                
-                # Map parameter type if it exists in the mapping list
-                param_type = ExtractFunctions.PARAM_TYPE_MAPPING.get(param_type, param_type)                
-                                
-                parm_info = {
-                    "name": parm_template.name(),
-                    "label": parm_template.label(),
-                    "default_value": parm_template.defaultValue() if hasattr(parm_template, "defaultValue") and callable(parm_template.defaultValue) else "No default",
-                    "help": parm_template.help() if hasattr(parm_template, "help") and callable(parm_template.help) else "No help available",
-                    "type": param_type,
-                    "numComponents": parm_template.numComponents() if hasattr(parm_template, "numComponents") and callable(parm_template.numComponents) else "Unknown",
-                    "namingScheme": str(parm_template.namingScheme()) if hasattr(parm_template, "namingScheme") and callable(parm_template.namingScheme) else "Unknown",
-                    "isHidden": parm_template.isHidden() if hasattr(parm_template, "isHidden") and callable(parm_template.isHidden) else False,
-                }
-                node_info["parameters"].append(parm_info)
-            data[node_type.name()] = node_info
+            node_info["parameters"].append(parm_info)
+        return node_info
 
+    def saveNodeTypes(self, category, data, catalog, types):
+        """
+        Writes the extraction file of a category and its catalog cache. Runs on the catalog worker threads.
+        """
+        catalog.save(category, types)
         file_name = f"{category.lower()}_nodes_info.json"
+        os.makedirs(self.hdaSettings.projectLocation + "/extraction", exist_ok=True)
         with open(self.hdaSettings.projectLocation + f"/extraction/{file_name}", "w", encoding="utf-8") as f:
             json.dump(data, f, indent=4)
-        return data
-            
+
     def export_node_types_as_functions(self, data, filepath):
         """
         Exports the node types data as Python function definitions.
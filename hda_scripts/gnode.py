@@ -1,109 +1,170 @@
-import hou
-import houdini_node_manager as hnm
+import sys
+from array import array
 import hda_manager as hdam
 
-class GNode:
-    # class variables are static and shared among all instances
-    
-    # there can be only one constructor in python
-    def __init__(self, path):
+class NodeTable:
+    """
+    Compact store of the nodes of a SceneSnapshot, shared by all the GNodes built from it.
+    Node paths are interned to integer ids, and the node data is kept in columns indexed by id.
+    Inputs and outputs may point at nodes outside the network, their ids have no record (type is None).
+    """
+    NO_NODE = -1 # id of a disconnected input/output
+
+    def __init__(self):
+        self.ids = {} # node path -> id
+        self.paths = []
+        self.types = []
+        self.names = []
+        self.comments = []
+        self.positions = array("d") # x, y pairs
+        self.inputs = [] # tuples of ids
+        self.outputs = []
+        self.block_paths = []
+        self.props = []
+
+    def __len__(self):
+        return len(self.paths)
+
+    def intern(self, path):
+        if path is None:
+            return NodeTable.NO_NODE
+        node_id = self.ids.get(path)
+        if node_id is None:
+            node_id = len(self.paths)
+            self.ids[path] = node_id
+            self.paths.append(sys.intern(path))
+            self.types.append(None)
+            self.names.append(path.split("/")[-1])
+            self.comments.append("")
+            self.positions.extend((0.0, 0.0))
+            self.inputs.append(())
+            self.outputs.append(())
+            self.block_paths.append(None)
+            self.props.append({})
+        return node_id
+
+    def add_record(self, record):
         """
-            Initialize a GNode object with the given path and populate its attributes from the corresponding Houdini node.
+        Adds a node record of a SceneSnapshot (see scene_snapshot.SceneSnapshot.capture_node), returns its id.
         """
-        node = hou.node(path)
-        self._path = path
-        self._type = node.type().name()
-        self._name = node.name()
-        self._comment = node.comment()
-        self._inputs = [inp.path() if inp is not None else None for inp in node.inputs()]
-        self._outputs = [out.path() if out is not None else None for out in node.outputs()]
-        self._position = node.position()
+        node_id = self.intern(record["path"])
+        self.types[node_id] = sys.intern(record["type"])
+        self.names[node_id] = record["name"]
+        self.comments[node_id] = record["comment"]
+        self.positions[2 * node_id] = record["position"][0]
+        self.positions[2 * node_id + 1] = record["position"][1]
+        self.inputs[node_id] = tuple(self.intern(inp) for inp in record["inputs"])
+        self.outputs[node_id] = tuple(self.intern(out) for out in record["outputs"])
+        self.block_paths[node_id] = record.get("block_path")
+        self.props[node_id] = record.get("properties", {})
+        return node_id
+
+    @staticmethod
+    def fromSnapshot(snapshot):
+        table = NodeTable()
+        for record in snapshot.nodes.values():
+            table.add_record(record)
+        return table
+
+    def get_id(self, path):
+        return self.ids.get(path)
+
+    def to_paths(self, node_ids):
+        return [self.paths[node_id] if node_id != NodeTable.NO_NODE else None for node_id in node_ids]
+
+class GNode:
+    """
+    A node of a NodeGraph: a view on a NodeTable row, plus the graph state (loop, note, position).
+    A reference node is an alias of the original node (same id), with its own key in the graph.
+    """
+    __slots__ = ("_table", "_id", "_ref_index", "_in_loop", "_loop_id", "_note", "_position")
+
+    def __init__(self, table, node_id, ref_index=0):
+        self._table = table
+        self._id = node_id
+        self._ref_index = ref_index # 0 for the original node, n for its n-th reference
         self._in_loop = False  # Indicate whether this node is inside a loop
-        self._reference = None
         self._loop_id = None  # Store the loop's block_end node_path, initialized empty
         self._note = None
-        self._props = {}
-    
-    # def __init__(self, path, type="", name="", comment="", inputs=[], outputs=[], position=[0,0], reference="",
-    #             in_loop=False, loop_id="", note=None):
-    #     """
-    #         Initialize a GNode object with the given parameters.
-    #     """
-    #     self._path = path
-    #     self._type = type
-    #     self._name = name if name else path.split("/")[-1]  # Use the last segment of the path as the name
-    #     self._comment = comment
-    #     self._inputs = inputs
-    #     self._outputs = outputs
-    #     self._position = position  # Record the position of the node
-    #     self._in_loop = in_loop  # Indicate whether this node is inside a loop
-    #     self._reference = reference
-    #     self._loop_id = loop_id  # Store the loop's block_end node_path, initialized empty
-    #     self._note = note
-            
-    def update(self, path=None, type=None, name=None, comment=None, inputs=None, outputs=None, position=None, reference = None,
-                in_loop=None, loop_id=None, note=None):
+        self._position = None # set when the node is moved, otherwise read from the table
+
+    def update(self, position=None, in_loop=None, loop_id=None, note=None):
         """
-            Update the attributes of the GNode object with the given parameters.
+            Update the graph state of the GNode object with the given parameters.
         """
-        self._path = path if path else self._path
-        self._type = type if type else self._type
-        self._name = name if name else self._name
-        self._comment = comment if comment else self._comment
-        self._inputs = inputs if inputs else self._inputs
-        self._outputs = outputs if outputs else self._outputs
         self._position = position if position else self._position
         self._in_loop = in_loop if in_loop else self._in_loop
-        self._reference = reference if reference else self._reference
         self._loop_id = loop_id if loop_id else self._loop_id
         self._note = note if note else self._note
 
+    def getId(self):
+        return self._id
+
     def getInputs(self):
-        return self._inputs
+        return self._table.to_paths(self._table.inputs[self._id])
 
     def getOutputs(self):
-        return self._outputs
-    
+        return self._table.to_paths(self._table.outputs[self._id])
+
     def getPath(self):
-        return self._path
+        # key of the node in its graph, references get a unique key
+        if self._ref_index:
+            return f"{self._table.paths[self._id]}@{self._ref_index}"
+        return self._table.paths[self._id]
+
+    def getOriginalPath(self):
+        return self._table.paths[self._id]
+
+    def getName(self):
+        return self._table.names[self._id]
 
-    def getName(self):      
-        return self._name
-    
     def getType(self):
-        return self._type
+        return self._table.types[self._id]
+
+    def getComment(self):
+        return self._table.comments[self._id]
 
     def getPosition(self):
-        return self._position
-    
+        if self._position is not None:
+            return self._position
+        return [self._table.positions[2 * self._id], self._table.positions[2 * self._id + 1]]
+
     def inLoop(self):
         return self._in_loop
-    
+
     def getLoopId(self):
         return self._loop_id
-    
+
     def getNote(self):
         return self._note
 
+    def getBlockPath(self):
+        return self._table.block_paths[self._id]
+
+    def isReference(self):
+        return self._ref_index != 0
+
+    def getReference(self):
+        # path of the original node, for reference nodes
+        return self._table.paths[self._id] if self._ref_index else None
+
     def toDict(self):
         # convert GNode to a dict
         return {
-            "name": self._name,
-            "type": self._type,
-            "path": self._path,
-            "comment": self._comment,
-            "inputs": self._inputs,
-            "outputs": self._outputs,
-            "position": self._position,
+            "name": self.getName(),
+            "type": self.getType(),
+            "path": self.getPath(),
+            "comment": self.getComment(),
+            "inputs": self.getInputs(),
+            "outputs": self.getOutputs(),
+            "position": self.getPosition(),
             "in_loop": self._in_loop,
             "loop_id": self._loop_id,
             "note": self._note,
-            "props": self._props
+            "reference": self.getReference(),
+            "props": self.getHProps()
         }
 
-    def getNote(self):
-        return self._note
-    
     def inputsToString(self):
         # if graph node has more than one input, add an inputs property with node names
         inputs = [inp for inp in self.getInputs() if inp and isinstance(inp, str)]
@@ -114,25 +175,34 @@ class GNode:
         return inputs_str
 
     def getHProps(self):
-        # get Houdini properties of the node
-        # TODO: refactor the use of @ in nodepath, this will avoid many bugs
-        nodePath = self.getPath().split('@')[0]
-        props = hnm.HoudiniNodeManager.extract_node_properties(nodePath)
-        self._props = props
-        return props
-    
+        # Houdini properties of the node, captured in the scene snapshot
+        return self._table.props[self._id]
+
     def getRenderData(self):
-        dict = self.toDict()        
-        dict["type"] = hdam.HDAManager().sanitize_string(dict["type"])
+        dict = self.toDict()
+        dict["type"] = hdam.HDAManager.sanitize_string(dict["type"])
 
-        dict["properties"] = self.getHProps()
+        # copy the properties, rendering adds fields to them and the snapshot must stay untouched
+        dict["properties"] = {key: prop.copy() for key, prop in self.getHProps().items()}
         inputs_str = self.inputsToString()
         dict["inputs"] = inputs_str if inputs_str else None
         return dict
 
     def copy(self):
         """
-        Returns a deep copy of the current GNode instance.
+        Returns a copy of the graph state, the node data stays shared in the table.
+        """
+        gNode = GNode(self._table, self._id, self._ref_index)
+        gNode._in_loop = self._in_loop
+        gNode._loop_id = self._loop_id
+        gNode._note = self._note
+        gNode._position = self._position
+        return gNode
+
+    def alias(self, ref_index):
+        """
+        Returns a reference node pointing at this node.
         """
-        import copy
-        return copy.deepcopy(self)
\ No newline at end of file
+        gNode = self.copy()
+        gNode._ref_index = ref_index
+        return gNode
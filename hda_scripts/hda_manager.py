@@ -2,6 +2,7 @@ import hou
 import os
 import keyword
 import re
+import contextlib
 
 # Define a list of constants to be used as types for console logging
 class TYPES:
@@ -11,65 +12,129 @@ class TYPES:
     DEBUG = "DEBUG"
     DEEP = "DEEP"
 
+# Settings snapshot of the export currently running, see HDAManager.current()
+_activeSettings = None
+
 class HDAManager:
-    def __init__(self):
+    """
+    Immutable snapshot of the HDA settings.
+    Build it once per export (see main.main) and activate it with settingsScope(),
+    every other module reads it through HDAManager.current() instead of re-evaluating the parms.
+    """
+    # counters, reset at the start of each run with resetCounters()
+    settingsEvaluations = 0 # number of snapshots built
+    parmEvaluations = 0 # number of parms evaluated by all snapshots
+
+    def __init__(self, hdaNode=None):
+        HDAManager.settingsEvaluations += 1
         # hdaNode = hou.pwd().parent()
-        hdaNode = hou.pwd()
+        hdaNode = hdaNode if hdaNode else hou.pwd()
         self.hdaNode = hdaNode        
         
         # Network Box Settings
-        self.groupByNetworkBoxL1 = hdaNode.evalParm("group_by_network_box_l1")
-        self.includeNodesOutsideNetworkBox = hdaNode.evalParm("include_nodes_outside_boxes") 
+        self.groupByNetworkBoxL1 = self.evalParm("group_by_network_box_l1")
+        self.includeNodesOutsideNetworkBox = self.evalParm("include_nodes_outside_boxes") 
 
         # Sticky Note Settings
-        self.linkStickyNotesToBoxes = hdaNode.evalParm("link_sticky_notes_to_boxes")
-        self.linkLeftStickyNotes = hdaNode.evalParm("link_left_sticky_notes")
-        self.linkRightStickyNotes = hdaNode.evalParm("link_right_sticky_notes")
-        self.linkTopStickyNotes = hdaNode.evalParm("link_top_sticky_notes")
-        self.stickyNotesDistanceThreshold = hdaNode.evalParm("sticky_notes_distance")
+        self.linkStickyNotesToBoxes = self.evalParm("link_sticky_notes_to_boxes")
+        self.linkLeftStickyNotes = self.evalParm("link_left_sticky_notes")
+        self.linkRightStickyNotes = self.evalParm("link_right_sticky_notes")
+        self.linkTopStickyNotes = self.evalParm("link_top_sticky_notes")
+        self.stickyNotesDistanceThreshold = self.evalParm("sticky_notes_distance")
         
         # File Settings
-        self.projectLocation = hdaNode.evalParm("project_location")
+        self.projectLocation = self.evalParm("project_location")
 
-        self.breakByNodePath = hdaNode.evalParm("break_by_node_path")
-        self.autoNodeFolder = hdaNode.evalParm("auto_node_folder")
-        self.breakByNetworkBox = hdaNode.evalParm("break_by_network_box")
+        self.breakByNodePath = self.evalParm("break_by_node_path")
+        self.autoNodeFolder = self.evalParm("auto_node_folder")
+        self.breakByNetworkBox = self.evalParm("break_by_network_box")
 
-        self.defaultFileFormat = hdaNode.evalParm("default_filename_format")
-        self.nodeFilenameFormat = hdaNode.evalParm("node_filename_format")
-        self.netboxFilenameFormat = hdaNode.evalParm("netbox_filename_format")
+        self.defaultFileFormat = self.evalParm("default_filename_format")
+        self.nodeFilenameFormat = self.evalParm("node_filename_format")
+        self.netboxFilenameFormat = self.evalParm("netbox_filename_format")
         
         # General Filters
-        self.filterNetworkBoxes = hdaNode.evalParm("filter_network_boxes")
-        self.networkBoxFilter = hdaNode.evalParm("network_box_filter")        
-        self.includeStickyNotes = hdaNode.evalParm("include_notes")
+        self.filterNetworkBoxes = self.evalParm("filter_network_boxes")
+        self.networkBoxFilter = self.evalParm("network_box_filter")        
+        self.includeStickyNotes = self.evalParm("include_notes")
         
         # Node List
-        self.nodePathsCount = hdaNode.evalParm("nodes_to_extract")
+        self.nodePathsCount = self.evalParm("nodes_to_extract")
         self.nodePaths = []
         self.nodeFolderPaths = {}
         self.nodeErrors = []
 
         # Text Settings
-        self.header = hdaNode.evalParm("header_text")
-        self.footer = hdaNode.evalParm("footer_text")
+        self.header = self.evalParm("header_text")
+        self.footer = self.evalParm("footer_text")
         
-        self.actionSelected = hdaNode.evalParm("action_selected")
+        self.actionSelected = self.evalParm("action_selected")
 
         # Advanced Settings
-        self.exportThisNode = hdaNode.evalParm("export_this_node")
-        self.noBMI = hdaNode.evalParm("no_bmi")
+        self.exportThisNode = self.evalParm("export_this_node")
+        self.noBMI = self.evalParm("no_bmi")
+        self.leanParmExtraction = self.evalOptionalParm("lean_parm_extraction", 1)
+        self.useExportCache = self.evalOptionalParm("use_export_cache", 1)
+        self.watchDebounce = self.evalOptionalParm("watch_debounce", 1.0)
+        self.sharedFanOut = self.evalOptionalParm("shared_fan_out", 1)
+        self.pipelineWorkers = self.evalOptionalParm("pipeline_workers", 2) # 0 exports the networks one after the other
+        self.pipelineQueueDepth = self.evalOptionalParm("pipeline_queue_depth", 2)
+        self.renderProcesses = self.evalOptionalParm("render_processes", 0) # 0 renders in the Houdini process
+        self.renderChunkSize = self.evalOptionalParm("render_chunk_size", 500)
+        self.renderPython = self.evalOptionalParm("render_python", "") # interpreter of the render processes, hython by default
+        self.exportProfile = self.evalOptionalParm("export_profile", 1) # stage report of each export, see export_profiler
+        self.catalogHelp = self.evalOptionalParm("catalog_help", 1) # embedded help of the node types in the extracted catalog
+        self.catalogWorkers = self.evalOptionalParm("catalog_workers", 4) # threads saving the catalog files
         
         # Debug Settings
-        self.exportDebugFiles = hdaNode.evalParm("export_debug_files")
-        self.printDebugMessages = hdaNode.evalParm("print_debug_messages")
+        self.exportDebugFiles = self.evalParm("export_debug_files")
+        self.printDebugMessages = self.evalParm("print_debug_messages")
 
         # All functions after all attribute Init, for proper use of the attributes (ex. consoleLogDebug)
         self.getNodePaths()
         self.initFolders()
+        # no more changes after this point, settings are read-only for the rest of the run
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"HDAManager settings are read-only, cannot set '{name}'")
+        object.__setattr__(self, name, value)
+
+    def evalParm(self, parmName):
+        HDAManager.parmEvaluations += 1
+        return self.hdaNode.evalParm(parmName)
+
+    def evalOptionalParm(self, parmName, default):
+        """
+        Evaluates a parm that older versions of the HDA may not have, returning default if it is missing.
+        """
+        parm = self.hdaNode.parm(parmName)
+        if parm is None:
+            return default
+        HDAManager.parmEvaluations += 1
+        return parm.eval()
+
+    @staticmethod
+    def current():
+        """
+        Returns the settings snapshot of the running export.
+        Outside of an export (ex. called from the shell) a fresh snapshot is built.
+        """
+        if _activeSettings is not None:
+            return _activeSettings
+        return HDAManager()
+
+    @staticmethod
+    def resetCounters():
+        HDAManager.settingsEvaluations = 0
+        HDAManager.parmEvaluations = 0
+
+    def evaluationReport(self):
+        return f"settings snapshots: {HDAManager.settingsEvaluations}, parm evaluations: {HDAManager.parmEvaluations}"
 
     def initOnce(self):
-        self.cleanProjectFolder()
+        self.createProjectFolder()
         
     @staticmethod
     def sanitize_string(text):
@@ -110,44 +175,26 @@ class HDAManager:
             return
         # if multiparm, then get the paths from the multiparm
         for i in range(1, self.nodePathsCount + 1): # start from 1, coz multiparm is 1 based
-            node_path = self.hdaNode.evalParm("node_path_" + str(i))
+            node_path = self.evalParm("node_path_" + str(i))
             if not node_path.startswith("/obj/"):
                 errorMsg = f"Error: Only paths starting with '/obj/' are supported. Found: {node_path}"
                 self.nodeErrors.append(errorMsg)
             else:
                 self.nodePaths.append(node_path)
 
-    def cleanProjectFolder(self):
+    def createProjectFolder(self):
         # Create the project location folder if it does not exist
         if not os.path.exists(self.projectLocation):
             os.makedirs(self.projectLocation)
-        if not self.autoNodeFolder:
-            fileList = []
-            folderLoc = self.projectLocation
-            for file in os.listdir(folderLoc):
-                if file.endswith(".py"):
-                    fileList.append(file)
-            self.consoleLog(f"======= HDAManager.cleanProjectFolder Found {len(fileList)} .py files in the folder location.", TYPES.INFO)
-            # remove all .py files from the folder location
-            for file in fileList:
-                os.remove(os.path.join(folderLoc, file))
-        
-    def cleanFolder(self, nodePath):
-        if not self.autoNodeFolder:
-            return
-        folderLoc = self.nodeFolderPaths[nodePath]
-        fileList = []
-        if not os.path.exists(folderLoc):
-            os.makedirs(folderLoc)
-            return
-        # check if the project location has .py files
-        for file in os.listdir(folderLoc):
-            if file.endswith(".py"):
-                fileList.append(file)
-        self.consoleLog(f"======= HDAManager.cleanFolder Found {len(fileList)} .py files in the folder location.", TYPES.INFO)
-        # remove all .py files from the folder location
-        for file in fileList:
-            os.remove(os.path.join(folderLoc, file))
+
+    def getSyncFolders(self):
+        """
+        Folders owned by the export: the files of previous exports that it does not write again are deleted
+        (see output_writer.OutputWriter).
+        """
+        if self.autoNodeFolder:
+            return [self.nodeFolderPaths[nodePath] for nodePath in self.nodePaths]
+        return [self.projectLocation]
         
     def setParm(self, parmName, value):
         # TODO: need a better way to use actual variable names and map them to parmnames
@@ -173,4 +220,17 @@ class HDAManager:
         self.consoleLog(message, TYPES.DEBUG)
     
     def consoleLogDeep(self, message):
-        self.consoleLog(message, TYPES.DEEP)
\ No newline at end of file
+        self.consoleLog(message, TYPES.DEEP)
+
+@contextlib.contextmanager
+def settingsScope(settings):
+    """
+    Makes settings the active snapshot returned by HDAManager.current() for the duration of the block.
+    """
+    global _activeSettings
+    previous = _activeSettings
+    _activeSettings = settings
+    try:
+        yield settings
+    finally:
+        _activeSettings = previous
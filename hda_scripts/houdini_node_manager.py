@@ -1,15 +1,84 @@
 from platform import node
 import hou
-import fnmatch
 import hda_manager as hda
+import network_box_index as nbi
+import export_profiler as prof
+
+class ParmTemplateCache:
+    """
+    Type level facts of the parms: labels, template type, tuple layout and static menu labels.
+    Cached per node type and definition version, so per node extraction only fetches values and dirty state.
+    """
+    _types = {} # (type name with category, version) -> {parm tuple name -> tuple meta}
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def type_key(nodeType):
+        definition = nodeType.definition()
+        if definition is not None:
+            version = (definition.libraryFilePath(), definition.modificationTime())
+        else:
+            version = hou.applicationVersionString()
+        return (nodeType.nameWithCategory(), version)
+
+    @staticmethod
+    def get_type_meta(node):
+        key = ParmTemplateCache.type_key(node.type())
+        typeMeta = ParmTemplateCache._types.get(key)
+        if typeMeta is None:
+            typeMeta = {}
+            ParmTemplateCache._types[key] = typeMeta
+        return typeMeta
+
+    @staticmethod
+    def get_tuple_meta(typeMeta, parmTuple, isSpare=None):
+        name = parmTuple.name()
+        meta = typeMeta.get(name)
+        if meta is not None:
+            ParmTemplateCache.hits += 1
+            return meta
+        ParmTemplateCache.misses += 1
+        meta = ParmTemplateCache.build_tuple_meta(parmTuple)
+        # spare parms belong to the node instance, not to its type
+        if not (parmTuple.isSpare() if isSpare is None else isSpare):
+            typeMeta[name] = meta
+        return meta
+
+    @staticmethod
+    def build_tuple_meta(parmTuple):
+        parmTemplate = parmTuple.parmTemplate()
+        ptype = parmTemplate.type()
+        label = parmTuple.description()
+        components = [parm.name() for parm in parmTuple]
+        menu_labels = None
+        # menus built by a script can change per node, only static menus are cached
+        if ptype == hou.parmTemplateType.Menu and not parmTemplate.itemGeneratorScript():
+            menu_labels = parmTemplate.menuLabels()
+        return {
+            "label": label,
+            "sanitized_label": hda.HDAManager.sanitize_string(label).lower(),
+            "type": ptype,
+            "naming_scheme": parmTemplate.namingScheme(),
+            "components": components,
+            "is_tuple": components != [parmTuple.name()],
+            "menu_labels": menu_labels
+        }
+
+    @staticmethod
+    def clear():
+        ParmTemplateCache._types = {}
 
 class HoudiniNodeManager:
+    PARM_VALUE_CALLS = 4 # hou calls of get_parm_value: eval, getReferencedParm, unexpandedString, expression
+    PROBE_CALLS = 3 # hou calls of has_default_formula per component, at most: keyframes, unexpandedString, eval
+
     def __init__(self, parent_node):
         self.parent_node = parent_node
 
     @staticmethod
     def get_node_children(node_path):
-        hdaSettings = hda.HDAManager()
+        hdaSettings = hda.HDAManager.current()
         node = hou.node(node_path)
         nodeList = []
         for child in node.children():
@@ -19,7 +88,7 @@ class HoudiniNodeManager:
 
     @staticmethod
     def get_nodes_not_in_network_boxes(node_path):
-        hdaSettings = hda.HDAManager()
+        hdaSettings = hda.HDAManager.current()
         node = hou.node(node_path)
         nodeList = []
         for child in node.children():
@@ -30,7 +99,7 @@ class HoudiniNodeManager:
         
     @staticmethod
     def get_root_network_boxes(node_path):
-        hdaSettings = hda.HDAManager()        
+        hdaSettings = hda.HDAManager.current()        
         node = hou.node(node_path)
         rootNetworkBoxes = []
         for netbox in node.networkBoxes():   
@@ -39,36 +108,20 @@ class HoudiniNodeManager:
             # hdaSettings.consoleLog(f"Nodes in Network Box: {netbox.comment()} {len(netbox.nodes())}", hda.TYPES.DEBUG)
         hdaSettings.consoleLog(f"========= HoudiniNodeManager.get_root_network_boxes: Root Network Boxes: {len(rootNetworkBoxes)}", hda.TYPES.DEBUG)
         # for netbox in rootNetworkBoxes:
-        #     hda.HDAManager().consoleLog(f"Root Network Box: {netbox.comment()}", hda.TYPES.DEBUG)
+        #     hda.HDAManager.current().consoleLog(f"Root Network Box: {netbox.comment()}", hda.TYPES.DEBUG)
         return rootNetworkBoxes
 
     @staticmethod
     def filter_by_network_boxes(node_path, patterns_str, nodeList):
-        hdaSettings = hda.HDAManager()
+        hdaSettings = hda.HDAManager.current()
         hdaSettings.consoleLog(f"========= HoudiniNodeManager.filter_by_network_boxes: Patterns: {hdaSettings.networkBoxFilter}", hda.TYPES.DEBUG)
 
-        all_nodes = [] # all nodes in matching network boxes
-        matched_nodes = [] # nodes matching nodeList
-        # Split the pattern string into a list of patterns.
-        patterns = patterns_str.split()
         parent = hou.node(node_path)
         if not parent:
             return None
-        # Loop on all network boxes inside node_path
-        for netbox in parent.networkBoxes():
-            title = netbox.comment()
-            # Loop on all user provided patterns
-            for pattern in patterns:
-                if fnmatch.fnmatch(title, pattern):
-                    # when matched, capture all the node paths
-                    for node in netbox.nodes():
-                        all_nodes.append(node.path())      
-        # hdaSettings.consoleLog(f"========= HoudiniNodeManager.filter_by_network_boxes: All Nodes: {len(all_nodes)}", hda.TYPES.DEBUG)
-
-        # capture nodes matching nodeList
-        for node in nodeList:
-            if node in all_nodes:
-                matched_nodes.append(node)            
+        # boxes are walked once, patterns are compiled once and nodes are matched with a set lookup
+        boxIndex = nbi.NetworkBoxIndex(HoudiniNodeManager(parent).extract_network_boxes())
+        matched_nodes = boxIndex.filter_nodes(patterns_str, nodeList)
         hdaSettings.consoleLog(f"========= HoudiniNodeManager.filter_by_network_boxes: Matched Nodes: {len(matched_nodes)}", hda.TYPES.DEBUG)
         return matched_nodes
 
@@ -80,20 +133,20 @@ class HoudiniNodeManager:
         return nodeList
     
     @staticmethod
-    def get_parm_value(parm):
-        parmTemplate = parm.parmTemplate()
-        parm_type = parmTemplate.type() 
+    def get_parm_value(parm, meta=None):
+        # meta is the cached tuple meta of the parm (see ParmTemplateCache), looked up from hou if missing
+        parm_type = meta["type"] if meta else parm.parmTemplate().type()
         value = parm.eval()
         actual_value = value
         unexpanded = None
         reference = None
         expression = None                      
         if parm_type == hou.parmTemplateType.Menu:
-            menu_labels = parm.menuLabels()
+            menu_labels = meta["menu_labels"] if meta and meta["menu_labels"] is not None else parm.menuLabels()
             if 0 <= value < len(menu_labels):
                 actual_value = menu_labels[value]
             else:
-                hda.HDAManager().consoleLogDebug(f"========= HoudiniNodeManager.get_parm_value: {parm.path()} has an invalid menu value: {value}")                
+                hda.HDAManager.current().consoleLogDebug(f"========= HoudiniNodeManager.get_parm_value: {parm.path()} has an invalid menu value: {value}")                
         # Check if the parameter is a reference expression.
         ref_expr = parm.getReferencedParm()
         if ref_expr != parm:
@@ -114,20 +167,27 @@ class HoudiniNodeManager:
     
     @staticmethod
     def extract_node_properties(node_path):
-        node = hou.node(node_path)
+        # accepts a node path or an already resolved hou node
+        node = hou.node(node_path) if isinstance(node_path, str) else node_path
         # Check if node is valid and supports parms() method.
         if not node or not hasattr(node, "parms"):
-            hda.HDAManager().consoleLogWarning(f"========= HoudiniNodeManager.extract_node_properties: {node_path} is not a valid node or does not support parms() method.")
+            hda.HDAManager.current().consoleLogWarning(f"========= HoudiniNodeManager.extract_node_properties: {node_path} is not a valid node or does not support parms() method.")
             return {}        
         properties = {}
-        for parm in node.parms():
+        typeMeta = ParmTemplateCache.get_type_meta(node)
+        parms = node.parms()
+        # isMultiParmInstance, tuple, isAtDefault, isSpare, componentIndex, isMultiParmParent, parentMultiParm, name and value
+        prof.count("parm_extraction", "hou_calls", 1 + len(parms) * (8 + HoudiniNodeManager.PARM_VALUE_CALLS))
+        prof.count("parm_extraction", "parm_tuples", len(parms))
+        for parm in parms:
             # skip parameter if it is a multi parameter instance (maybe keep it in some cases, TODO)
             isMultiPI = parm.isMultiParmInstance()
             if isMultiPI:
                 continue            
             # check if this parm is part of a tuple
             parmTuple = parm.tuple()
-            hasParmTuple = parmTuple and parm.name() != parmTuple.name()
+            meta = ParmTemplateCache.get_tuple_meta(typeMeta, parmTuple)
+            hasParmTuple = meta["is_tuple"]
             key = ""
             label = ""
             value = ""
@@ -141,18 +201,17 @@ class HoudiniNodeManager:
             isMultiPI = parm.isMultiParmInstance()
             isMultiPP = parm.isMultiParmParent()
             multiPP = parm.parentMultiParm()
-            ptype = parm.parmTemplate().type()
-            pnaming = parm.parmTemplate().namingScheme()
+            ptype = meta["type"]
+            pnaming = meta["naming_scheme"]
             
             # if this is different from the parm name, then it is a tuple
             if hasParmTuple:
                 # use parm tuple name
                 key = parmTuple.name()
-                label = parmTuple.description()
                 value = parmTuple.eval()
                 actual_value = value
                 changed = not parmTuple.isAtDefault()
-                pValue, pActual_value, pUnexpanded, pReference, pExpression = HoudiniNodeManager.get_parm_value(parm)
+                pValue, pActual_value, pUnexpanded, pReference, pExpression = HoudiniNodeManager.get_parm_value(parm, meta)
                 # need to check if properties[key] exists, 
                 # if yes, then get these values: unexpanded, reference, and update them
                 prop = properties.get(key)
@@ -171,11 +230,10 @@ class HoudiniNodeManager:
             else:
                 # use parm name
                 key = parm.name()
-                label = parm.description()
                 # for Menu parameters, get the actual value from the menu labels
-                value, actual_value, unexpanded, reference, expression = HoudiniNodeManager.get_parm_value(parm)
+                value, actual_value, unexpanded, reference, expression = HoudiniNodeManager.get_parm_value(parm, meta)
                 
-            label = hda.HDAManager().sanitize_string(label).lower()
+            label = meta["sanitized_label"]
             # a parameter is changed if a value is not default, or has a reference or expression or stringExpr
             if reference or unexpanded or expression:
                 changed = True
@@ -200,6 +258,95 @@ class HoudiniNodeManager:
             }                        
         return properties
     
+    @staticmethod
+    def join_component_values(previous, current):
+        # parm tuple values are reported once, components are separated by commas
+        if previous and current:
+            return f"{previous}, {current}"
+        return previous if previous else current
+
+    @staticmethod
+    def has_default_formula(parmTuple, meta):
+        """
+        True if a tuple at its default value holds an expression or a reference (ex. a default channel expression),
+        or a string expanding to another value (ex. a default $HIP or $OS formula).
+        """
+        ptype = meta["type"]
+        if ptype not in (hou.parmTemplateType.Int, hou.parmTemplateType.Float, hou.parmTemplateType.String,
+                         hou.parmTemplateType.Toggle, hou.parmTemplateType.Menu):
+            return False
+        for parm in parmTuple:
+            # references are channel expressions, so they have keyframes too
+            if parm.keyframes():
+                return True
+            if ptype == hou.parmTemplateType.String:
+                try:
+                    if parm.unexpandedString() != parm.eval():
+                        return True
+                except hou.OperationFailed:
+                    return True
+        return False
+
+    @staticmethod
+    def extract_changed_properties(node):
+        """
+        Lean version of extract_node_properties, working per parm tuple.
+        The cheap default/spare check runs first, then a keyframe/unexpanded probe for the tuples at default
+        (see has_default_formula). Expression, reference and unexpanded lookups are only done for the tuples
+        that will be rendered, the emitted tuples are the changed ones of extract_node_properties.
+        """
+        properties = {}
+        typeMeta = ParmTemplateCache.get_type_meta(node)
+        parmTuples = node.parmTuples()
+        houCalls = 1
+        for parmTuple in parmTuples:
+            parm = parmTuple[0]
+            houCalls += 3 # isMultiParmInstance, isAtDefault, isSpare
+            # skip parameter if it is a multi parameter instance
+            if parm.isMultiParmInstance():
+                continue
+            # expressions are compared as strings, so an expression evaluating to the default value is still a change
+            changed = not parmTuple.isAtDefault(compare_temporary_defaults=True, compare_expressions=True)
+            userCreated = parmTuple.isSpare()
+            meta = ParmTemplateCache.get_tuple_meta(typeMeta, parmTuple, userCreated)
+            if not changed and not userCreated:
+                # a default value can still be a formula, rendered as changed like extract_node_properties does
+                houCalls += HoudiniNodeManager.PROBE_CALLS * len(meta["components"])
+                if not HoudiniNodeManager.has_default_formula(parmTuple, meta):
+                    continue
+            hasParmTuple = meta["is_tuple"]
+            unexpanded = None
+            reference = None
+            expression = None
+            houCalls += 2 + HoudiniNodeManager.PARM_VALUE_CALLS * len(meta["components"]) # name, eval or value calls
+            if hasParmTuple:
+                value = parmTuple.eval()
+                actual_value = value
+                for componentParm in parmTuple:
+                    pValue, pActual_value, pUnexpanded, pReference, pExpression = HoudiniNodeManager.get_parm_value(componentParm, meta)
+                    unexpanded = HoudiniNodeManager.join_component_values(unexpanded, pUnexpanded)
+                    reference = HoudiniNodeManager.join_component_values(reference, pReference)
+                    expression = HoudiniNodeManager.join_component_values(expression, pExpression)
+            else:
+                value, actual_value, unexpanded, reference, expression = HoudiniNodeManager.get_parm_value(parm, meta)
+            if reference or unexpanded or expression:
+                changed = True
+            properties[parmTuple.name()] = {
+                "label": meta["sanitized_label"],
+                "value": value,
+                "actual_value": actual_value,
+                "changed": changed,
+                "user_created": userCreated,
+                "reference": reference,
+                "unexpanded": unexpanded,
+                "expression": expression,
+                "isTuple": hasParmTuple,
+                "type": meta["type"]
+            }
+        prof.count("parm_extraction", "hou_calls", houCalls)
+        prof.count("parm_extraction", "parm_tuples", len(parmTuples))
+        return properties
+
     @staticmethod
     def extract_node_info(node_path):
         node = hou.node(node_path)
@@ -215,7 +362,10 @@ class HoudiniNodeManager:
     def extract_network_boxes(self):
         network_boxes_info = []
         for netbox in self.parent_node.iterNetworkBoxes():
+            parentBox = netbox.parentNetworkBox()
             network_boxes_info.append({
+                "name": netbox.name(),
+                "parent_box": parentBox.name() if parentBox is not None else None,
                 "comment": netbox.comment(),
                 "position": list(netbox.position()),
                 "size": list(netbox.size()),
@@ -251,4 +401,32 @@ class HoudiniNodeManager:
             "text": note.text(),
             "position": list(note.position()),
             "size": list(note.size())
-        }                
\ No newline at end of file
+        }                
+
+def serialize_value(val):
+    if isinstance(val, hou.Ramp):
+        try:
+            interp = val.interpolation()
+        except AttributeError:
+            interp = None
+        points = []
+        try:
+            num_points = val.numPoints()
+            for i in range(num_points):
+                pt = val.point(i)
+                points.append({
+                    "position": pt.position(),
+                    "value": pt.value(),
+                    "tangentIn": pt.tangentIn(),
+                    "tangentOut": pt.tangentOut()
+                })
+        except AttributeError:
+            points = str(val)
+        return {"interpolation": interp, "points": points}
+    elif isinstance(val, (hou.Vector2, hou.Vector3, hou.Vector4)):
+        return list(val)
+    elif isinstance(val, tuple):
+        return list(val)
+    elif isinstance(val, (int, float, str, bool)) or val is None:
+        return val
+    return str(val)
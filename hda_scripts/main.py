@@ -1,5 +1,10 @@
 # External Libraries
 import datetime
+import itertools
+import os
+import shutil
+import sys
+import traceback
 
 # Internal Libraries
 import houdini_node_manager as hnm
@@ -7,42 +12,95 @@ import node_graph as ng
 import render_manager as rm
 import hda_manager as hdam
 import extract_functions as xf
+import scene_snapshot as ss
+import export_cache as ec
+import watch_manager as wm
+import export_pipeline as ep
+import render_pool as rp
+import export_profiler as prof
+import debug_writer as dw
+import output_writer as ow
 
 hda = None
+exportCache = None # incremental export cache of the running export, None when disabled
+renderPool = None # render_pool.RenderPool of the running export, None when rendering in process
+networkOutputs = None # node path -> recorded output of the network (see recordNetwork), None when not recording
 
 # ========================================
 # ========= RENDERING OUTPUT =============
 # ========================================
    
-def renderNetworkUnit(graph):
-    props = {
-        "networkName": graph.name
+def getUnitPayload(graph):
+    """
+    Plain render data of a graph unit, picklable so it can be rendered by a render_pool worker process.
+    """
+    prof.count("render", "nodes", len(graph.gNodes))
+    if graph.is_loop_graph:
+        kind, props = "loop", graph.getLoopRenderData()
+    else:
+        kind, props = "network", {
+            "networkName": graph.name,
+            "notes": graph.notes
+        }
+    return {
+        "kind": kind,
+        "props": props,
+        "branches": graph.getBranchRenderData(),
+        "cycles": graph.getCycleRenderData(),
+        "nodes": graph.getNodesRenderData(isLoop=graph.is_loop_graph)
     }
-    branchRenderData = graph.getBranchRenderData()
-    nodeRenderData = graph.getNodesRenderData(isLoop=False)        
-    renderMan = rm.RenderManager() 
-    rendered_nodes_text = renderMan.render_nodes(nodeRenderData)
-    # Load the network unit template.
-    template = renderMan.load_template("network_unit.py.j2")    
-    # Render the full unit, now passing rendered_nodes as a variable.
-    rendered_text = template.render(props=props, branches=branchRenderData, rendered_nodes=rendered_nodes_text)
-    return rendered_text
-
-def renderLoopUnit(graph):
-    # get node data
-    nodesRenderData = graph.getNodesRenderData(isLoop=True) # get all nodes data
-    loopRenderData = graph.getLoopRenderData() # get loop data    
-    branchRenderData = graph.getBranchRenderData()
-                    
-    renderMan = rm.RenderManager()
-    rendered_nodes_text = renderMan.render_nodes(nodesRenderData)
-    template = renderMan.load_template("loop_unit.py.j2")
-    rendered_text = template.render(props=loopRenderData, branches=branchRenderData, 
-                                    rendered_nodes=rendered_nodes_text)                
-    return rendered_text
+
+def renderGraphUnit(graph):
+    return rm.RenderManager.get_unit_renderer().render_unit(getUnitPayload(graph))
+
+def renderGraphUnits(graphList):
+    # renders the units in the render pool when there is one, in process otherwise
+    if renderPool is None:
+        return [renderGraphUnit(graph) for graph in graphList]
+    payloads = [getUnitPayload(graph) for graph in graphList]
+    if hda.exportDebugFiles and graphList:
+        payloadsFilename = os.path.join(hda.getSavePath(graphList[0].parent_path),
+                                        hda.sanitize_string(graphList[0].name) + "-payloads.pkl")
+        rp.save_payloads(payloadsFilename, rm.TemplateCache.get_sources(), payloads)
+    return renderPool.render_units(payloads)
+
+def renderUnits(graphList):
+    """
+    Yields the rendered units of graphList in order. In process they are rendered one at a time as the
+    output consumes them, the render pool renders the units of graphList together.
+    """
+    extra = rm.TemplateCache.get_signature()
+    if renderPool is not None:
+        with prof.stage("render"):
+            if exportCache is None:
+                texts = renderGraphUnits(graphList)
+            else:
+                texts = exportCache.render_units(graphList, renderGraphUnits, extra=extra)
+        prof.count("render", "units", len(texts))
+        yield from texts
+        return
+    for graph in graphList:
+        with prof.stage("render"):
+            if exportCache is None:
+                text = renderGraphUnit(graph)
+            else:
+                # units that did not change since the last export are spliced back from the cache
+                text = exportCache.render_unit(graph, renderGraphUnit, extra=extra)
+        prof.count("render", "units")
+        yield text
+
+def joinChunks(separator, streams):
+    # streams of chunks joined like separator.join, without building the strings
+    for index, chunks in enumerate(streams):
+        if index:
+            yield separator
+        yield from chunks
 
 def renderNodePathNetwork(nodeName, metadata, graphList, single=False, saveToFile=True):
-    rendered_text = ""    
+    """
+    Returns the rendered network as a stream of chunks, the units are rendered as the stream is consumed.
+    With saveToFile, the chunks are also written to the file of the network.
+    """
     template_data = {
         "nodeName": nodeName,
         "header": hda.header,
@@ -50,24 +108,18 @@ def renderNodePathNetwork(nodeName, metadata, graphList, single=False, saveToFil
         "single": single
     }
     hda.consoleLog(f"========= renderNodePathNetwork for: -> {nodeName}, single= {single}", hdam.TYPES.DEBUG)
-    # loop on graphList and render each graph
-    for graph in graphList:                
-        # graph.save_network("debug", pretty=True)
-        if graph.is_loop_graph: # render loop graph
-            rendered_text += renderLoopUnit(graph)
-        else:  # render normal graph
-            rendered_text += renderNetworkUnit(graph)            
-            
     # Load the network unit template.
-    renderMan = rm.RenderManager() # pun intended!
+    renderMan = rm.RenderManager(hda) # pun intended!
     template = renderMan.load_template("network_full.py.j2")
-    network_text = template.render(props=template_data, graphs=rendered_text )
+    # render the graphs of graphList, in order
+    network_chunks = template.generate(props=template_data, graphs=renderUnits(graphList))
     if saveToFile:
         # Save the rendered output using our helper.    
-        renderMan.save_rendered_output(network_text, nodeName, metadata)
-    return network_text
+        network_chunks = renderMan.stream_rendered_output(network_chunks, nodeName, metadata)
+    return network_chunks
 
 def renderNodePathNetworkCombined(nodeName, nodeData, metadata, saveToFile=True):
+    # nodeData: stream of chunks of the networks to combine
     template_data = {
         "nodeName": nodeName,
         "header": hda.header,
@@ -78,18 +130,18 @@ def renderNodePathNetworkCombined(nodeName, nodeData, metadata, saveToFile=True)
     hda.consoleLog(f"======= renderNodePathNetworkCombined for: -> {nodeName}", hdam.TYPES.DEBUG)
             
     # Load the network Full template.
-    renderMan = rm.RenderManager() # pun intended!
+    renderMan = rm.RenderManager(hda) # pun intended!
     template = renderMan.load_template("network_full.py.j2")
-    network_text = template.render(props=template_data, graphs=nodeData )
+    network_chunks = template.generate(props=template_data, graphs=nodeData)
     if saveToFile:
-        renderMan.save_rendered_output(network_text, nodeName, metadata)
-    return network_text
+        network_chunks = renderMan.stream_rendered_output(network_chunks, nodeName, metadata)
+    return network_chunks
             
 # ========================================
 # ========= BUILDING NETWORK =============
 # ========================================
 
-def getMetadata(nodePath, netbox, type="nodePath"):
+def getMetadata(snapshot, netbox, type="nodePath"):
     metadata = {}
     if type == "nodePath":
         metadata["render.type"] = "nodePath"
@@ -98,136 +150,388 @@ def getMetadata(nodePath, netbox, type="nodePath"):
     else:
         metadata["render.type"] = "default"
 
-    if nodePath:   
-        # TODO: do we really need to get that info from Houdini?
-        nodeInfo = hnm.HoudiniNodeManager.extract_node_info(nodePath)
-        metadata["node.name"] = nodeInfo["name"]
-        metadata["node.path"] = nodePath
+    if snapshot:   
+        metadata["node.name"] = snapshot.parent_name
+        metadata["node.path"] = snapshot.parent_path
     if netbox:
-        metadata["netbox.name"] = netbox.name()
-        metadata["netbox.title"] = netbox.comment()
+        metadata["netbox.name"] = netbox["name"]
+        metadata["netbox.title"] = netbox["comment"]
     return metadata
 
-def BuildNodePathNetworkNoBoxes(nodePath):
-    networkText = None # A list of Rendered Networks
+def BuildNodePathNetworkNoBoxes(snapshot):
+    nodePath = snapshot.parent_path
     # create a graphlist ignoring network boxes
     hda.consoleLogDebug(f"======= BuildNodePathNetworkNoBoxes.plain.network: {nodePath} ")
     # Build Main Graph
-    nodeList = hnm.HoudiniNodeManager.get_node_children(nodePath)
+    nodeList = snapshot.get_children()
     # Filter by Network Boxes
     if hda.filterNetworkBoxes and hda.networkBoxFilter:
-        nodeList = hnm.HoudiniNodeManager.filter_by_network_boxes(nodePath, hda.networkBoxFilter, nodeList)
+        nodeList = snapshot.filter_by_network_boxes(hda.networkBoxFilter, nodeList)
     if not len(nodeList):
         hda.consoleLogDebug(f"======= BuildNodePathNetworkNoBoxes.ZERO nodes in: {nodePath} ")
-        return None
+        return iter(())
     hda.consoleLogDebug(f"======= BuildNodePathNetworkNoBoxes.Compose Graph for: -> {nodePath} ")
-    graph = ng.NodeGraph(nodePath, nodePath, nodeList)
+    graph = ng.NodeGraph(nodePath, nodePath, nodeList, hdaSettings=hda, snapshot=snapshot)
     graphList = graph.graphList
     saveToFile = hda.breakByNodePath # Create a file per node path
     single = True if saveToFile else False
-    metadata = getMetadata(nodePath, None, "nodePath")
-    networkText = renderNodePathNetwork(nodePath, metadata, graphList, single, saveToFile)
-    return networkText
+    metadata = getMetadata(snapshot, None, "nodePath")
+    return renderNodePathNetwork(nodePath, metadata, graphList, single, saveToFile)
+
+def BuildNodePathNetworkWithBoxes(snapshot, rootNetworkBoxes):
+    """
+    Returns the rendered stream of each network box, and of the nodes outside boxes, in order.
+    """
+    nodePath = snapshot.parent_path
+    nodeNetworks = iterNetworkBoxNetworks(snapshot, rootNetworkBoxes)
+    # Save Network Boxes and Free Nodes in one File if breakByNodePath
+    firstNetwork = next(nodeNetworks, None)
+    if firstNetwork is None:
+        return []
+    nodeNetworks = itertools.chain([firstNetwork], nodeNetworks)
+    # break by path and not break by network - # TODO: this setting is really confusing! 
+    if hda.breakByNodePath and not hda.breakByNetworkBox:
+        hda.consoleLog(f"======= BuildNodePathNetworkWithBoxes.NetBox Combined for: -> {nodePath}", hdam.TYPES.DEBUG)
+        metadata = getMetadata(snapshot, None, "nodePath")
+        # the node path file holds the networks, the all nodes file is only written without breakByNodePath
+        rm.RenderManager.drain(renderNodePathNetworkCombined(nodePath, joinChunks("", nodeNetworks), metadata, True))
+        return []
+    return nodeNetworks
 
-def BuildNodePathNetworkWithBoxes(nodePath, rootNetworkBoxes):
-    nodeNetworks = [] # A list of Rendered Networks
+def iterNetworkBoxNetworks(snapshot, rootNetworkBoxes):
+    # yields the stream of each network, each one must be consumed before the next one is built
+    nodePath = snapshot.parent_path
+    # compose the whole network once, each network box is a partition of it
+    networkGraph = ng.NodeGraph(nodePath, nodePath, hdaSettings=hda, snapshot=snapshot)
+    networkGraph.analyze(snapshot.get_children())
     # for each network box
     for netbox in rootNetworkBoxes:
         # set name and filename        
-        gName = netbox.name() + "_" + netbox.comment()
+        gName = netbox["name"] + "_" + netbox["comment"]
         # get network box children
-        nodeList = hnm.HoudiniNodeManager.get_network_box_children(netbox)
+        nodeList = snapshot.get_network_box_children(netbox)
         # Filter by Network Boxes
         if hda.filterNetworkBoxes and hda.networkBoxFilter:
-            nodeList = hnm.HoudiniNodeManager.filter_by_network_boxes(nodePath, hda.networkBoxFilter, nodeList)
+            nodeList = snapshot.filter_by_network_boxes(hda.networkBoxFilter, nodeList)
         # skip empty network boxes
         if not len(nodeList):
-            hda.consoleLogDebug(f"======= BuildNodePathNetworkWithBoxes.NetBoxLoop - ZERO nodes in: {gFileName}")
+            hda.consoleLogDebug(f"======= BuildNodePathNetworkWithBoxes.NetBoxLoop - ZERO nodes in: {gName}")
             continue
         hda.consoleLogDebug(f"======= BuildNodePathNetworkWithBoxes.NetBoxLoop processing {gName}")
-        graph = ng.NodeGraph(gName, nodePath, nodeList)
+        graph = networkGraph.partition(gName, nodeList)
         graphList = graph.graphList
-        metadata = getMetadata(nodePath, netbox, "networkBox")
+        metadata = getMetadata(snapshot, netbox, "networkBox")
         saveToFile = hda.breakByNetworkBox # Create a file per network box
         single = True if saveToFile else False # single will let the template save headers and footers
-        networkText = renderNodePathNetwork(nodePath, metadata, graphList, single, saveToFile)
-        nodeNetworks.append(networkText)
+        yield renderNodePathNetwork(nodePath, metadata, graphList, single, saveToFile)
     # Get Nodes outside network boxes
     if hda.includeNodesOutsideNetworkBox:
         # if there are nodes outside the network boxes, process them
-        nodeList = hnm.HoudiniNodeManager.get_nodes_not_in_network_boxes(nodePath)
+        nodeList = snapshot.get_nodes_not_in_network_boxes()
         # Filter by Network Boxes
         if hda.filterNetworkBoxes and hda.networkBoxFilter:
-            nodeList = hnm.HoudiniNodeManager.filter_by_network_boxes(nodePath, hda.networkBoxFilter, nodeList)
+            nodeList = snapshot.filter_by_network_boxes(hda.networkBoxFilter, nodeList)
         # skip if no nodes outside netboxes
         if not len(nodeList):
             hda.consoleLog(f"======= BuildNodePathNetworkWithBoxes.OutsideNetwork ZERO nodes (after Netbox Filter) in: {nodePath}", hdam.TYPES.DEBUG)
         else:
             # Duplicate code from below - refactor
             hda.consoleLog(f"======= BuildNodePathNetworkWithBoxes.OutsideNetwork Compose Graph for: -> {nodePath}", hdam.TYPES.DEBUG)
-            graph = ng.NodeGraph(nodePath, nodePath, nodeList)
+            graph = networkGraph.partition(nodePath, nodeList)
             graphList = graph.graphList
-            metadata = getMetadata(nodePath, None, "nodePath")
+            metadata = getMetadata(snapshot, None, "nodePath")
             # these are never saved alone anyway
             single = False
-            networkText = renderNodePathNetwork(nodePath, metadata, graphList, single, False)
-            nodeNetworks.append(networkText)
-    # Save Network Boxes and Free Nodes in one File if breakByNodePath
-    if nodeNetworks:
-        # break by path and not break by network - # TODO: this setting is really confusing! 
-        if hda.breakByNodePath and not hda.breakByNetworkBox:
-            nodeNetworksText = "".join(nodeNetworks)
-            hda.consoleLog(f"======= BuildNodePathNetworkWithBoxes.NetBox Combined for: -> {nodePath}", hdam.TYPES.DEBUG)
-            metadata = getMetadata(nodePath, None, "nodePath")
-            renderNodePathNetworkCombined(nodePath, nodeNetworksText, metadata, True)
-    return nodeNetworks
+            yield renderNodePathNetwork(nodePath, metadata, graphList, single, False)
 
-def buildNodePathNetwork(nodePath):
+def captureSnapshot(nodePath):
+    # the only step reading from Houdini, everything after works on the snapshot
+    with prof.stage("snapshot"):
+        snapshot = ss.SceneSnapshot.capture(nodePath)
+    if hda.exportDebugFiles:
+        snapshotFilename = os.path.join(hda.getSavePath(nodePath), hda.sanitize_string(nodePath) + "-snapshot.json")
+        snapshot.save(snapshotFilename)
+    return snapshot
+
+def buildNodePathNetwork(nodePath, snapshot=None):
+    """
+    Returns the rendered streams of the networks of nodePath, see renderNodePathNetwork.
+    """
     nodeNetworks = [] # A list of GraphList Networks
+    snapshot = snapshot if snapshot else getSnapshot(nodePath, {}, {})
     # Get Root Network Boxes if needed
     rootNetworkBoxes = []
     hda.consoleLogDebug("======= buildNodePathNetwork")    
     if hda.groupByNetworkBoxL1:
-        rootNetworkBoxes = hnm.HoudiniNodeManager.get_root_network_boxes(nodePath)
+        rootNetworkBoxes = snapshot.get_root_network_boxes()
     
     # if root network boxes are found and needed
     if hda.groupByNetworkBoxL1 and rootNetworkBoxes:
-        nodeNetworks = BuildNodePathNetworkWithBoxes(nodePath, rootNetworkBoxes)
+        nodeNetworks = BuildNodePathNetworkWithBoxes(snapshot, rootNetworkBoxes)
     else: # No Network Boxes Exist, or, groupByNetworkBoxL1 is False
-        networkText = BuildNodePathNetworkNoBoxes(nodePath)
-        nodeNetworks.append(networkText)
+        nodeNetworks.append(BuildNodePathNetworkNoBoxes(snapshot))
     # Return nodeNetworks
     return nodeNetworks
                     
-def extractFromNodes():
+def startRenderPool():
+    """
+    Starts the worker processes rendering the units, see render_pool.RenderPool.
+    """
+    moduleSource = rm.TemplateCache.get_render_pool_module()
+    executable = hda.renderPython if hda.renderPython else None
+    if executable is None and not os.path.basename(sys.executable).lower().startswith("python"):
+        # inside the Houdini application, workers run in hython
+        hfs = os.environ.get("HFS")
+        executable = shutil.which("hython", path=os.path.join(hfs, "bin")) if hfs else None
+        if executable is None:
+            raise RuntimeError(f"startRenderPool: hython not found in {os.path.join(hfs, 'bin') if hfs else '$HFS/bin (HFS is not set)'}, "
+                               "set Render Python to the interpreter of the render processes, or Render Processes to 0")
+    hda.consoleLogDebug(f"===== startRenderPool: {hda.renderProcesses} processes, {executable or sys.executable}")
+    return rp.RenderPool(rm.TemplateCache.get_sources(), hda.renderProcesses, hda.renderChunkSize,
+                         executable, moduleSource).start()
+
+def extractFromNodes(snapshots=None, dirtyNodes=None, outputs=None):
+    """
+    Exports the node paths of the settings.
+    outputs: node path -> recorded output of the network, filled by the export. The networks found in it
+    are restored instead of being composed and rendered again (see watchExportCallback).
+    """
+    global exportCache, renderPool, networkOutputs
     hda.consoleLog("===== extractFromNodes", hdam.TYPES.DEBUG)
     if hda.nodeErrors:
         for error in hda.nodeErrors:
             hda.consoleLogError(error)
         return
+    profiler = prof.ExportProfiler.start(", ".join(hda.nodePaths)) if hda.exportProfile else None
+    exportCache = ec.ExportCache(ow.OutputWriter.state_folder(hda.projectLocation), hda).open() if hda.useExportCache else None
+    # graph debug stages of the export, written in one bundle by a background thread (see debug_writer.DebugBundleReader)
+    debugBundle = None
+    if hda.exportDebugFiles:
+        debugBundle = dw.DebugBundle.start(os.path.join(hda.projectLocation, "export_debug.jsonl"), default=hnm.serialize_value)
+    # files are only written when their content changed, and only the files no longer exported are deleted
+    outputWriter = ow.OutputWriter.start(hda.projectLocation, hda.getSyncFolders(), hda)
+    completed = False
+    networkOutputs = outputs
+    try:
+        renderPool = startRenderPool() if hda.renderProcesses > 0 else None
+        extractNodePaths(snapshots, dirtyNodes)
+        completed = True
+    finally:
+        # an interrupted export keeps the files of the previous one
+        outputWriter.finish(deleteOrphans=completed)
+        networkOutputs = None
+        if renderPool is not None:
+            renderPool.close()
+            renderPool = None
+        if exportCache is not None:
+            exportCache.close()
+            exportCache = None
+        if debugBundle is not None:
+            debugBundle.close()
+        if profiler is not None:
+            saveProfile(profiler.stop())
+
+def saveProfile(profiler):
+    """
+    Writes the stage report of the export next to it, and prints its summary table.
+    """
+    profileFilename = os.path.join(ow.OutputWriter.state_folder(hda.projectLocation), "export_profile.json")
+    try:
+        os.makedirs(os.path.dirname(profileFilename), exist_ok=True)
+        profiler.save(profileFilename)
+    except OSError as error:
+        hda.consoleLogWarning(f"===== saveProfile: cannot write {profileFilename}: {error}")
+    hda.consoleLogInfo("===== Export profile (" + profileFilename + ")\n" + profiler.summary())
+
+def extractNodePaths(snapshots=None, dirtyNodes=None):
+    # snapshots: node path -> SceneSnapshot kept by watch mode, missing networks are captured and added
+    # dirtyNodes: node path -> paths of the nodes edited since its snapshot was taken
+    snapshots = snapshots if snapshots is not None else {}
+    dirtyNodes = dirtyNodes if dirtyNodes is not None else {}
     nodeList = hda.nodePaths
-    nodesText = []
     if nodeList:
-        for node_path in nodeList:
-            hda.consoleLog(f"===== extractFromNodes.processing: {node_path}", hdam.TYPES.DEBUG)
-            hda.cleanFolder(node_path) # deleting all files in the Node Folder Location
-            networkTextList = buildNodePathNetwork(node_path)
-            nodesText.append("\n".join(networkTextList))
+        if hda.pipelineWorkers > 0 and len(nodeList) > 1:
+            nodeStreams = extractNodePathsPipelined(nodeList, snapshots, dirtyNodes)
+        else:
+            nodeStreams = iterNodePathStreams(nodeList, snapshots, dirtyNodes)
         # if not file per node path, save all nodes in one file
         if not hda.breakByNodePath:
             hda.consoleLog(f"===== extractFromNodes.saving all nodes", hdam.TYPES.DEBUG)
             metadata = getMetadata("", None, "default")
-            allNodesText = "\n".join(nodesText)
-            renderNodePathNetworkCombined(node_path, allNodesText, metadata, True)            
+            allNodesChunks = joinChunks("\n", nodeStreams)
+            rm.RenderManager.drain(renderNodePathNetworkCombined(nodeList[-1], allNodesChunks, metadata, True))
+        else:
+            for nodeChunks in nodeStreams:
+                rm.RenderManager.drain(nodeChunks)
     else:
         hda.consoleLogWarning("No valid nodes to extract.")
+
+def getSnapshot(node_path, snapshots, dirtyNodes):
+    """
+    Returns the snapshot of a node path: captured if missing, else the kept one with its edited nodes captured again.
+    Every snapshot is tracked by the export cache, so the units of the nodes that did not change are not rendered again.
+    """
+    if node_path not in snapshots:
+        snapshots[node_path] = captureSnapshot(node_path)
+    elif dirtyNodes.get(node_path):
+        with prof.stage("snapshot"):
+            refreshed = snapshots[node_path].refresh_nodes(dirtyNodes.pop(node_path))
+        hda.consoleLogDebug(f"===== getSnapshot: {node_path} {len(refreshed)} nodes captured again")
+    if exportCache is not None:
+        exportCache.track_snapshot(snapshots[node_path])
+    return snapshots[node_path]
+
+def getOutputKey():
+    # recorded outputs are only restored by exports with the same settings and templates
+    settings = {name: value for name, value in vars(hda).items() if name not in ("hdaNode", "actionSelected")}
+    return ec.ExportCache.hash_data([settings, rm.TemplateCache.get_signature()])
+
+def exportNodePath(node_path, snapshot):
+    """
+    Returns the stream of node_path in the all nodes file, its files are written as the stream is consumed.
+    The network is restored from its recorded output when there is one (see extractFromNodes),
+    or when the export cache has one for the same network hash.
+    """
+    if networkOutputs is None and exportCache is None:
+        return joinChunks("\n", buildNodePathNetwork(node_path, snapshot))
+    outputKey = getOutputKey()
+    record = networkOutputs.get(node_path) if networkOutputs is not None else None
+    networkHash = None
+    if record is None or record["key"] != outputKey:
+        record = None
+        if exportCache is not None:
+            networkHash = exportCache.network_hash(snapshot, outputKey)
+            record = exportCache.get_network(node_path, networkHash)
+            if record is not None and networkOutputs is not None:
+                networkOutputs[node_path] = record
+    if record is not None:
+        hda.consoleLogDebug(f"===== exportNodePath: {node_path} restored, {len(record['files'])} files")
+        return restoreNetwork(record)
+    return recordNetwork(node_path, snapshot, outputKey, networkHash)
+
+def recordNetwork(node_path, snapshot, outputKey, networkHash=None):
+    # yields the stream of node_path, its text and files are recorded once it is consumed
+    files = []
+    stream = []
+    with rm.RenderManager.recordOutputs(files):
+        chunks = joinChunks("\n", buildNodePathNetwork(node_path, snapshot))
+    while True:
+        with rm.RenderManager.recordOutputs(files):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        if not hda.breakByNodePath:
+            stream.append(chunk)
+        yield chunk
+    record = {"key": outputKey, "files": files, "stream": "".join(stream)}
+    if networkOutputs is not None:
+        networkOutputs[node_path] = record
+    if networkHash is not None:
+        exportCache.put_network(node_path, networkHash, record)
+
+def restoreNetwork(record):
+    # same stream and files as the recorded network, files still holding the same content are not written
+    renderMan = rm.RenderManager(hda)
+    for nodeName, metadata, contentHash, text in record["files"]:
+        renderMan.restore_output(nodeName, metadata, contentHash, text)
+    if record["stream"]:
+        yield record["stream"]
+
+def iterNodePathStreams(nodeList, snapshots, dirtyNodes):
+    # yields the rendered stream of each node path, built when the previous one has been consumed
+    for node_path in nodeList:
+        hda.consoleLog(f"===== extractFromNodes.processing: {node_path}", hdam.TYPES.DEBUG)
+        yield exportNodePath(node_path, getSnapshot(node_path, snapshots, dirtyNodes))
+
+def extractNodePathsPipelined(nodeList, snapshots, dirtyNodes):
+    """
+    Same as the serial loop of extractNodePaths, as a pipeline (see export_pipeline.ExportPipeline):
+    the main thread captures the snapshots (the only step using hou), worker threads build and render the networks,
+    and the writer thread saves their files in node path order.
+    Returns the streams of the node paths, spooled to temporary files when the all nodes file needs them.
+    """
+    # templates are read from the HDA sections here, workers only use the compiled templates
+    rm.TemplateCache.validate()
+
+    def produce(node_path):
+        hda.consoleLog(f"===== extractFromNodes.processing: {node_path}", hdam.TYPES.DEBUG)
+        return getSnapshot(node_path, snapshots, dirtyNodes)
+
+    def process(node_path, snapshot):
+        spool = None
+        with rm.RenderManager.deferWrites() as pending:
+            nodeChunks = exportNodePath(node_path, snapshot)
+            if hda.breakByNodePath:
+                rm.RenderManager.drain(nodeChunks)
+            else:
+                spool = rm.RenderManager(hda).spool(nodeChunks, node_path)
+        return spool, pending
+
+    def consume(node_path, result):
+        rm.RenderManager(hda).write_deferred(result[1])
+
+    pipeline = ep.ExportPipeline(produce, process, consume, hda.pipelineWorkers, hda.pipelineQueueDepth)
+    return [rm.RenderManager.read_spool(spool) for spool, _ in pipeline.run(nodeList) if spool is not None]
      
+def watchExportCallback(hdaNode):
+    """
+    Returns the export run by watch mode when edits settle, see watch_manager.WatchManager.
+    It runs on the event loop and only reads from Houdini (settings, templates and the snapshots of the edited networks),
+    composing, rendering and writing are returned as a job that the watch runs off the event loop.
+    The networks that were not edited are restored from the output recorded by the previous exports.
+    """
+    outputs = {} # node path -> recorded output of the network, see extractFromNodes
+
+    def export(networkPaths, snapshots, dirtyNodes):
+        global hda
+        # the callback runs from the event loop, hou.pwd() is not the HDA node anymore
+        hdam.HDAManager.resetCounters()
+        settings = hda = hdam.HDAManager(hdaNode)
+        rm.TemplateCache.invalidateCheck(hdaNode.type().definition())
+        with hdam.settingsScope(settings):
+            settings.consoleLogInfo("=== Houdini2Chat.Watch re-export: " + ", ".join(networkPaths))
+            settings.initOnce()
+            rm.TemplateCache.validate()
+            for node_path in settings.nodePaths:
+                getSnapshot(node_path, snapshots, dirtyNodes)
+        # the job gets its own dict, the watch drops the snapshots of the networks edited meanwhile
+        jobSnapshots = dict(snapshots)
+        # the edited networks are built again, dropped first so an interrupted export does not keep them
+        for node_path in networkPaths:
+            outputs.pop(node_path, None)
+
+        def job():
+            global hda
+            hda = settings
+            with hdam.settingsScope(settings):
+                try:
+                    extractFromNodes(jobSnapshots, {}, outputs)
+                except Exception:
+                    settings.consoleLogError("=== Houdini2Chat.Watch export failed:\n" + traceback.format_exc())
+        return job
+    return export
+
 def main():
     """
     Main function that extracts information from the nodes specified in the HDA.
     """
     global hda
-    hda = hdam.HDAManager() # necessary to refresh settings
+    # settings are evaluated once per run, and shared by all modules through hdam.HDAManager.current()
+    hdam.HDAManager.resetCounters()
+    hda = hdam.HDAManager()
+    # templates are compiled once per process, check once per run if the HDA sections were edited
+    rm.TemplateCache.invalidateCheck(hda.hdaNode.type().definition())
+    with hdam.settingsScope(hda):
+        runAction()
+    hda.consoleLogDebug("=== Houdini2Chat Settings evaluated: " + hda.evaluationReport())
+    hda.consoleLogDebug(f"=== Houdini2Chat Templates compiled by this session: {rm.TemplateCache.compileCount}, precompiled: {rm.TemplateCache.precompiledCount}")
+    hda.consoleLogDebug(f"=== Houdini2Chat Parm template cache: {hnm.ParmTemplateCache.hits} hits, {hnm.ParmTemplateCache.misses} misses")
+    hdaModule = hda.hdaNode.type().hdaModule()
+    if hasattr(hdaModule, "loadReport"):
+        hda.consoleLogDebug(f"=== Houdini2Chat Module sections: {hdaModule.loadReport()}")
+    return
+
+def runAction():
     hda.initOnce()
 
     # keeping if/else instead of match/case, to stay compatible with 3.7 (Houdini 19)
@@ -247,8 +551,15 @@ def main():
         hda.consoleLogInfo("=== main.Extract Selected")
         xf.ExtractFunctions().extract_all_node_types()
         hda.setParm("action_selected", 0)
+    elif hda.actionSelected == 4:
+        hda.consoleLogInfo("=== Houdini2Chat.Watch Start")
+        wm.start(hda, watchExportCallback(hda.hdaNode))
+        hda.setParm("action_selected", 0)
+    elif hda.actionSelected == 5:
+        hda.consoleLogInfo("=== Houdini2Chat.Watch Stop")
+        wm.stop(hda)
+        hda.setParm("action_selected", 0)
     if hda.actionSelected != 0:
         endTime = datetime.datetime.now()
         hda.consoleLogInfo("=== Houdini2Chat Ending @ " + endTime.strftime("%I:%M:%S %p") +
                      " | Duration: " + str((endTime - startTime).total_seconds() * 1000) + "ms")
-    return
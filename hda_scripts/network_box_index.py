@@ -0,0 +1,108 @@
+import os
+import re
+import fnmatch
+
+class NetworkBoxIndex:
+    """
+    Network box membership of one network, built once from the network box records
+    (see houdini_node_manager.HoudiniNodeManager.extract_network_boxes).
+    Holds the containment tree of the boxes (at any depth), the box chain of every node
+    and the compiled title filters, so grouping and filtering are set lookups.
+    """
+    def __init__(self, networkBoxes, nodePaths=()):
+        self.boxes = {netbox["name"]: netbox for netbox in networkBoxes} # box name -> network box record
+        self.children = {name: [] for name in self.boxes} # box name -> nested box names
+        self.roots = []
+        for name, netbox in self.boxes.items():
+            parent = netbox["parent_box"]
+            if parent in self.children:
+                self.children[parent].append(name)
+            else:
+                self.roots.append(name)
+        self.boxNodes = {name: frozenset(netbox["nodes"]) for name, netbox in self.boxes.items()} # nodes at any depth
+        # innermost box of each node: the smallest box holding it
+        self.nodeBox = {}
+        for name in sorted(self.boxes, key=lambda name: len(self.boxNodes[name]), reverse=True):
+            for node_path in self.boxNodes[name]:
+                self.nodeBox[node_path] = name
+        self.nodePaths = list(nodePaths)
+        self.nodeSet = set(self.nodePaths)
+        self._chains = {} # box name -> (box, parent box, ..., root box)
+        self._filters = {} # patterns string -> (compiled regex, matched nodes)
+
+    @staticmethod
+    def fromSnapshot(snapshot):
+        index = NetworkBoxIndex(snapshot.network_boxes.values(), snapshot.nodes)
+        # the snapshot knows the innermost box of each node
+        index.nodeBox = {node_path: record["network_box"] for node_path, record in snapshot.nodes.items()
+                         if record["network_box"] is not None}
+        return index
+
+# ==================================
+# ========= Hierarchy
+# ==================================
+
+    def get_root_boxes(self):
+        return [self.boxes[name] for name in self.roots]
+
+    def get_child_boxes(self, box_name):
+        return [self.boxes[name] for name in self.children.get(box_name, [])]
+
+    def get_box_chain(self, box_name):
+        """
+        Returns the box and its parent boxes, innermost first.
+        """
+        if box_name is None:
+            return ()
+        chain = self._chains.get(box_name)
+        if chain is None:
+            parent = self.boxes[box_name]["parent_box"] if box_name in self.boxes else None
+            chain = (box_name,) + self.get_box_chain(parent)
+            self._chains[box_name] = chain
+        return chain
+
+    def get_node_box_chain(self, node_path):
+        return self.get_box_chain(self.nodeBox.get(node_path))
+
+    def get_box_nodes(self, box_name):
+        # nodes of the box, nested boxes included, that are part of the network
+        return [node_path for node_path in self.boxes[box_name]["nodes"] if node_path in self.nodeSet]
+
+    def get_nodes_outside_boxes(self):
+        return [node_path for node_path in self.nodePaths if node_path not in self.nodeBox]
+
+# ==================================
+# ========= Filters
+# ==================================
+
+    @staticmethod
+    def compile_patterns(patterns_str):
+        """
+        Compiles the space separated fnmatch patterns into one regex (case follows fnmatch on the platform).
+        """
+        patterns = patterns_str.split()
+        if not patterns:
+            return None
+        flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+        return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns), flags)
+
+    def get_filter(self, patterns_str):
+        """
+        Returns (regex, nodes of the boxes whose title matches), compiled once per patterns string.
+        """
+        if patterns_str not in self._filters:
+            regex = NetworkBoxIndex.compile_patterns(patterns_str)
+            matched = set()
+            if regex is not None:
+                for name, netbox in self.boxes.items():
+                    if regex.match(netbox["comment"]):
+                        matched.update(self.boxNodes[name])
+            self._filters[patterns_str] = (regex, frozenset(matched))
+        return self._filters[patterns_str]
+
+    def filter_nodes(self, patterns_str, nodeList):
+        """
+        Keeps the nodes of nodeList that are inside a network box whose title matches one of the patterns.
+        """
+        matched = self.get_filter(patterns_str)[1]
+        return [node_path for node_path in nodeList if node_path in matched]
@@ -1,29 +1,145 @@
-import hou
 import json
 import hda_manager as hda
 import gnode as gn
-import math
 import os
 import copy
 import houdini_node_manager as hnm
+import scene_snapshot as ss
+import heapq
+import export_profiler as prof
+import debug_writer as dw
+import time
+from collections.abc import MutableMapping
+
+class EdgeIndex:
+    """
+    Adjacency index of the graph edges.
+    Successors and predecessors are kept as insertion ordered dicts (used as ordered sets),
+    so insert, delete and lookup are O(1) and iteration keeps the order edges were added in.
+    """
+    def __init__(self, edges=None):
+        self._edges = {} # (from, to) -> None, keeps global edge order
+        self._successors = {}
+        self._predecessors = {}
+        if edges:
+            for from_node, to_node in edges:
+                self.add(from_node, to_node)
+
+    def add(self, from_node, to_node):
+        edge = (from_node, to_node)
+        if edge in self._edges:
+            return False
+        self._edges[edge] = None
+        self._successors.setdefault(from_node, {})[to_node] = None
+        self._predecessors.setdefault(to_node, {})[from_node] = None
+        return True
+
+    def remove(self, from_node, to_node):
+        edge = (from_node, to_node)
+        if edge not in self._edges:
+            return False
+        del self._edges[edge]
+        del self._successors[from_node][to_node]
+        del self._predecessors[to_node][from_node]
+        return True
+
+    def remove_incoming(self, node):
+        for from_node in list(self.predecessors(node)):
+            self.remove(from_node, node)
+
+    def successors(self, node):
+        return self._successors.get(node, {}).keys()
+
+    def predecessors(self, node):
+        return self._predecessors.get(node, {}).keys()
+
+    def out_degree(self, node):
+        return len(self._successors.get(node, ()))
+
+    def in_degree(self, node):
+        return len(self._predecessors.get(node, ()))
+
+    def __contains__(self, edge):
+        return edge in self._edges
+
+    def __iter__(self):
+        return iter(self._edges)
+
+    def __len__(self):
+        return len(self._edges)
+
+    def toList(self):
+        return list(self._edges)
+
+class NodeView(MutableMapping):
+    """
+    Nodes of a subgraph: a membership view over the nodes of the parent graph, nothing is copied.
+    Nodes added to the subgraph (reference nodes) are stored in a local overlay.
+    Member nodes are shared with the parent graph, only the overlay belongs to the subgraph.
+    """
+    def __init__(self, parentNodes, members):
+        self._parent = parentNodes
+        self._members = dict.fromkeys(members) # ordered set of member node paths
+        self._overlay = {}
+
+    def __getitem__(self, node_path):
+        if node_path in self._overlay:
+            return self._overlay[node_path]
+        if node_path in self._members:
+            return self._parent[node_path]
+        raise KeyError(node_path)
+
+    def __setitem__(self, node_path, gNode):
+        self._overlay[node_path] = gNode
+        self._members.pop(node_path, None)
+
+    def __delitem__(self, node_path):
+        if node_path in self._overlay:
+            del self._overlay[node_path]
+        else:
+            del self._members[node_path]
+
+    def __contains__(self, node_path):
+        return node_path in self._members or node_path in self._overlay
+
+    def __iter__(self):
+        yield from self._members
+        yield from self._overlay
+
+    def __len__(self):
+        return len(self._members) + len(self._overlay)
 
 class NodeGraph:
     # class variables are static and shared among all instances
+    DEBUG_EXCLUDED = ["hdaSettings", "snapshot", "loopList", "loopTree", "loopUnits", "fanOuts"] # not saved by save_network
     
-    def __init__(self, name, parent_path, nodeList=[], is_loop_graph=False):        
+    def __init__(self, name, parent_path, nodeList=[], is_loop_graph=False, hdaSettings=None, snapshot=None):        
         self.name = name
         self.parent_path = parent_path
         self.gNodes = {} # it is a dictionary, to allow fast access to nodes by path
-        self.edges = []
+        self.edges = EdgeIndex()
         self.branches = []
+        self.cycles = [] # cyclic units, see break_graph_in_branches
+        self.decompositionStats = {}
+        self.notes = [] # network box notes, see assign_sticky_notes
+        self.referenceCounts = {} # node path -> last reference index, see add_reference_node
+        self.fanOuts = set() # shared reference nodes feeding several outputs, see break_nodes_with_multiple_outputs
         self.graphLoops = []
+        self.loopList = [] # see findGraphLoops
+        self.loopTree = []
+        self.loopUnits = []
         self.noLoopNodes = []
         self.loop_id = None
         self.loop_end = None
         self.begin_nodes = []
+        self.nestedLoopNodes = [] # begin/end nodes of the nested loops of a loop graph, rendered by their own loop unit
         self.graphList = []
         self.begin_end_nodes = []
-        self.hdaSettings = hda.HDAManager()
+        self.hdaSettings = hdaSettings if hdaSettings else hda.HDAManager.current()
+        # all node data is read from the scene snapshot, captured once per network
+        self.snapshot = snapshot
+        if nodeList and snapshot is None:
+            self.snapshot = ss.SceneSnapshot.capture(parent_path)
         # self.hdaSettings.consoleLogDebug(f"NodeGraph: {parent_path},  {nodeList} {is_loop_graph}")
         self.is_loop_graph = is_loop_graph
         if nodeList:
@@ -41,27 +157,24 @@ class NodeGraph:
         return self.gNodes.get(node_path)
     
     def add_edge(self, from_node_path, to_node_path):
-        # check if the edge already exists
-        if (from_node_path, to_node_path) in self.edges:
-            return False
-        else:
-            self.edges.append((from_node_path, to_node_path))
-        return True
+        # returns False if the edge already exists
+        return self.edges.add(from_node_path, to_node_path)
 
     def delete_edge(self, from_node_path, to_node_path):
         """
         Deletes the edge from from_node_path to to_node_path if it exists.
         """
-        self.edges = [edge for edge in self.edges if not (edge[0] == from_node_path and edge[1] == to_node_path)]
+        self.edges.remove(from_node_path, to_node_path)
 
     def build_graph_from_node_list(self, nodeList):
         """
         Builds a graph from a list of node objects.
         """
-        # TODO: this is not taking in consideration that input nodes may be coming from nodes outside this sub network.
+        # inputs coming from nodes outside this sub network are kept by partition (see add_external_inputs)
         # TODO: we loop on inputs only, that means, we dont take in consideration output links that go to nodes outside this sub network.
+        nodeTable = self.snapshot.get_node_table()
         for nodePath in nodeList:
-            gNode = gn.GNode(nodePath)
+            gNode = gn.GNode(nodeTable, nodeTable.get_id(nodePath))
             self.gNodes[nodePath] = gNode
             for gNode_input_path in gNode.getInputs():
                 self.add_edge(gNode_input_path, nodePath)
@@ -86,54 +199,25 @@ class NodeGraph:
         new_y = ref_pos[1] + offset  # Increase y to place above; adjust if your coordinate system is different.        
         moving_node.update(position=[new_x, new_y])
         
-    def get_distance(self, node, note):
-        hdaSettings = hda.HDAManager()
-        distance = None
-        # note position is the bottom left corner
-        pos_note = [
-            note["position"][0] + note["size"][0] / 2,
-            note["position"][1] + note["size"][1] / 2
-        ]
-        pos_node = node.getPosition()
-        distance = math.sqrt((pos_note[0] - pos_node[0])**2 + (pos_note[1] - pos_node[1])**2)
-        # hdaSettings.consoleLog(f"note: {note['text']}, node: {node['name']}, distance: {distance}", type=hda.TYPES.DEBUG)
-        # hdaSettings.consoleLog(f"pos_note: {note['position']}, pos_size: {note['size']}", type=hda.TYPES.DEBUG)
-        # hdaSettings.consoleLog(f"pos_node: {pos_node}", type=hda.TYPES.DEBUG)
-        # hdaSettings.consoleLog(f"pos_note: {pos_note}", type=hda.TYPES.DEBUG)
-        # hdaSettings.consoleLog(f"distance: {distance}", type=hda.TYPES.DEBUG)
-        # if note is above the node, ignore it        
-        # hdaSettings.consoleLog(f"note_bottom: {note_bottom}", type=hda.TYPES.DEBUG)
-        if pos_node[1] < note["position"][1]:
-            # hdaSettings.consoleLog(f"note is above the node", type=hda.TYPES.DEBUG)
-            return None        
-        # if node is further from distance threshold, return
-        if distance > hdaSettings.stickyNotesDistanceThreshold:
-            # hdaSettings.consoleLog(f"distance is greater than threshold", type=hda.TYPES.DEBUG)
-            return None
-        return distance
-
-    def assign_sticky_notes(self, sticky_notes):
-        note_text = ""
-        # loop on sticky notes
-        for note in sticky_notes:
-            # find distance to each node
-            for node in self.gNodes.values():
-                if '@' in node.getName():
-                    continue
-                distance = self.get_distance(node, note)
-                if distance is not None:
-                    if note["distance"] is None or distance < note["distance"]:
-                        note["distance"] = distance
-                        note["closest_node"] = node.getPath()
-            note_text = note['text'][:10] + "..." if len(note['text']) > 10 else note['text']
-            # assign closest node to each note
-            if note["closest_node"] is not None:
-                updateGNode = self.gNodes.get(note["closest_node"])
-                updateGNode.update(note=note["text"])
-                # log node path and note text
-                # self.hdaSettings.consoleLogDebug(f"NodeGraph.assign_sticky_notes: {note_text} to {self.gNodes[note['closest_node']].getName()}")
-
-            # self.hdaSettings.consoleLog(f"note: {note_text}, closest node: {note['closest_node']}, distance: {note['distance']}", type=hda.TYPES.DEBUG)
+    def assign_sticky_notes(self, noteLinker, boxNotesTaken):
+        """
+        Sets the notes linked to the nodes of this graph (reference nodes excluded),
+        and takes the notes of the network boxes its nodes belong to, if no other graph took them.
+        """
+        for node in self.gNodes.values():
+            if node.isReference():
+                continue
+            note = noteLinker.get_node_note(node.getPath())
+            if note is not None:
+                node.update(note=note)
+        boxIndex = self.snapshot.get_network_box_index()
+        for node_path in self.gNodes:
+            # notes of the parent boxes are taken by the same graph
+            for box_name in boxIndex.get_node_box_chain(node_path):
+                if box_name in boxNotesTaken:
+                    break
+                boxNotesTaken.add(box_name)
+                self.notes.extend(noteLinker.get_box_notes(box_name))
 
     def get_root_nodes(self, return_names=False):
         """
@@ -144,99 +228,81 @@ class NodeGraph:
             return_names (bool): If True, returns the names of the root nodes.
                                  If False (default), returns the paths of the root nodes.
         """
-        # Collect all targets from edges
-        targets = {edge[1] for edge in self.edges}
-        # Root nodes are those not in the targets set.
-        root_nodes = [node_path for node_path in self.gNodes if node_path not in targets]
+        # Root nodes are those with no incoming edge.
+        root_nodes = [node_path for node_path in self.gNodes if self.edges.in_degree(node_path) == 0]
         
         if return_names:
             return [self.gNodes[node_path].getName() for node_path in root_nodes]
         else:
             return root_nodes
         
-    def traverse_direct_from_edges(self, start_node_path):
-        """
-            Traverse direct will traverse from a node downstream using edges as long as there is exactly one edge.
-            It records the node names (not paths) in the same order they are traversed.
-        """
-        traversed = []
-        miNode = None
-        current_path = start_node_path
-        while current_path in self.gNodes:
-            current_node = self.gNodes[current_path]
-            traversed.append(current_node.getPath())
-            # if node has multiple inputs, break the loop
-            if len(current_node.getInputs()) > 1:
-                # but if its a re-entry root node, then continue
-                if len(traversed) > 1:
-                    # self.hdaSettings.consoleLogDebug(f"NodeGraph.traverse_direct_from_edges: Multiple Inputs {current_node.getPath()}")
-                    miNode = current_node.getPath()
-                    break
-            # Get all edges starting from the current node
-            valid_edges = [edge for edge in self.edges if edge[0] == current_path]
-            if len(valid_edges) == 1: # TODO scenario with 2 edges going to same node (jointdeform)
-                current_path = valid_edges[0][1]
-            else:
-                break            
-        return traversed, miNode
-
     # UPDATED, may need further updates
-    def add_reference_node(self, node_path):
+    def add_reference_node(self, node_path, original=None):
         """
-            TODO: REVIEW THIS LOGIC
-            create a reference copy of a node.
-            The reference node will have the same type as the original, but empty inputs/outputs, WHY??
-            and will include an attribute "reference" storing the original node's path.
+            create a reference node, an alias of the original node (see gnode.GNode.alias).
             The reference node's key is derived from the original node path using an "@" sign
-            followed by an incremented index to ensure uniqueness.
+            followed by an incremented index to ensure uniqueness, the key is never parsed back.
+            original is given for nodes that are not part of this graph (external inputs).
         """
-        i = 1
-        # Get a unique ID for the reference node
-        while True:
-            ref_key = f"{node_path}@{i}"
-            if ref_key not in self.gNodes:
-                break
-            if i>10:
-                print(f"ERROR: too many references!! { ref_key}")
-                break
+        # per node counter, so any number of references can be created in O(1)
+        i = self.referenceCounts.get(node_path, 0) + 1
+        while f"{node_path}@{i}" in self.gNodes:
             i += 1
-        original = self.gNodes[node_path]
-        refGNode = original.copy() # GNode(original)
-        refGNode.update(
-            path=ref_key,
-            name=f"{original.getName()}@{i}",
-            # inputs=[], outputs=[],
-            reference=node_path
-            )
+        self.referenceCounts[node_path] = i
+        ref_key = f"{node_path}@{i}"
+        original = original if original else self.gNodes[node_path]
+        refGNode = original.alias(i)
         self.gNodes[ref_key] = refGNode
         return self.gNodes[ref_key]
 
+    def add_external_inputs(self, members):
+        """
+        Connects the inputs coming from nodes out of members (ex. another network box) to a reference node
+        of the input node, so the connection is rendered instead of dropped.
+        """
+        nodeTable = self.snapshot.get_node_table()
+        for node_path, gNode in list(self.gNodes.items()):
+            if gNode.isReference() or gNode.getType() == "block_end":
+                continue
+            for inp in gNode.getInputs():
+                if inp is None or inp in members or nodeTable.get_id(inp) is None:
+                    continue
+                ref_node = self.add_reference_node(inp, gn.GNode(nodeTable, nodeTable.get_id(inp)))
+                self.add_edge(ref_node.getPath(), node_path)
+                self.set_node_above(ref_node.getPath(), node_path)
+
 # =============================
 # ========= Graph DECOMPOSITION
 # =============================
 
     def break_nodes_with_multiple_outputs(self):
         """
-            New functionality: For any node with more than one valid output, create a separate reference
-            node for each output (using the existing add_reference_node function),
-            disconnect the edge from the original node to that output using delete_edge(),
-            and add an edge from the reference node to that output using add_edge().
+            For any node with more than one valid output, disconnect the edges from the original node
+            to its outputs using delete_edge(), and reconnect them from a reference node using add_edge().
+            With shared fan-out (default), a single reference node feeds all the outputs (see self.fanOuts),
+            and every output starts its own branch from it.
+            Otherwise a separate reference node is created for each output (legacy behaviour).
         """
+        sharedFanOut = self.hdaSettings.sharedFanOut
         for node_path, gNode in list(self.gNodes.items()):
             valid_outputs = [o for o in gNode.getOutputs() if o]
             if len(valid_outputs) > 1:
+                ref_node = None
                 for out_path in valid_outputs:
                     # Create a reference node for the original node.
-                    ref_node = self.add_reference_node(node_path)
+                    if ref_node is None or not sharedFanOut:
+                        ref_node = self.add_reference_node(node_path)
                     # Delete the edge from the original node to this output using the existing function.
                     self.delete_edge(node_path, out_path)
                     # Retrieve the destination node and add a new edge from the reference node to the output.
                     to_node = self.get_node(out_path)
                     if to_node:
                         self.add_edge(ref_node.getPath(), to_node.getPath())
+                        if sharedFanOut and self.edges.out_degree(ref_node.getPath()) > 1:
+                            continue # the shared reference stays above its first output
                         self.set_node_above(ref_node.getPath(), out_path)
-                # Optionally remove the moved outputs from the original node's output list.
-                # node_data["outputs"] = [o for o in node_data["outputs"] if o not in valid_outputs]
+                if sharedFanOut:
+                    self.fanOuts.add(ref_node.getPath())
         # Save Graph
         self.save_network("bmo", pretty=True)
 
@@ -250,72 +316,257 @@ class NodeGraph:
             valid_inputs = [i for i in gNode.getInputs() if i]
             if len(valid_inputs) > 1:
                 # find all edges where this node is the destination, and delete them
-                for edge in list(self.edges):
-                    if edge[1] == node_path:
-                        self.edges.remove(edge)
+                self.edges.remove_incoming(node_path)
         # Save Graph
         self.save_network("bmi", pretty=True)
 
+    def internal_predecessors(self, node_path):
+        # edges may come from nodes outside this graph (loop graphs keep them for clarity), they are not dependencies
+        return [pred for pred in self.edges.predecessors(node_path) if pred in self.gNodes]
+
+    def find_strongly_connected_components(self):
+        """
+        Tarjan's algorithm (iterative), returns the strongly connected components of the graph.
+        A component with more than one node (or a node linked to itself) is a cycle.
+        """
+        index_of = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        components = []
+        counter = 0
+        for root in self.gNodes:
+            if root in index_of:
+                continue
+            work = [(root, iter(self.edges.successors(root)))]
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node_path, successors = work[-1]
+                advanced = False
+                for succ in successors:
+                    if succ not in self.gNodes:
+                        continue
+                    if succ not in index_of:
+                        index_of[succ] = lowlink[succ] = counter
+                        counter += 1
+                        stack.append(succ)
+                        on_stack.add(succ)
+                        work.append((succ, iter(self.edges.successors(succ))))
+                        advanced = True
+                        break
+                    if succ in on_stack:
+                        lowlink[node_path] = min(lowlink[node_path], index_of[succ])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node_path])
+                if lowlink[node_path] == index_of[node_path]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node_path:
+                            break
+                    components.append(component)
+        return components
+
+    def topological_order(self, components, component_of, order_index):
+        """
+        Kahn's algorithm on the graph of components (cycles collapsed into one unit).
+        Ties are broken by the node order of the graph, so the result is deterministic.
+        Returns the node paths, nodes of a cycle are kept together.
+        """
+        in_degree = [0] * len(components)
+        successors = [set() for _ in components]
+        for from_node, to_node in self.edges:
+            if from_node not in component_of or to_node not in component_of:
+                continue
+            c_from = component_of[from_node]
+            c_to = component_of[to_node]
+            if c_from != c_to and c_to not in successors[c_from]:
+                successors[c_from].add(c_to)
+                in_degree[c_to] += 1
+        rank = [min(order_index[node_path] for node_path in component) for component in components]
+        ready = [(rank[c], c) for c in range(len(components)) if in_degree[c] == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, c = heapq.heappop(ready)
+            order.extend(sorted(components[c], key=order_index.get))
+            for c_to in successors[c]:
+                in_degree[c_to] -= 1
+                if in_degree[c_to] == 0:
+                    heapq.heappush(ready, (rank[c_to], c_to))
+        return order
+
+    def is_merge_node(self, node_path):
+        # nodes with multiple inputs end a branch, and start their own
+        return len(self.gNodes[node_path].getInputs()) > 1 or len(self.internal_predecessors(node_path)) > 1
+
+    def follow_branch(self, branch, next_path, consumed, in_cycle):
+        """
+        Extends the branch downstream as long as there is exactly one edge.
+        A merge node or a cycle node ends the branch, a merge node starts its own branch.
+        """
+        while next_path in self.gNodes and next_path not in consumed:
+            branch.append(next_path)
+            if next_path in in_cycle or self.is_merge_node(next_path):
+                break
+            consumed.add(next_path)
+            if self.edges.out_degree(next_path) != 1:
+                break
+            next_path = next(iter(self.edges.successors(next_path)))
+        return branch
+
+    def add_branch(self, branch):
+        # if the branch has more than one node, add it to the list of branches
+        if len(branch) > 1:
+            self.branches.append(branch)
+
     def break_graph_in_branches(self):
         """
-        Breaks the graph into branches. A branch is defined as a list of node paths obtained by direct traversal
-        starting from a root node (i.e. a node whose path never appears as a target in any edge).
+        Breaks the graph into branches. A branch is a list of node paths obtained by direct traversal
+        (following single edges) from a node that does not continue another branch.
+        Cycles (strongly connected components) are collapsed into cycle units (self.cycles),
+        and branches are emitted in topological order, O(N+E).
         
         Returns:
             A list of branches; where each branch is a list of node paths.
         """
+        startTime = time.perf_counter()
         self.branches = []
-        # Get root nodes (using paths, not names)
-        root_nodes = self.get_root_nodes(return_names=False)
-        for node_path in root_nodes:
-            branch, miNode = self.traverse_direct_from_edges(node_path)
-            if miNode and miNode not in root_nodes:
-                root_nodes.append(miNode)
-                # self.hdaSettings.consoleLogDebug(f"NodeGraph.break_graph_in_branches: minode added {miNode}")
-            # if the branch has more than one node, add it to the list of branches
-            if len(branch) > 1:
-                self.branches.append(branch)
-            if len(self.branches) > 1000: # TODO do better cyclic graph detection
-                self.hdaSettings.consoleLogWarning(f"***** NodeGraph.break_graph_in_branches: Possible Cyclic Graph, 1000 branches?")
-                break
-        # self.hdaSettings.consoleLogDebug(f"NodeGraph.break_graph_in_branches: ROOT NODES {root_nodes} in {self.name}")
+        self.cycles = []
+        order_index = {node_path: i for i, node_path in enumerate(self.gNodes)}
+        components = self.find_strongly_connected_components()
+        component_of = {}
+        in_cycle = set()
+        for c, component in enumerate(components):
+            for node_path in component:
+                component_of[node_path] = c
+            if len(component) > 1 or (component[0], component[0]) in self.edges:
+                self.cycles.append(sorted(component, key=order_index.get))
+                in_cycle.update(component)
+        consumed = set()
+        for node_path in self.topological_order(components, component_of, order_index):
+            if node_path in consumed:
+                continue
+            if node_path in in_cycle:
+                # connections leaving a cycle start from the cycle node
+                for succ in self.edges.successors(node_path):
+                    if succ in self.gNodes and component_of[succ] != component_of[node_path]:
+                        self.add_branch(self.follow_branch([node_path], succ, consumed, in_cycle))
+                continue
+            consumed.add(node_path)
+            if node_path in self.fanOuts:
+                # every output of a fan-out starts a branch from the shared reference node
+                for succ in self.edges.successors(node_path):
+                    self.add_branch(self.follow_branch([node_path], succ, consumed, in_cycle))
+                continue
+            # follow the edge starting from the current node, if it is the only one
+            if self.edges.out_degree(node_path) == 1: # TODO scenario with 2 edges going to same node (jointdeform)
+                self.add_branch(self.follow_branch([node_path], next(iter(self.edges.successors(node_path))), consumed, in_cycle))
+        self.decompositionStats = {
+            "nodes": len(self.gNodes),
+            "edges": len(self.edges),
+            "branches": len(self.branches),
+            "cycles": len(self.cycles),
+            "time_ms": (time.perf_counter() - startTime) * 1000
+        }
+        self.hdaSettings.consoleLogDebug(f"=========== NodeGraph.break_graph_in_branches: {self.name} {self.decompositionStats}")
+        if self.cycles:
+            self.hdaSettings.consoleLogWarning(f"***** NodeGraph.break_graph_in_branches: {len(self.cycles)} cyclic unit(s) in {self.name}")
         return self.branches
 
     def compose(self, nodeList):
         self.hdaSettings.consoleLogDebug(f"=========== NodeGraph.compose: {self.parent_path}")
-        self.build_graph_from_node_list(nodeList)
+        self.analyze(nodeList)
+        return self.build_units(self)
+
+    def analyze(self, nodeList):
+        """
+        Builds the graph of the nodes and finds its loops, without building the units (see build_units).
+        """
+        with prof.stage("build_graph_from_node_list"):
+            self.build_graph_from_node_list(nodeList)
+        prof.count("build_graph_from_node_list", "nodes", len(self.gNodes))
+        prof.count("build_graph_from_node_list", "edges", len(self.edges))
+        with prof.stage("findGraphLoops"):
+            self.findGraphLoops()
+            self.get_begin_end_nodes()
+        prof.count("findGraphLoops", "loops", len(self.loopList))
+        return self
+
+    def partition(self, name, nodeList):
+        """
+        Returns a graph of a part of this (analyzed) graph, ex. the nodes of a network box, with its units built.
+        The loop analysis is reused: a loop belongs to the part holding its end node.
+        Inputs coming from nodes outside the part are kept as external input references.
+        """
+        part = NodeGraph(name, self.parent_path, hdaSettings=self.hdaSettings, snapshot=self.snapshot)
+        part.gNodes = NodeView(self.gNodes, nodeList)
+        for graphLoop, loop in zip(self.graphLoops, self.loopUnits):
+            if loop["end"] in part.gNodes:
+                part.graphLoops.append([node_path for node_path in graphLoop if node_path in part.gNodes])
+                part.loopUnits.append(loop)
+        part.noLoopNodes = [node_path for node_path in self.noLoopNodes if node_path in part.gNodes]
+        part.begin_end_nodes = [node_path for node_path in self.begin_end_nodes if node_path in part.gNodes]
+        self.hdaSettings.consoleLogDebug(f"=========== NodeGraph.partition: {self.parent_path} {name} {len(part.gNodes)}")
+        part.build_units(self, externalInputs=part.gNodes)
+        return part
+
+    def build_units(self, sourceGraph, externalInputs=None):
+        """
+        Builds a graph for each loop unit and one for the nodes outside loops, from the nodes of sourceGraph.
+        externalInputs is the set of nodes of a partition, inputs from nodes out of it get a reference node.
+        """
         nodePath = self.parent_path
-        self.findGraphLoops()
-        self.get_begin_end_nodes()
-        # Build graph for each group
-        graphList = []
-        for i, graphLoop in enumerate(self.graphLoops):
-            # self.hdaSettings.consoleLogDebug(f"NodeGraph.compose loop: {self.parent_path} {i}")
-            g = NodeGraph(nodePath, nodePath)
-            g.buildLoopGraphFromNodes(self, graphLoop, i)
+        with prof.stage("decomposition"):
+            # Build graph for each group
+            graphList = []
+            for i, graphLoop in enumerate(self.graphLoops):
+                # self.hdaSettings.consoleLogDebug(f"NodeGraph.compose loop: {self.parent_path} {i}")
+                g = NodeGraph(nodePath, nodePath, hdaSettings=self.hdaSettings, snapshot=self.snapshot)
+                g.buildLoopGraphFromNodes(sourceGraph, graphLoop, i, self.loopUnits[i])
+                g.break_nodes_with_multiple_outputs()
+                if not self.hdaSettings.noBMI:
+                    g.break_nodes_with_multiple_inputs()
+                g.break_graph_in_branches()
+                graphList.append(g)
+
+            # Build Graph for No Loops Network
+            # self.hdaSettings.consoleLogDebug(f"NodeGraph.compose NoLoopNet: {self.parent_path}")
+            g = NodeGraph(nodePath, nodePath, hdaSettings=self.hdaSettings, snapshot=self.snapshot)
+            g.name = self.name
+            g.buildGraphFromNodes(sourceGraph, self.noLoopNodes, self.begin_end_nodes)
+            if externalInputs is not None:
+                g.add_external_inputs(externalInputs)
             g.break_nodes_with_multiple_outputs()
             if not self.hdaSettings.noBMI:
                 g.break_nodes_with_multiple_inputs()
             g.break_graph_in_branches()
             graphList.append(g)
 
-        # Build Graph for No Loops Network
-        # self.hdaSettings.consoleLogDebug(f"NodeGraph.compose NoLoopNet: {self.parent_path}")
-        g = NodeGraph(nodePath, nodePath)
-        g.buildGraphFromNodes(self, self.noLoopNodes, self.begin_end_nodes)
-        g.break_nodes_with_multiple_outputs()
-        if not self.hdaSettings.noBMI:
-            g.break_nodes_with_multiple_inputs()
-        g.break_graph_in_branches()
-        graphList.append(g)
+        prof.count("decomposition", "units", len(graphList))
+        prof.count("decomposition", "edges", sum(len(g.edges) for g in graphList))
+        prof.count("decomposition", "branches", sum(len(g.branches) for g in graphList))
+        prof.count("decomposition", "cycles", sum(len(g.cycles) for g in graphList))
 
         # Extract Sticky Notes
         if self.hdaSettings.includeStickyNotes:
-            noteList = hnm.HoudiniNodeManager.extract_sticky_notes(self.parent_path)
-            # loop on graphs and assign notes to nodes
-            for g in graphList:
-                noteListCopy = noteList.copy()
-                g.assign_sticky_notes(noteListCopy)
+            with prof.stage("sticky_notes"):
+                # notes are linked to the closest rendered node, as nodes outside these graphs never show them
+                renderedPaths = {node.getPath() for g in graphList for node in g.gNodes.values() if not node.isReference()}
+                noteLinker = self.snapshot.get_note_linker(self.hdaSettings, renderedPaths)
+                boxNotesTaken = set()
+                # loop on graphs and assign notes to nodes, network box notes go to the network graph first
+                for g in sorted(graphList, key=lambda g: g.is_loop_graph):
+                    g.assign_sticky_notes(noteLinker, boxNotesTaken)
         self.graphList = graphList
         return graphList
 
@@ -327,24 +578,34 @@ class NodeGraph:
 
         def to_dict():
             # Create a shallow copy of __dict__ excluding non-data attributes.
-            data = {k: v for k, v in self.__dict__.items() if k != "hdaSettings"}
+            data = {k: v for k, v in self.__dict__.items()
+                    if k not in NodeGraph.DEBUG_EXCLUDED}
             # Dynamically convert nodes value using their own toDict method.
             if "gNodes" in data:
                 data["gNodes"] = { key: node.toDict() for key, node in data["gNodes"].items() }
+            data["edges"] = self.edges.toList()
             return data
                 
+        bundle = dw.DebugBundle.current()
+        if self.hdaSettings.exportDebugFiles and bundle is not None and not forceSave:
+            # the export bundle serializes the stage on its own thread, only a copy of the state is taken here
+            attrs = {k: copy.copy(v) for k, v in self.__dict__.items()
+                     if k not in NodeGraph.DEBUG_EXCLUDED and k not in ("gNodes", "edges")}
+            nodes = {node_path: gNode.copy() for node_path, gNode in self.gNodes.items()}
+            bundle.submit(self, file_type, attrs, nodes, self.edges.toList())
+            return
         if self.hdaSettings.exportDebugFiles or forceSave:
             nodeName = self.parent_path
-            nodeName = hda.HDAManager().sanitize_string(nodeName)
+            nodeName = hda.HDAManager.sanitize_string(nodeName)
             loop = f"-loop-{self.loop_id}" if self.loop_id is not None else ""
             jsonFilename = os.path.join(self.hdaSettings.getSavePath(self.parent_path), nodeName + "-" + file_type + "-" + loop + ".json")        
 
             data = to_dict()
             with open(jsonFilename, 'w') as f:
                 if pretty:
-                    json.dump(data, f, indent=4, default=serialize_value)
+                    json.dump(data, f, indent=4, default=hnm.serialize_value)
                 else:
-                    json.dump(data, f, default=serialize_value)
+                    json.dump(data, f, default=hnm.serialize_value)
                 self.hdaSettings.consoleLog(f"=========== NodeGraph.save_network Saved to {jsonFilename}", type=hda.TYPES.DEBUG)
 
 # =============================
@@ -356,99 +617,150 @@ class NodeGraph:
         end_nodes = [gNode.getPath() for gNode in self.gNodes.values() if gNode.getType() == "block_end"]
         return end_nodes
 
-    def get_begin_nodes(self, end_node):
-        # get all nodes with type block_begin
-        begin_nodes = [gNode.getPath() for gNode in self.gNodes.values() if gNode.getType() == "block_begin"]
-        # filter them by blockpath param = ../end_node
-        matched_nodes = []
-        # print("end_node:", end_node)
-        for begin_node in begin_nodes:
-            # TODO: should we get the block path from outside hou?
-            block_path = hou.node(begin_node).parm("blockpath").eval()
-            # print("block_path:", block_path)
-            if block_path == "../"+end_node.split("/")[-1]:
-                matched_nodes.append(begin_node)
-        return matched_nodes
+    def index_begin_nodes(self):
+        """
+        Indexes the block_begin nodes by their blockpath parm (ex. "../foreach_end1"), built once per graph.
+        """
+        begin_index = {}
+        for gNode in self.gNodes.values():
+            if gNode.getType() == "block_begin":
+                # blockpath parm is captured in the scene snapshot
+                begin_index.setdefault(gNode.getBlockPath(), []).append(gNode.getPath())
+        return begin_index
+
+    def get_begin_nodes(self, end_node, begin_index=None):
+        # get all block_begin nodes with blockpath param = ../end_node
+        begin_index = begin_index if begin_index is not None else self.index_begin_nodes()
+        return list(begin_index.get("../" + end_node.split("/")[-1], []))
     
     def get_begin_end_nodes(self):
+        """
+        Begin/End nodes shown in the no loop graph: nodes of root loops, and begin/end nodes not matched to any loop.
+        Begin/End nodes of nested loops are shown in their parent loop graph.
+        """
         self.begin_end_nodes = []
+        nested = set()
+        for loop in self.loopList:
+            if loop["parent"] is not None:
+                nested.add(loop["end"])
+                nested.update(loop["begins"])
         # if node type is block_begin or block_end, add it to the list
         for gNode in self.gNodes.values():
-            if gNode.getType() in ["block_begin", "block_end"]:
+            if gNode.getType() in ["block_begin", "block_end"] and gNode.getPath() not in nested:
                 self.begin_end_nodes.append(gNode.getPath())    
         return self.begin_end_nodes
 
+    def reachable(self, start_nodes, downstream, stop_nodes):
+        """
+        Returns the set of nodes reachable from start_nodes, following outputs (downstream) or inputs.
+        Nodes in stop_nodes are reached but not expanded.
+        """
+        visited = set(start_nodes)
+        stack = list(start_nodes)
+        while stack:
+            current_path = stack.pop()
+            if current_path in stop_nodes and current_path not in start_nodes:
+                continue
+            gNode = self.gNodes[current_path]
+            nextNodes = gNode.getOutputs() if downstream else gNode.getInputs()
+            for next_path in nextNodes:
+                if next_path and next_path in self.gNodes and next_path not in visited:
+                    visited.add(next_path)
+                    stack.append(next_path)
+        return visited
+
     def getLoopNodes(self, begin_nodes, end_node):
-        loopNodes = []
-        # For each node in the graph, traverse upstream through its inputs.
-        for node_path in self.gNodes:
-            visited = set()
-            stack = [node_path]
-            is_loop_node = False
-            while stack:
-                current_path = stack.pop()
-                if current_path in visited:
-                    continue
-                visited.add(current_path)
-                # If we've reached one of the begin nodes, mark this as a loop node.
-                if current_path in begin_nodes:
-                    is_loop_node = True
-                    break
-                # Stop if the end_node is encountered
-                if current_path == end_node:
-                    is_loop_node = False
-                    break
-                # Add all valid input nodes to the stack.
-                # self.hdaSettings.consoleLogDebug(f"============ NodeGraph.getLoopNodes: {current_path}")
-                gNode = self.gNodes[current_path]
-                for inp in gNode.getInputs():
-                    if inp:
-                        stack.append(inp)
-            if is_loop_node:
-                loopNodes.append(node_path)
-                gNode = self.gNodes[node_path]
-                gNode.update(in_loop=True, loop_id=end_node)
-        # add the end node to the loop nodes
-        gNode = self.gNodes[end_node]
-        gNode.update(in_loop=True, loop_id=end_node)
+        """
+        Loop nodes are downstream of the begin nodes and upstream of the end node,
+        computed as the intersection of both reachable sets, in O(N+E) per loop.
+        The end node is always last.
+        """
+        forward = self.reachable(begin_nodes, True, {end_node})
+        backward = self.reachable([end_node], False, set(begin_nodes))
+        loopNodes = [node_path for node_path in self.gNodes
+                     if node_path != end_node and (node_path in begin_nodes or (node_path in forward and node_path in backward))]
         loopNodes.append(end_node)
         return loopNodes
 
     def findGraphLoops(self):
-        # find all nodes with type endLoop
-        end_nodes = self.get_end_loops()
-        # For each end loop, extract Loop
+        """
+        Finds all loops and builds their nesting tree.
+        self.loopList holds one dict per loop (end, begins, members, parent, children),
+        self.graphLoops holds the nodes of each loop unit, children before parents.
+        A loop unit contains its own nodes and the begin/end nodes of its direct child loops.
+        """
+        begin_index = self.index_begin_nodes()
+        self.loopList = []
+        for end_node in self.get_end_loops():
+            begin_nodes = self.get_begin_nodes(end_node, begin_index)
+            members = self.getLoopNodes(begin_nodes, end_node)
+            self.loopList.append({"end": end_node, "begins": begin_nodes, "members": members,
+                                  "member_set": set(members), "parent": None, "children": []})
+        # parent of a loop is the smallest other loop containing its end node
+        for loop in self.loopList:
+            parents = [other for other in self.loopList
+                       if other is not loop and loop["end"] in other["member_set"] and len(other["members"]) > len(loop["members"])]
+            if parents:
+                loop["parent"] = min(parents, key=lambda other: len(other["members"]))
+                loop["parent"]["children"].append(loop)
+        # flag nodes, inner loops last so each node keeps its innermost loop
+        for loop in sorted(self.loopList, key=lambda l: len(l["members"]), reverse=True):
+            for node_path in loop["members"]:
+                self.gNodes[node_path].update(in_loop=True, loop_id=loop["end"])
+        # loop units in post order: nested loops are defined before the loops using them
         self.graphLoops = []
-        for end_node in end_nodes:
-            # find foreach nodes
-            begin_nodes = self.get_begin_nodes(end_node)
-            # find all nodes that are connected upstream to foreach nodes
-            loopNodes = self.getLoopNodes(begin_nodes,end_node)
-            self.graphLoops.append(loopNodes)
+        self.loopUnits = []
+        def addLoopUnit(loop):
+            for child in loop["children"]:
+                addLoopUnit(child)
+            nested = set()
+            markers = set()
+            for child in loop["children"]:
+                nested.update(child["member_set"])
+                markers.add(child["end"])
+                markers.update(child["begins"])
+            unitNodes = [node_path for node_path in loop["members"] if node_path not in nested or node_path in markers]
+            self.graphLoops.append(unitNodes)
+            self.loopUnits.append(loop)
+        self.loopTree = [loop for loop in self.loopList if loop["parent"] is None]
+        for loop in self.loopTree:
+            addLoopUnit(loop)
         self.noLoopNodes = [gNode.getPath() for gNode in self.gNodes.values() if not gNode.inLoop()]
 
-    def buildLoopGraphFromNodes(self, graph, nodes,i):
+    def buildLoopGraphFromNodes(self, graph, nodes, i, loop=None):
         """
         Build a graph from a list of nodes.
         This is a self contained graph, not taking in consideration edges going out or coming in the network.
         Because tese edges will be handled from outside
+        loop is the loop dict from findGraphLoops, the begin/end nodes of its nested loops are kept in the branches
+        (they stand for the nested loop units), but they are not rendered as nodes of this graph.
         """
-        self.gNodes = {}
-        self.edges = []
+        own_nodes = None
+        nested_ends = set()
+        if loop is not None:
+            own_nodes = set(loop["begins"])
+            own_nodes.add(loop["end"])
+            nested_ends = {child["end"] for child in loop["children"]}
+            self.nestedLoopNodes = [node_path for child in loop["children"] for node_path in child["begins"] + [child["end"]]]
+        self.gNodes = NodeView(graph.gNodes, nodes)
+        self.edges = EdgeIndex()
         nameListEnd = []
         nameListBegin = []
         self.is_loop_graph = True
         self.loop_id = i
         self.loop_end = ""
-        for nodePath in nodes:
-            # get copy of node from original graph
-            gNode = graph.get_node(nodePath).copy()            
-            self.gNodes[nodePath] = gNode
-            if gNode.getType() == "block_end":
+        for nodePath in self.gNodes:
+            # nodes are shared with the original graph
+            gNode = self.gNodes[nodePath]
+            is_own_node = own_nodes is None or nodePath in own_nodes
+            if gNode.getType() == "block_end" and is_own_node:
                 nameListEnd.append(gNode.getName())
                 self.loop_end = nodePath
-            if gNode.getType() == "block_begin":
+            if gNode.getType() == "block_begin" and is_own_node:
                 nameListBegin.append(gNode.getName())
+            # the inputs of a nested loop end are inside the nested loop unit
+            if nodePath in nested_ends:
+                continue
             # loop on node inputs only, if input is coming from outside the node list then ignore it
             for inp in gNode.getInputs():
                 self.add_edge(inp, gNode.getPath()) # will add edges even if from outside loop, for clarity
@@ -485,15 +797,14 @@ class NodeGraph:
         """
         Build a graph from a list of nodes.
         """
-        self.name = graph.name
         # hda.HDAManager().consoleLogDebug(f"============= NodeGraph.buildGraphFromNodes: {self.name} {nodes}")    
         # hda.HDAManager().consoleLogDebug(f"============= NodeGraph.buildGraphFromNodes: {self.name} {begin_end_nodes}")    
-        all_nodes = nodes + begin_end_nodes
-        hda.HDAManager().consoleLogDebug(f"============= NodeGraph.buildGraphFromNodes: {self.name} {len(all_nodes)}")
+        self.gNodes = NodeView(graph.gNodes, nodes + begin_end_nodes)
+        all_nodes = self.gNodes
+        self.hdaSettings.consoleLogDebug(f"============= NodeGraph.buildGraphFromNodes: {self.name} {len(all_nodes)}")
         for nodeName in all_nodes:
-            # get copy of node from original graph
-            gNode = graph.get_node(nodeName).copy()
-            self.gNodes[nodeName] = gNode
+            # nodes are shared with the original graph
+            gNode = self.gNodes[nodeName]
             # loop on node inputs only, if input is coming from outside the node list then ignore it
             for inp in gNode.getInputs():
                 if inp in all_nodes and gNode.getType() != "block_end":
@@ -514,14 +825,18 @@ class NodeGraph:
     def getNodesRenderData(self,isLoop):
         # loop on all nodes and get their render data
         nodesRenderData = []
+        nestedLoopNodes = set(self.nestedLoopNodes)
         for nodePath in self.gNodes:
+            gNode = self.get_node(nodePath)
             # TODO: check this logic: if we have multiple nodes with reference, keep only the original one
-            if "@" in nodePath:
+            if gNode.isReference():
                 continue
             # this condition happens in case of loop graph only
             if nodePath == self.loop_end: # skip loop end node
                 continue
-            gNode = self.get_node(nodePath)
+            # defined by the nested loop unit, the branches refer to it
+            if nodePath in nestedLoopNodes:
+                continue
             if "houdini_2_chat" in gNode.getType():
                 if not self.hdaSettings.exportThisNode:
                     continue
@@ -564,8 +879,9 @@ class NodeGraph:
         props = gNode.getHProps()
         loop_data = {
             "loopName": self.name,
+            "notes": self.notes,
             "beginNodes": ", ".join(self.begin_nodes),
-            "endNode": "\"" + gNode.getName().split('/')[-1].split('@')[0] + "\"," ,
+            "endNode": "\"" + gNode.getName() + "\"," ,
             "iterationMethod": self.renderParmValue(props["itermethod"]),
             "iterationMethodVal": props["itermethod"]["value"],
             "gatherMethod": self.renderParmValue(props["method"]),
@@ -590,36 +906,18 @@ class NodeGraph:
             for branchNode in branch:
                 gNode = self.get_node(branchNode)
                 branchNodes.append({
-                    "name": gNode.getName().split('@')[0],
+                    "name": gNode.getName(),
                     "type": gNode.getType()
                 })
             branchesRenderData.append(branchNodes)
-        return branchesRenderData    
-        
-def serialize_value(val):
-    if isinstance(val, hou.Ramp):
-        try:
-            interp = val.interpolation()
-        except AttributeError:
-            interp = None
-        points = []
-        try:
-            num_points = val.numPoints()
-            for i in range(num_points):
-                pt = val.point(i)
-                points.append({
-                    "position": pt.position(),
-                    "value": pt.value(),
-                    "tangentIn": pt.tangentIn(),
-                    "tangentOut": pt.tangentOut()
-                })
-        except AttributeError:
-            points = str(val)
-        return {"interpolation": interp, "points": points}
-    elif isinstance(val, (hou.Vector2, hou.Vector3, hou.Vector4)):
-        return list(val)
-    elif isinstance(val, tuple):
-        return list(val)
-    elif isinstance(val, (int, float, str, bool)) or val is None:
-        return val
-    return str(val)
\ No newline at end of file
+        return branchesRenderData
+
+    def getCycleRenderData(self):
+        # cyclic units are rendered like branches, the first node follows the last one
+        cyclesRenderData = []
+        for cycle in self.cycles:
+            cyclesRenderData.append([{
+                "name": self.get_node(node_path).getName(),
+                "type": self.get_node(node_path).getType()
+            } for node_path in cycle])
+        return cyclesRenderData
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+
+class OutputWriter:
+    """
+    Keeps the export folder in sync through a manifest of the files written by the exports
+    (filename -> content hash, owner unit, size and modification time).
+    A file is only replaced when its content changed, by renaming a complete temporary file over it,
+    and at the end of an export only the files of the previous exports that were not written again are deleted.
+    Files not in the manifest (written by the user or other tools) are never touched.
+    Unique filenames are allocated from an in-memory index of the names taken, without probing the disk.
+    The manifest and the other bookkeeping files of the exports (cache, profile) live in the hidden STATE_FOLDER of the root.
+    """
+    STATE_FOLDER = ".houdini2chat"
+    MANIFEST = "manifest.json"
+    # temporary files of the exports are named TEMP_PREFIX...TEMP_SUFFIX, so other tools' files are never removed
+    TEMP_PREFIX = ".houdini2chat-"
+    TEMP_SUFFIX = ".partial"
+    VERSION = 1
+    _active = None
+
+    def __init__(self, root, scopeFolders=(), hdaSettings=None):
+        self.root = os.path.abspath(root)
+        self.scopeFolders = {os.path.abspath(folder) for folder in scopeFolders} # folders synced by this export
+        self.hdaSettings = hdaSettings
+        self.lock = threading.Lock()
+        self.manifest = {} # path relative to root -> entry, files of the previous exports
+        self.written = {} # path relative to root -> entry, files of this export
+        self.taken = {} # folder -> names taken in the folder by this export and by files outside the manifest
+        self.counters = {} # filename -> last unique counter used for it
+        self.stats = {"written": 0, "unchanged": 0, "deleted": 0}
+        self.load()
+
+    @staticmethod
+    def start(root, scopeFolders=(), hdaSettings=None):
+        OutputWriter._active = OutputWriter(root, scopeFolders, hdaSettings)
+        OutputWriter._active.remove_partials()
+        return OutputWriter._active
+
+    @staticmethod
+    def current():
+        return OutputWriter._active
+
+    @staticmethod
+    def state_folder(root):
+        return os.path.join(os.path.abspath(root), OutputWriter.STATE_FOLDER)
+
+    @staticmethod
+    def temp_filename(folder, name):
+        return os.path.join(folder, OutputWriter.TEMP_PREFIX + name + OutputWriter.TEMP_SUFFIX)
+
+    def relative(self, filename):
+        return os.path.relpath(os.path.abspath(filename), self.root).replace(os.sep, "/")
+
+    def absolute(self, relative):
+        return os.path.join(self.root, *relative.split("/"))
+
+    def load(self):
+        filename = os.path.join(OutputWriter.state_folder(self.root), OutputWriter.MANIFEST)
+        try:
+            with open(filename, "r") as f:
+                data = json.load(f)
+            if data.get("version") == OutputWriter.VERSION:
+                self.manifest = data["files"]
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+        # no manifest yet: the .py files of the synced folders are adopted, as the old export cleaned them
+        for folder in self.scopeFolders:
+            if os.path.isdir(folder):
+                for name in os.listdir(folder):
+                    if name.endswith(".py"):
+                        self.manifest[self.relative(os.path.join(folder, name))] = {"hash": None, "owner": None}
+
+    def save(self):
+        stateFolder = OutputWriter.state_folder(self.root)
+        filename = os.path.join(stateFolder, OutputWriter.MANIFEST)
+        os.makedirs(stateFolder, exist_ok=True)
+        tempFilename = OutputWriter.temp_filename(stateFolder, OutputWriter.MANIFEST)
+        with open(tempFilename, "w") as f:
+            json.dump({"version": OutputWriter.VERSION, "files": self.manifest}, f, indent=1, sort_keys=True)
+        os.replace(tempFilename, filename)
+
+    def remove_partials(self):
+        # temporary files left by an interrupted export
+        for folder in self.scopeFolders | {self.root, OutputWriter.state_folder(self.root)}:
+            if os.path.isdir(folder):
+                for name in os.listdir(folder):
+                    if name.startswith(OutputWriter.TEMP_PREFIX) and name.endswith(OutputWriter.TEMP_SUFFIX):
+                        os.remove(os.path.join(folder, name))
+
+    def get_taken(self, folder):
+        taken = self.taken.get(folder)
+        if taken is None:
+            # listed once per folder: files outside the manifest, or outside the synced folders, keep their name
+            names = os.listdir(folder) if os.path.isdir(folder) else []
+            synced = folder in self.scopeFolders
+            taken = {name for name in names if not synced or self.relative(os.path.join(folder, name)) not in self.manifest}
+            self.taken[folder] = taken
+        return taken
+
+    def allocate(self, filename):
+        """
+        Returns filename, or filename with a numeric counter suffix if the name is already taken.
+        """
+        folder, name = os.path.split(os.path.abspath(filename))
+        taken = self.get_taken(folder)
+        if name in taken:
+            base, ext = os.path.splitext(name)
+            counter = self.counters.get(filename, 0) + 1
+            while f"{base}_{counter}{ext}" in taken:
+                counter += 1
+            self.counters[filename] = counter
+            name = f"{base}_{counter}{ext}"
+        taken.add(name)
+        return os.path.join(folder, name)
+
+    def unchanged(self, relative, filename, contentHash):
+        entry = self.manifest.get(relative)
+        if entry is None or entry.get("hash") != contentHash:
+            return False
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+        # a file edited since the last export is written again
+        return stat.st_size == entry.get("size") and stat.st_mtime_ns == entry.get("mtime_ns")
+
+    def commit(self, tempFilename, filename, contentHash, owner, text=None):
+        """
+        Moves the complete temporary file to a unique name allocated from filename, unless the file
+        already holds the same content. Returns the final filename.
+        Without tempFilename the file content is text, only written if the file changed.
+        """
+        with self.lock:
+            filename = self.allocate(filename)
+            relative = self.relative(filename)
+            if self.unchanged(relative, filename, contentHash):
+                if tempFilename is not None:
+                    os.remove(tempFilename)
+                self.stats["unchanged"] += 1
+            else:
+                if tempFilename is None:
+                    tempFilename = OutputWriter.temp_filename(os.path.dirname(filename), os.path.basename(filename))
+                    with open(tempFilename, "w") as f:
+                        f.write(text)
+                os.replace(tempFilename, filename)
+                self.stats["written"] += 1
+            stat = os.stat(filename)
+            self.written[relative] = {"hash": contentHash, "owner": owner, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            return filename
+
+    def finish(self, deleteOrphans=True):
+        """
+        Deletes the files of the previous exports in the synced folders that this export did not write,
+        then saves the manifest.
+        """
+        with self.lock:
+            manifest = {}
+            for relative, entry in self.manifest.items():
+                if relative in self.written:
+                    continue
+                filename = self.absolute(relative)
+                if deleteOrphans and os.path.dirname(filename) in self.scopeFolders:
+                    if os.path.exists(filename):
+                        os.remove(filename)
+                    self.stats["deleted"] += 1
+                else:
+                    manifest[relative] = entry
+            manifest.update(self.written)
+            self.manifest = manifest
+            self.save()
+        if OutputWriter._active is self:
+            OutputWriter._active = None
+        if self.hdaSettings is not None:
+            self.hdaSettings.consoleLogDebug(f"===== OutputWriter.finish: {self.stats}")
+        return self.stats
@@ -2,33 +2,244 @@ import hou
 import jinja2
 import os
 import hda_manager as hda
+import render_pool as rp
+import template_compiler as tc
+import export_profiler as prof
+import output_writer as ow
 import re
+import hashlib
+import threading
+import contextlib
+import itertools
+
+class TemplateCache:
+    """
+    Process wide cache of the jinja2 Environment, the compiled templates and their modules.
+    The cache is keyed on the HDA definition modification time and a hash of the template sections,
+    so editing a section in Type Properties invalidates it on the next export.
+    Templates are created from the precompiled bundle (see template_compiler) when their source hash matches it.
+    """
+    _lock = threading.RLock()
+    _signature = None
+    _sources = {}
+    _definition = None
+    _env = None
+    _loader = None
+    _templates = {}
+    _modules = {}
+    _renderPoolModule = None # source of the render_pool section, sent to the render pool workers
+    _checked = False # signature is checked once per export, see invalidateCheck()
+    compileCount = 0 # number of templates compiled by this process
+    precompiledCount = 0 # number of templates loaded from the precompiled bundle by this process
+
+    @staticmethod
+    def get_definition():
+        # definition given by the export (see invalidateCheck), or the one of the current node
+        if TemplateCache._definition is not None:
+            return TemplateCache._definition
+        try:
+            return hou.pwd().type().definition()
+        except (AttributeError, hou.Error):
+            return None
+
+    @staticmethod
+    def read_sources():
+        """
+        Returns a dictionary of all jinja templates stored in the HDA sections.
+        """
+        sources = {}
+        definition = TemplateCache.get_definition()
+        if definition is not None:
+            for name, section in definition.sections().items():
+                if name.endswith(".j2"):
+                    sources[name] = section.contents()
+        else:
+            # no definition known, "." is the type of the current node
+            for name in RenderManager.TEMPLATE_NAMES:
+                sources[name] = hou.readFile(f"opdef:.?{name}")
+        return sources
+
+    @staticmethod
+    def read_render_pool_module():
+        definition = TemplateCache.get_definition()
+        if definition is not None and "render_pool" in definition.sections():
+            return definition.sections()["render_pool"].contents()
+        return None
+
+    @staticmethod
+    def read_bundle():
+        """
+        Returns the build of the precompiled templates stored with the HDA for the running jinja version, or None.
+        """
+        definition = TemplateCache.get_definition()
+        if definition is not None:
+            section = definition.sections().get(tc.BUNDLE_NAME)
+            text = section.contents() if section is not None else None
+        else:
+            try:
+                text = hou.readFile(f"opdef:.?{tc.BUNDLE_NAME}")
+            except hou.Error:
+                text = None
+        if not text:
+            return None
+        bundle = tc.parse_bundle(text)
+        build = tc.get_build(bundle) if bundle is not None else None
+        if build is None:
+            builds = ", ".join(sorted(bundle["builds"])) if bundle is not None else "none readable"
+            hda.HDAManager.current().consoleLogWarning(
+                f"===== TemplateCache: the precompiled templates do not match jinja2 {jinja2.__version__} "
+                f"(builds: {builds}), the templates are compiled from their source")
+        return build
+
+    @staticmethod
+    def build_signature(sources):
+        definition = TemplateCache.get_definition()
+        sectionHash = hashlib.sha1()
+        for name in sorted(sources):
+            sectionHash.update(name.encode("utf-8"))
+            sectionHash.update(sources[name].encode("utf-8"))
+        modificationTime = definition.modificationTime() if definition is not None else None
+        return (modificationTime, sectionHash.hexdigest())
+
+    @staticmethod
+    def invalidateCheck(definition=None):
+        """
+        Forces the next lookup to compare the cache signature against the HDA sections.
+        definition is the HDA definition holding the templates, needed when hou.pwd() is not the HDA node
+        (ex. exports run from the event loop by watch mode).
+        """
+        with TemplateCache._lock:
+            TemplateCache._checked = False
+            if definition is not None:
+                TemplateCache._definition = definition
+
+    @staticmethod
+    def validate():
+        with TemplateCache._lock:
+            if TemplateCache._checked and TemplateCache._env is not None:
+                return
+            with prof.stage("template_load"):
+                sources = TemplateCache.read_sources()
+                signature = TemplateCache.build_signature(sources)
+                if signature != TemplateCache._signature:
+                    TemplateCache._signature = signature
+                    TemplateCache._sources = sources
+                    TemplateCache._loader = tc.PrecompiledLoader(sources, TemplateCache.read_bundle())
+                    TemplateCache._env = jinja2.Environment(loader=TemplateCache._loader)
+                    TemplateCache._templates = {}
+                    TemplateCache._modules = {}
+                    TemplateCache._renderPoolModule = TemplateCache.read_render_pool_module()
+                TemplateCache._checked = True
+
+    @staticmethod
+    def get_signature():
+        with TemplateCache._lock:
+            TemplateCache.validate()
+            return TemplateCache._signature
+
+    @staticmethod
+    def get_sources():
+        # template sources of the cache, sent to the render pool workers
+        with TemplateCache._lock:
+            TemplateCache.validate()
+            return dict(TemplateCache._sources)
+
+    @staticmethod
+    def get_render_pool_module():
+        with TemplateCache._lock:
+            TemplateCache.validate()
+            return TemplateCache._renderPoolModule
+
+    @staticmethod
+    def get_template(template_name):
+        with TemplateCache._lock:
+            TemplateCache.validate()
+            template = TemplateCache._templates.get(template_name)
+            if template is None:
+                precompiled = TemplateCache._loader.precompiled
+                with prof.stage("template_load"):
+                    template = TemplateCache._env.get_template(template_name)
+                TemplateCache._templates[template_name] = template
+                if TemplateCache._loader.precompiled > precompiled:
+                    TemplateCache.precompiledCount += 1
+                    prof.count("template_load", "precompiled")
+                else:
+                    TemplateCache.compileCount += 1
+                prof.count("template_load", "templates")
+            return template
+
+    @staticmethod
+    def get_module(template_name):
+        """
+        Returns the template module (macros) of a template, created once per compiled template.
+        """
+        with TemplateCache._lock:
+            module = TemplateCache._modules.get(template_name)
+            if module is None:
+                module = TemplateCache.get_template(template_name).module
+                TemplateCache._modules[template_name] = module
+            return module
 
 class RenderManager:
-    def __init__(self):
-        self.hda_settings = hda.HDAManager()
+    # Templates stored in the HDA sections
+    TEMPLATE_NAMES = [
+        "branches_unit.py.j2",
+        "general_macros.py.j2",
+        "loop_branches.py.j2",
+        "loop_unit.py.j2",
+        "network_full.py.j2",
+        "network_unit.py.j2",
+        "nodes_unit.py.j2"
+    ]
+
+    # per thread list of the files to save, see deferWrites
+    _deferred = threading.local()
+    # per thread list of the files written, see recordOutputs
+    _recorded = threading.local()
+    WRITE_BUFFER = 1 << 20 # buffer of the output files, written chunk by chunk
+    _tempCounter = itertools.count() # names of the temporary output files, unique in this process
+
+    def __init__(self, hda_settings=None):
+        self.hda_settings = hda_settings if hda_settings else hda.HDAManager.current()
 
     @staticmethod
-    def ensure_unique_filename(txtFilename):
+    @contextlib.contextmanager
+    def deferWrites():
         """
-        Appends a numeric counter suffix to txtFilename until a unique filename is found.
-        
-        Parameters:
-            txtFilename (str): The original filename.
-            
-        Returns:
-            str: A unique filename.
-        """
-        if os.path.exists(txtFilename):
-            base, ext = os.path.splitext(txtFilename)
-            counter = 1
-            newFilename = f"{base}_{counter}{ext}"
-            while os.path.exists(newFilename):
-                counter += 1
-                newFilename = f"{base}_{counter}{ext}"
-            return newFilename
-        return txtFilename
-    
+        Collects the files saved by the current thread instead of naming them: their text is streamed
+        to temporary files, moved to their final filename later by write_deferred, in a deterministic order.
+        """
+        pending = []
+        RenderManager._deferred.pending = pending
+        try:
+            yield pending
+        finally:
+            RenderManager._deferred.pending = None
+
+    def write_deferred(self, pending):
+        for tempFilename, nodeName, metadata, contentHash, text in pending:
+            self.finish_output(tempFilename, nodeName, metadata, contentHash, text)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def recordOutputs(files):
+        """
+        Appends (nodeName, metadata, contentHash, text) to files for each file started by the current thread
+        in the block, so the output can be restored later without rendering it again (see restore_output).
+        """
+        previous = getattr(RenderManager._recorded, "files", None)
+        RenderManager._recorded.files = files
+        try:
+            yield files
+        finally:
+            RenderManager._recorded.files = previous
+
+    @staticmethod
+    def drain(chunks):
+        # consumes a stream for its side effects (the files it writes)
+        for _ in chunks:
+            pass
+
     @staticmethod    
     def has_macro(template, node):
         """
@@ -38,27 +249,20 @@ class RenderManager:
         replacing "::" with "_" (e.g.: "kinefx::skeleton" becomes "kinefx_skeleton").
         """
         macro_name = node["type"].lower().replace("::", "_")
-        return hasattr(template.module, macro_name)    
+        return hasattr(TemplateCache.get_module(template.name), macro_name)
 
-    def get_embedded_templates(self):
+    @staticmethod
+    def get_macro_names():
         """
-        Retrieves all embedded templates as a dictionary mapping template names to their contents.
-        For this example, we're using a predefined list of template names.
-        In your HDA, you may store the list of embedded templates in a parameter.
+        Returns the names of the node macros defined in nodes_unit.py.j2 (ex. "attribwrangle").
         """
-        templates = {}
-        embedded_template_names = [
-            "branches_unit.py.j2",
-            "loop_branches.py.j2"
-        ]
-        for tmpl_name in embedded_template_names:
-            tmpl_string = hou.readFile(f"opdef:.?{tmpl_name}")
-            templates[tmpl_name] = tmpl_string
-        return templates
+        module = TemplateCache.get_module("nodes_unit.py.j2")
+        return {name for name in vars(module) if not name.startswith("_")}
 
     def load_template(self, template_name):
         """
         Loads a Jinja2 template given the template name.
+        Templates are compiled once and shared through the TemplateCache.
         
         Parameters:
             template_name (str): The name of the template file (e.g., "network_unit.py.j2")
@@ -66,20 +270,7 @@ class RenderManager:
         Returns:
             jinja2.Template: The loaded Jinja2 template.
         """
-        # template_path = os.path.join(os.path.dirname(__file__), "templates")
-        # env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_path))
-        # print(f"Loading template: {template_name} from {template_path}")
-        # return env.get_template(template_name)
-        # get file content for the main template from Houdini
-        main_template_string = hou.readFile(f"opdef:.?{template_name}")
-        # Retrieve all embedded templates from the HDA parameters or fixed list
-        embedded_templates = self.get_embedded_templates()
-        # Ensure the main template is also present
-        embedded_templates[template_name] = main_template_string
-        # Create a Jinja2 environment with a DictLoader to resolve includes
-        env = jinja2.Environment(loader=jinja2.DictLoader(embedded_templates))
-        template = env.get_template(template_name)
-        return template        
+        return TemplateCache.get_template(template_name)
 
     def render_node_with_macro(self, template, node):
         """
@@ -93,7 +284,7 @@ class RenderManager:
         # Build macro name based on node type.
         macro_name = node["type"].lower().replace("::", "_")
         # Access the module with rendered macros.
-        tmpl_module = template.module
+        tmpl_module = TemplateCache.get_module(template.name)
 
         if hasattr(tmpl_module, macro_name):
             render_macro = getattr(tmpl_module, macro_name)
@@ -101,17 +292,15 @@ class RenderManager:
             render_macro = getattr(tmpl_module, "default")
         return render_macro(node)
     
+    @staticmethod
+    def get_unit_renderer():
+        """
+        Returns a render_pool.UnitRenderer on the cached templates, the same rendering as the render pool workers.
+        """
+        return rp.UnitRenderer(TemplateCache.get_template, TemplateCache.get_module)
+
     def render_nodes(self, nodes):
-        template = self.load_template("nodes_unit.py.j2")  # use your load_template function
-        rendered_nodes = []
-        for node in nodes:
-            # TODO: if node has no changed properties, but we have a template for it, we will miss it here
-            changed = any(prop["changed"] for prop in node["properties"].values())
-            has_inputs = node["inputs"] is not None
-            has_special_macro = RenderManager.has_macro(template, node)
-            if changed or has_inputs or has_special_macro:
-                rendered_nodes.append(self.render_node_with_macro(template, node))
-        return "\n".join(rendered_nodes)
+        return RenderManager.get_unit_renderer().render_nodes(nodes)
 
     def buildFilename(self, nodePath, metadata):
         # Choose file format string based on render type
@@ -140,22 +329,118 @@ class RenderManager:
         # Replace any [token] with its value from metadata or _NONE_ if not found.
         filename = re.sub(r"\[([^\]]+)\]", replace_token, format_str)
         filename = sanitize_string(filename)
+        # a unique name is allocated from it when the file is saved, see output_writer.OutputWriter
         txtFilename = os.path.join(self.hda_settings.getSavePath(nodePath), filename)
-    
-        txtFilename = RenderManager.ensure_unique_filename(txtFilename)
-    
         return txtFilename
 
+    def open_output(self, nodeName):
+        """
+        Opens a buffered temporary file in the save folder of nodeName, returns (filename, file).
+        Temporary files left by an interrupted export are removed by the next one (see output_writer.OutputWriter).
+        """
+        folder = self.hda_settings.getSavePath(nodeName)
+        os.makedirs(folder, exist_ok=True)
+        # created with open() rather than tempfile.mkstemp, so the file gets the same permissions (umask) as any other output
+        while True:
+            tempFilename = ow.OutputWriter.temp_filename(folder, f"{os.getpid()}_{next(RenderManager._tempCounter)}")
+            try:
+                return tempFilename, open(tempFilename, "x", buffering=RenderManager.WRITE_BUFFER)
+            except FileExistsError:
+                continue # left by another process with the same pid
+
+    @staticmethod
+    def get_owner(nodeName, metadata):
+        # unit owning an output file, recorded in the manifest of the export folder
+        owner = f"{metadata['render.type']}:{nodeName}"
+        return owner + "/" + metadata["netbox.name"] if "netbox.name" in metadata else owner
+
+    def finish_output(self, tempFilename, nodeName, metadata, contentHash, text=None):
+        # the filename is chosen once the file is complete, so unique suffixes follow the completion order
+        # a restored file has no temporary file, its text is only written if the file changed on disk
+        prof.count("file_io", "files")
+        if tempFilename is not None:
+            prof.count("file_io", "output_bytes", os.path.getsize(tempFilename))
+        writer = ow.OutputWriter.current()
+        oneShot = writer is None
+        if oneShot:
+            writer = ow.OutputWriter(self.hda_settings.projectLocation, hdaSettings=self.hda_settings)
+        txtFilename = writer.commit(tempFilename, self.buildFilename(nodeName, metadata), contentHash,
+                                    RenderManager.get_owner(nodeName, metadata), text)
+        if oneShot:
+            writer.finish(deleteOrphans=False)
+        self.hda_settings.consoleLog(f"=========== RenderManager.save_rendered_output Saving Unit {nodeName} to {txtFilename}", hda.TYPES.INFO)
+
+    def stream_rendered_output(self, chunks, nodeName, metadata):
+        """
+        Writes the rendered chunks to the file of nodeName as they come, and yields them for the enclosing document.
+        The file is saved once the stream is exhausted, the stream must be consumed (see drain).
+        """
+        recorded = getattr(RenderManager._recorded, "files", None)
+        text = [] if recorded is not None else None
+        tempFilename, f = self.open_output(nodeName)
+        contentHash = hashlib.sha1()
+        try:
+            with f:
+                for chunk in chunks:
+                    with prof.stage("file_io"):
+                        f.write(chunk)
+                        contentHash.update(chunk.encode("utf-8"))
+                    if text is not None:
+                        text.append(chunk)
+                    yield chunk
+        except BaseException:
+            os.remove(tempFilename)
+            raise
+        if recorded is not None:
+            recorded.append((nodeName, metadata, contentHash.hexdigest(), "".join(text)))
+        self.queue_output(tempFilename, nodeName, metadata, contentHash.hexdigest(), None)
+
+    def queue_output(self, tempFilename, nodeName, metadata, contentHash, text):
+        pending = getattr(RenderManager._deferred, "pending", None)
+        if pending is not None:
+            pending.append((tempFilename, nodeName, metadata, contentHash, text))
+        else:
+            self.finish_output(tempFilename, nodeName, metadata, contentHash, text)
+
+    def restore_output(self, nodeName, metadata, contentHash, text):
+        """
+        Saves a file recorded by recordOutputs, in place of rendering it again.
+        The file is left as is when it still holds the same content (see output_writer.OutputWriter.commit).
+        """
+        self.queue_output(None, nodeName, metadata, contentHash, text)
+
     def save_rendered_output(self, rendered_text, nodeName, metadata):
         """
         Saves the rendered text to a file located at the project location defined by
         the HDA parent node.
         """
-        txtFilename = self.buildFilename(nodeName, metadata)        
-        with open(txtFilename, 'w') as f:
-            self.hda_settings.consoleLog(f"=========== RenderManager.save_rendered_output Saving Unit {nodeName} to {txtFilename}", hda.TYPES.INFO)
-            f.write(rendered_text)
-            
+        RenderManager.drain(self.stream_rendered_output([rendered_text], nodeName, metadata))
+
+    def spool(self, chunks, nodeName):
+        """
+        Writes a stream to a temporary file in the save folder of nodeName, to be read back later with read_spool.
+        """
+        tempFilename, f = self.open_output(nodeName)
+        with f:
+            for chunk in chunks:
+                with prof.stage("file_io"):
+                    f.write(chunk)
+        return tempFilename
+
+    @staticmethod
+    def read_spool(tempFilename):
+        # yields the text of a spooled stream by buffer sized chunks, the file is deleted once read
+        try:
+            with open(tempFilename, "r") as f:
+                while True:
+                    with prof.stage("file_io"):
+                        chunk = f.read(RenderManager.WRITE_BUFFER)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            os.remove(tempFilename)
+
     # def save_all_nodes(self, rendered_text, metadata):       
     #    txtFilename = os.path.join(self.hda_settings.projectLocation, self.hda_settings.defaultFileFormat)
     #    txtFilename = RenderManager.ensure_unique_filename(txtFilename)
@@ -0,0 +1,185 @@
+import os
+import sys
+import pickle
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import jinja2
+
+class UnitRenderer:
+    """
+    Renders graph units from plain render payloads (see main.getUnitPayload), no hou needed.
+    Used in process with the TemplateCache templates, and in the RenderPool workers with their own templates.
+    """
+    UNIT_TEMPLATES = {
+        "network": "network_unit.py.j2",
+        "loop": "loop_unit.py.j2"
+    }
+    NODES_TEMPLATE = "nodes_unit.py.j2"
+
+    def __init__(self, getTemplate, getModule):
+        self.getTemplate = getTemplate # template name -> jinja2.Template
+        self.getModule = getModule # template name -> template module (macros)
+
+    @staticmethod
+    def fromSources(sources):
+        """
+        Renderer over its own jinja2 Environment, for processes without Houdini (sources: template name -> text).
+        """
+        env = jinja2.Environment(loader=jinja2.DictLoader(sources))
+        modules = {}
+        def getModule(template_name):
+            if template_name not in modules:
+                modules[template_name] = env.get_template(template_name).module
+            return modules[template_name]
+        return UnitRenderer(env.get_template, getModule)
+
+    @staticmethod
+    def macro_name(node):
+        # ex. "kinefx::skeleton" -> "kinefx_skeleton"
+        return node["type"].lower().replace("::", "_")
+
+    def render_node_list(self, nodes):
+        """
+        Returns the rendered text of each node that needs to be rendered: nodes with changed properties,
+        several inputs or a macro of their own. The other nodes are skipped.
+        """
+        module = self.getModule(UnitRenderer.NODES_TEMPLATE)
+        rendered_nodes = []
+        for node in nodes:
+            # TODO: if node has no changed properties, but we have a template for it, we will miss it here
+            changed = any(prop["changed"] for prop in node["properties"].values())
+            has_inputs = node["inputs"] is not None
+            render_macro = getattr(module, UnitRenderer.macro_name(node), None)
+            if changed or has_inputs or render_macro is not None:
+                render_macro = render_macro if render_macro is not None else getattr(module, "default")
+                rendered_nodes.append(render_macro(node))
+        return rendered_nodes
+
+    def render_nodes(self, nodes):
+        return "\n".join(self.render_node_list(nodes))
+
+    def render_unit(self, payload, rendered_nodes=None):
+        """
+        Renders a network or loop unit payload, rendered_nodes is the text of its nodes when rendered apart.
+        """
+        if rendered_nodes is None:
+            rendered_nodes = self.render_nodes(payload["nodes"])
+        template = self.getTemplate(UnitRenderer.UNIT_TEMPLATES[payload["kind"]])
+        return template.render(props=payload["props"], branches=payload["branches"], cycles=payload["cycles"],
+                               rendered_nodes=rendered_nodes)
+
+# renderer of a RenderPool worker process, created once by _init_worker
+_workerRenderer = None
+
+def _init_worker(sources):
+    global _workerRenderer
+    _workerRenderer = UnitRenderer.fromSources(sources)
+
+def _render_task(task):
+    kind, payload, rendered_nodes = task
+    if kind == "nodes":
+        return _workerRenderer.render_node_list(payload)
+    return _workerRenderer.render_unit(payload, rendered_nodes)
+
+class RenderPool:
+    """
+    Renders unit payloads in worker processes, each worker compiles the templates once at startup.
+    Units with more than chunkSize nodes are split: their nodes are rendered in chunks by several workers,
+    then the unit itself is rendered from the joined text, so a single large network still uses all the workers.
+    The results are returned in payload order, the text is the same as the one of UnitRenderer.render_unit.
+
+    Workers are spawned (not forked), the render_pool module must be importable by them: a module created
+    from an HDA section is written to moduleFolder first. In Houdini, executable must be a Python
+    interpreter (ex. hython), not the Houdini application.
+    """
+    def __init__(self, sources, processes, chunkSize=500, executable=None, moduleSource=None, moduleFolder=None):
+        self.sources = dict(sources)
+        self.processes = max(1, int(processes))
+        self.chunkSize = max(1, int(chunkSize))
+        self.executable = executable
+        self.moduleSource = moduleSource
+        self.moduleFolder = moduleFolder
+        self.executor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ensure_importable(self):
+        if getattr(sys.modules.get(__name__), "__file__", None) or not self.moduleSource:
+            return
+        folder = self.moduleFolder or os.path.join(os.path.expanduser("~"), ".houdini2chat")
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.join(folder, "render_pool.py")
+        if not os.path.exists(filename) or open(filename, encoding="utf-8").read() != self.moduleSource:
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(self.moduleSource)
+        # spawned workers start with the sys.path of the parent
+        if folder not in sys.path:
+            sys.path.append(folder)
+
+    def start(self):
+        self.ensure_importable()
+        context = multiprocessing.get_context("spawn")
+        if self.executable:
+            context.set_executable(self.executable)
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context,
+                                            initializer=_init_worker, initargs=(self.sources,))
+        return self
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def render_units(self, payloads):
+        """
+        Renders the unit payloads, returns their texts in payload order.
+        """
+        payloads = list(payloads)
+        futures = [] # one per payload: the unit future, or the list of its node chunk futures
+        for payload in payloads:
+            nodes = payload["nodes"]
+            if len(nodes) <= self.chunkSize:
+                futures.append(self.executor.submit(_render_task, ("unit", payload, None)))
+            else:
+                futures.append([self.executor.submit(_render_task, ("nodes", nodes[start:start + self.chunkSize], None))
+                                for start in range(0, len(nodes), self.chunkSize)])
+        # split units, rendered once all their chunks are back
+        for index, future in enumerate(futures):
+            if isinstance(future, list):
+                rendered_nodes = "\n".join(text for chunk in future for text in chunk.result())
+                unit = dict(payloads[index], nodes=[])
+                futures[index] = self.executor.submit(_render_task, ("unit", unit, rendered_nodes))
+        return [future.result() for future in futures]
+
+def save_payloads(filename, sources, payloads):
+    """
+    Saves the templates and the unit payloads of an export, to render them again outside Houdini (see main below).
+    """
+    with open(filename, "wb") as f:
+        pickle.dump({"sources": dict(sources), "payloads": list(payloads)}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_payloads(filename):
+    with open(filename, "rb") as f:
+        data = pickle.load(f)
+    return data["sources"], data["payloads"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Renders saved unit payloads with a process pool.")
+    parser.add_argument("payloads", help="payloads file saved by save_payloads")
+    parser.add_argument("output", help="file receiving the rendered units")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args(argv)
+    sources, payloads = load_payloads(args.payloads)
+    with RenderPool(sources, args.processes, args.chunk_size) as pool:
+        texts = pool.render_units(payloads)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write("".join(texts))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import hou
+import json
+import houdini_node_manager as hnm
+import hda_manager as hda
+import render_manager as rm
+import spatial_index as si
+import gnode as gn
+import network_box_index as nbi
+import export_profiler as prof
+
+class SceneSnapshot:
+    """
+    Plain in-memory capture of one network (children of a node path).
+    The network is walked once, and NodeGraph, GNode and the renderers read only from the snapshot,
+    so everything after the capture can run without Houdini, ex. from a snapshot loaded from disk.
+    """
+    # bump when the stored structure changes
+    VERSION = 1
+
+    def __init__(self, parent_path):
+        self.parent_path = parent_path
+        self.parent_name = parent_path.split("/")[-1]
+        self.parent_type = None
+        self.nodes = {} # node path -> node record, in the same order as hou children()
+        self.network_boxes = {} # network box name -> network box record
+        self.sticky_notes = []
+        self.noteLinkers = {} # linking settings -> StickyNoteLinker, see get_note_linker
+        self.nodeTable = None # see get_node_table
+        self.networkBoxIndex = None # see get_network_box_index
+        self.nodeHashes = {} # node path -> content hash, see export_cache.ExportCache.track_snapshot
+
+# ==================================
+# ========= Capture from Houdini
+# ==================================
+
+    @staticmethod
+    def capture(parent_path, includeProperties=True):
+        """
+        Walks the network once and records nodes, edges, network boxes, sticky notes and parms.
+        """
+        hdaSettings = hda.HDAManager.current()
+        parent = hou.node(parent_path)
+        snapshot = SceneSnapshot(parent_path)
+        if parent is None:
+            hdaSettings.consoleLogWarning(f"========= SceneSnapshot.capture: {parent_path} is not a valid node.")
+            return snapshot
+        snapshot.parent_name = parent.name()
+        snapshot.parent_type = parent.type().name()
+        # nodes rendered with a special macro read parms that may be at their default value
+        macroNames = rm.RenderManager.get_macro_names() if hdaSettings.leanParmExtraction else set()
+        for child in parent.children():
+            snapshot.nodes[child.path()] = SceneSnapshot.capture_node(child, includeProperties, hdaSettings, macroNames)
+        for netbox in hnm.HoudiniNodeManager(parent).extract_network_boxes():
+            snapshot.network_boxes[netbox["name"]] = netbox
+        snapshot.sticky_notes = hnm.HoudiniNodeManager.extract_sticky_notes(parent_path)
+        # network boxes: 7 calls per box and 1 per node path, sticky notes: 3 calls per note
+        prof.count("snapshot", "hou_calls", 5 + sum(7 + len(netbox["nodes"]) for netbox in snapshot.network_boxes.values())
+                   + 3 * len(snapshot.sticky_notes))
+        prof.count("snapshot", "nodes", len(snapshot.nodes))
+        hdaSettings.consoleLogDebug(f"========= SceneSnapshot.capture: {parent_path} {len(snapshot.nodes)} nodes, "
+                                    f"{len(snapshot.network_boxes)} network boxes, {len(snapshot.sticky_notes)} sticky notes")
+        return snapshot
+
+    @staticmethod
+    def capture_node(node, includeProperties=True, hdaSettings=None, macroNames=()):
+        hdaSettings = hdaSettings if hdaSettings else hda.HDAManager.current()
+        netbox = node.parentNetworkBox()
+        node_type = node.type().name()
+        record = {
+            "path": node.path(),
+            "type": node_type,
+            "name": node.name(),
+            "comment": node.comment(),
+            "inputs": [inp.path() if inp is not None else None for inp in node.inputs()],
+            "outputs": [out.path() if out is not None else None for out in node.outputs()],
+            "position": list(node.position()),
+            "network_box": netbox.name() if netbox is not None else None,
+            "block_path": None,
+            "properties": {}
+        }
+        if node_type == "block_begin":
+            record["block_path"] = node.parm("blockpath").eval()
+        if "houdini_2_chat" in node_type and not hdaSettings.exportThisNode:
+            includeProperties = False # never rendered
+        # one call per field above, plus the paths of the connections
+        connections = sum(path is not None for path in record["inputs"]) + sum(path is not None for path in record["outputs"])
+        prof.count("snapshot", "hou_calls", 9 + (netbox is not None) + connections + 2 * (node_type == "block_begin"))
+        if includeProperties:
+            with prof.stage("parm_extraction"):
+                if SceneSnapshot.needs_all_properties(node_type, hdaSettings, macroNames):
+                    properties = hnm.HoudiniNodeManager.extract_node_properties(node)
+                else:
+                    properties = hnm.HoudiniNodeManager.extract_changed_properties(node)
+                record["properties"] = {key: SceneSnapshot.plain_property(prop) for key, prop in properties.items()}
+            prof.count("parm_extraction", "parms", len(record["properties"]))
+        return record
+
+    def refresh_nodes(self, node_paths):
+        """
+        Captures again the given nodes, and the nodes whose references or expressions name one of them
+        (their evaluated values may have changed too). Returns the paths captured again.
+        """
+        hdaSettings = hda.HDAManager.current()
+        macroNames = rm.RenderManager.get_macro_names() if hdaSettings.leanParmExtraction else set()
+        dirty = [path for path in node_paths if path in self.nodes]
+        names = [path.split("/")[-1] for path in dirty]
+        refreshed = set(dirty)
+        for path, record in self.nodes.items():
+            for prop in record["properties"].values():
+                formulas = " ".join(str(prop.get(key)) for key in ("reference", "expression", "unexpanded") if prop.get(key))
+                if formulas and any(name in formulas for name in names):
+                    refreshed.add(path)
+                    break
+        for path in refreshed:
+            node = hou.node(path)
+            if node is not None:
+                self.nodes[path] = SceneSnapshot.capture_node(node, True, hdaSettings, macroNames)
+            self.nodeHashes.pop(path, None)
+        # derived from the node records
+        self.noteLinkers = {}
+        self.nodeTable = None
+        self.networkBoxIndex = None
+        return refreshed
+
+    @staticmethod
+    def needs_all_properties(node_type, hdaSettings, macroNames):
+        """
+        Loop nodes and nodes with a special macro read parms by name, so they get the full extraction.
+        Every other node only needs its changed and user created parms.
+        """
+        if not hdaSettings.leanParmExtraction:
+            return True
+        if node_type in ["block_begin", "block_end"]:
+            return True
+        return hda.HDAManager.sanitize_string(node_type).lower() in macroNames
+
+    @staticmethod
+    def plain_property(prop):
+        """
+        Converts the hou objects of an extracted property to plain python values.
+        Values keep the text they render to, so the output is the same with or without Houdini.
+        """
+        plain = {}
+        for key, val in prop.items():
+            if isinstance(val, (int, float, str, bool)) or val is None:
+                plain[key] = val
+            elif isinstance(val, tuple) and all(isinstance(v, (int, float, str, bool)) for v in val):
+                plain[key] = val
+            elif isinstance(val, hou.Parm):
+                plain[key] = val.path()
+            else:
+                plain[key] = str(val)
+        return plain
+
+# ==================================
+# ========= Queries
+# ==================================
+
+    def get_node(self, node_path):
+        return self.nodes.get(node_path)
+
+    def get_children(self):
+        return list(self.nodes)
+
+    def get_network_box_index(self):
+        # built once, network boxes are grouped and filtered with it
+        if self.networkBoxIndex is None:
+            self.networkBoxIndex = nbi.NetworkBoxIndex.fromSnapshot(self)
+        return self.networkBoxIndex
+
+    def get_root_network_boxes(self):
+        return self.get_network_box_index().get_root_boxes()
+
+    def get_network_box_children(self, netbox):
+        return self.get_network_box_index().get_box_nodes(netbox["name"])
+
+    def get_nodes_not_in_network_boxes(self):
+        return self.get_network_box_index().get_nodes_outside_boxes()
+
+    def filter_by_network_boxes(self, patterns_str, nodeList):
+        """
+        Keeps the nodes of nodeList that are inside a network box whose title matches one of the patterns.
+        """
+        return self.get_network_box_index().filter_nodes(patterns_str, nodeList)
+
+    def get_node_table(self):
+        # built once, the GNodes of every graph composed from this snapshot share it
+        if self.nodeTable is None or len(self.nodeTable.ids) < len(self.nodes):
+            self.nodeTable = gn.NodeTable.fromSnapshot(self)
+        return self.nodeTable
+
+    def get_note_linker(self, hdaSettings, nodePaths=None):
+        # notes are linked once per set of rendered nodes (all of them by default), and shared by the graphs rendering it
+        key = (si.StickyNoteLinker.settings_key(hdaSettings), frozenset(nodePaths) if nodePaths is not None else None)
+        if key not in self.noteLinkers:
+            self.noteLinkers[key] = si.StickyNoteLinker(self, hdaSettings, nodePaths).link()
+        return self.noteLinkers[key]
+
+# ==================================
+# ========= Save / Load
+# ==================================
+
+    def toDict(self):
+        return {
+            "version": SceneSnapshot.VERSION,
+            "parent_path": self.parent_path,
+            "parent_name": self.parent_name,
+            "parent_type": self.parent_type,
+            "nodes": self.nodes,
+            "network_boxes": self.network_boxes,
+            "sticky_notes": self.sticky_notes
+        }
+
+    @staticmethod
+    def fromDict(data):
+        snapshot = SceneSnapshot(data["parent_path"])
+        snapshot.parent_name = data["parent_name"]
+        snapshot.parent_type = data["parent_type"]
+        snapshot.nodes = data["nodes"]
+        snapshot.network_boxes = data["network_boxes"]
+        snapshot.sticky_notes = data["sticky_notes"]
+        return snapshot
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(_encode_tuples(self.toDict()), f)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, "r") as f:
+            data = json.load(f, object_hook=_decode_tuples)
+        return SceneSnapshot.fromDict(data)
+
+# json has no tuple type, but tuples render differently than lists (parm tuples values)
+def _encode_tuples(val):
+    if isinstance(val, tuple):
+        return {"__tuple__": [_encode_tuples(v) for v in val]}
+    if isinstance(val, list):
+        return [_encode_tuples(v) for v in val]
+    if isinstance(val, dict):
+        return {k: _encode_tuples(v) for k, v in val.items()}
+    return val
+
+def _decode_tuples(obj):
+    if len(obj) == 1 and "__tuple__" in obj:
+        return tuple(obj["__tuple__"])
+    return obj
@@ -0,0 +1,130 @@
+import numpy as np
+
+class SpatialGrid:
+    """
+    Uniform grid over 2d points (network editor positions), the cell size is the query radius
+    so a radius query only visits the 3x3 cells around the point.
+    """
+    def __init__(self, positions, cellSize):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        self.cellSize = float(cellSize) if cellSize > 0 else 1.0
+        self.cells = {} # (cell x, cell y) -> array of point indices
+        cellLists = {}
+        cellIds = np.floor(self.positions / self.cellSize).astype(np.int64)
+        for index, cell in enumerate(map(tuple, cellIds.tolist())):
+            cellLists.setdefault(cell, []).append(index)
+        for cell, indices in cellLists.items():
+            self.cells[cell] = np.array(indices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def candidates(self, point, radius):
+        x0, y0 = np.floor((np.asarray(point, dtype=np.float64) - radius) / self.cellSize).astype(np.int64)
+        x1, y1 = np.floor((np.asarray(point, dtype=np.float64) + radius) / self.cellSize).astype(np.int64)
+        found = [self.cells[(x, y)] for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in self.cells]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        # sorted, so equal distances keep the order of the points
+        return np.sort(np.concatenate(found))
+
+    def query(self, point, radius, k=None):
+        """
+        k nearest points within radius of point (all of them when k is None), nearest first.
+        Returns (indices, distances).
+        """
+        indices = self.candidates(point, radius)
+        distances = np.hypot(*(self.positions[indices] - np.asarray(point, dtype=np.float64)).T)
+        inside = distances <= radius
+        indices, distances = indices[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")[:k]
+        return indices[order], distances[order]
+
+class StickyNoteLinker:
+    """
+    Links the sticky notes of a network to the closest node within the distance threshold.
+    By default a note is linked to a node only when it is not above it, link_top/left/right
+    also accept notes placed above/left/right of the node. With link_sticky_notes_to_boxes, a note
+    that is not linked to a node is linked to the innermost network box it lies in.
+    Only the nodes of nodePaths (the rendered ones, all the nodes of the network by default) are linked,
+    so a note next to a node that is not rendered goes to the closest rendered node.
+    The grid is built once per set of nodes, and each note is linked once (not once per graph).
+    """
+    def __init__(self, snapshot, hdaSettings, nodePaths=None):
+        self.snapshot = snapshot
+        self.hdaSettings = hdaSettings
+        self.threshold = hdaSettings.stickyNotesDistanceThreshold
+        self.nodePaths = [node_path for node_path in snapshot.nodes if nodePaths is None or node_path in nodePaths]
+        self.grid = SpatialGrid([snapshot.nodes[node_path]["position"] for node_path in self.nodePaths], self.threshold)
+        self.nodeNotes = {} # node path -> list of note texts
+        self.boxNotes = {} # network box name -> list of note texts
+
+    @staticmethod
+    def settings_key(hdaSettings):
+        return (hdaSettings.stickyNotesDistanceThreshold, hdaSettings.linkTopStickyNotes, hdaSettings.linkLeftStickyNotes,
+                hdaSettings.linkRightStickyNotes, hdaSettings.linkStickyNotesToBoxes)
+
+    @staticmethod
+    def note_center(note):
+        # note position is the bottom left corner
+        return (note["position"][0] + note["size"][0] / 2, note["position"][1] + note["size"][1] / 2)
+
+    def accepted(self, note, indices):
+        """
+        Mask of the candidate nodes the note can be linked to, from the position of the note relative to each node.
+        """
+        center = np.asarray(StickyNoteLinker.note_center(note), dtype=np.float64)
+        positions = self.grid.positions[indices]
+        offset = center - positions
+        # original rule: the bottom of the note is not above the node
+        mask = positions[:, 1] >= note["position"][1]
+        horizontal = np.abs(offset[:, 0]) > np.abs(offset[:, 1])
+        if self.hdaSettings.linkTopStickyNotes:
+            mask |= ~horizontal & (offset[:, 1] > 0)
+        if self.hdaSettings.linkLeftStickyNotes:
+            mask |= horizontal & (offset[:, 0] < 0)
+        if self.hdaSettings.linkRightStickyNotes:
+            mask |= horizontal & (offset[:, 0] > 0)
+        return mask
+
+    def closest_node(self, note):
+        if self.threshold <= 0 or not len(self.grid):
+            return None, None
+        indices, distances = self.grid.query(StickyNoteLinker.note_center(note), self.threshold)
+        mask = self.accepted(note, indices)
+        if not mask.any():
+            return None, None
+        first = int(np.argmax(mask))
+        return self.nodePaths[indices[first]], float(distances[first])
+
+    def containing_box(self, note):
+        # innermost (smallest) network box containing the note center
+        center = StickyNoteLinker.note_center(note)
+        best = None
+        for netbox in self.snapshot.network_boxes.values():
+            (x, y), (w, h) = netbox["position"], netbox["size"]
+            if x <= center[0] <= x + w and y <= center[1] <= y + h:
+                if best is None or w * h < best["size"][0] * best["size"][1]:
+                    best = netbox
+        return best
+
+    def link(self):
+        for note in self.snapshot.sticky_notes:
+            node_path, distance = self.closest_node(note)
+            if node_path is not None:
+                self.nodeNotes.setdefault(node_path, []).append(note["text"])
+                continue
+            if self.hdaSettings.linkStickyNotesToBoxes:
+                netbox = self.containing_box(note)
+                if netbox is not None:
+                    self.boxNotes.setdefault(netbox["name"], []).append(note["text"])
+        self.hdaSettings.consoleLogDebug(f"========= StickyNoteLinker.link: {self.snapshot.parent_path} "
+                                         f"{len(self.snapshot.sticky_notes)} notes, {len(self.nodeNotes)} nodes, {len(self.boxNotes)} boxes")
+        return self
+
+    def get_node_note(self, node_path):
+        notes = self.nodeNotes.get(node_path)
+        return "\n".join(notes) if notes else None
+
+    def get_box_notes(self, box_name):
+        return self.boxNotes.get(box_name, [])
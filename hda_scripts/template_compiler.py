@@ -0,0 +1,143 @@
+import argparse
+import hashlib
+import json
+import os
+import jinja2
+
+# Bundle of precompiled templates, shipped next to the templates (an HDA section, or a file of the templates folder)
+BUNDLE_NAME = "templates_compiled.json"
+# the bundle holds one build per jinja version, Houdini ships its own jinja (see write_bundle)
+VERSION = 2
+
+def source_hash(source):
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+def compile_bundle(sources):
+    """
+    Compiles jinja templates (template name -> text) ahead of time, with the running jinja version.
+    The build holds, per template, the hash of its source and the Python code jinja generates for it
+    (the modules Environment.compile_templates writes).
+    """
+    env = jinja2.Environment()
+    templates = {}
+    for name in sorted(sources):
+        templates[name] = {"hash": source_hash(sources[name]), "code": env.compile(sources[name], name, raw=True)}
+    return {"version": VERSION, "builds": {jinja2.__version__: {"templates": templates}}}
+
+def parse_bundle(text):
+    """
+    Returns the bundle stored in text, or None if it is missing, unreadable or of another bundle version.
+    """
+    if not text:
+        return None
+    try:
+        bundle = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(bundle, dict) or bundle.get("version") != VERSION or not isinstance(bundle.get("builds"), dict):
+        return None
+    return bundle
+
+def get_build(bundle, version=None):
+    # build of the bundle made with the given jinja version, the running one by default
+    return bundle["builds"].get(version or jinja2.__version__)
+
+def load_bundle(text):
+    """
+    Returns the build of the bundle stored in text for the running jinja version, or None.
+    """
+    bundle = parse_bundle(text)
+    return get_build(bundle) if bundle is not None else None
+
+def merge_bundle(bundle, previous, sources):
+    """
+    Adds to bundle the builds of previous made with other jinja versions, without the templates
+    whose source changed since (their code is stale).
+    """
+    hashes = {name: source_hash(source) for name, source in sources.items()}
+    for version, build in previous["builds"].items():
+        if version in bundle["builds"]:
+            continue
+        templates = {name: entry for name, entry in build["templates"].items() if entry.get("hash") == hashes.get(name)}
+        if templates:
+            bundle["builds"][version] = {"templates": templates}
+    return bundle
+
+class PrecompiledLoader(jinja2.BaseLoader):
+    """
+    Same as jinja2.DictLoader, but a template whose source hash matches the bundle is created
+    from its precompiled code, skipping the jinja parsing and code generation.
+    """
+    def __init__(self, sources, bundle=None):
+        self.sources = sources
+        self.templates = bundle["templates"] if bundle is not None else {}
+        self.precompiled = 0 # templates loaded from the bundle
+        self.compiled = 0 # templates compiled from their source
+
+    def get_source(self, environment, template):
+        if template not in self.sources:
+            raise jinja2.TemplateNotFound(template)
+        source = self.sources[template]
+        return source, None, lambda: source == self.sources.get(template)
+
+    def list_templates(self):
+        return sorted(self.sources)
+
+    def load(self, environment, name, globals=None):
+        source, filename, uptodate = self.get_source(environment, name)
+        entry = self.templates.get(name)
+        if entry is None or entry.get("hash") != source_hash(source):
+            self.compiled += 1
+            return super().load(environment, name, globals)
+        self.precompiled += 1
+        code = compile(entry["code"], filename or "<template>", "exec")
+        return environment.template_class.from_code(environment, code, globals or {}, uptodate)
+
+def read_templates(folder):
+    sources = {}
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(".j2"):
+            with open(os.path.join(folder, name), "r", encoding="utf-8") as f:
+                sources[name] = f.read()
+    return sources
+
+def write_bundle(folder, output=None):
+    """
+    Compiles the templates of folder into the bundle file output (BUNDLE_NAME in folder by default).
+    The builds of the other jinja versions already in the file are kept, see merge_bundle.
+    The file is only rewritten when its content changed. Returns (output, bundle).
+    """
+    output = output or os.path.join(folder, BUNDLE_NAME)
+    sources = read_templates(folder)
+    bundle = compile_bundle(sources)
+    previousText = None
+    try:
+        with open(output, "r", encoding="utf-8") as f:
+            previousText = f.read()
+    except OSError:
+        pass
+    previous = parse_bundle(previousText)
+    if previous is not None:
+        merge_bundle(bundle, previous, sources)
+    text = json.dumps(bundle, indent=1, sort_keys=True)
+    if text == previousText:
+        return output, bundle
+    tempFilename = output + ".partial"
+    with open(tempFilename, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tempFilename, output)
+    return output, bundle
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompiles the jinja templates into a bundle shipped with the HDA.")
+    parser.add_argument("templates", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"),
+                        help="folder of the .j2 templates")
+    parser.add_argument("-o", "--output", help=f"bundle file, {BUNDLE_NAME} in the templates folder by default")
+    args = parser.parse_args(argv)
+    output, bundle = write_bundle(args.templates, args.output)
+    build = get_build(bundle)
+    print(f"{len(build['templates'])} templates compiled with jinja2 {jinja2.__version__} -> {output} "
+          f"(builds: {', '.join(sorted(bundle['builds']))})")
+
+if __name__ == "__main__":
+    main()
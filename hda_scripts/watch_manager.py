@@ -0,0 +1,205 @@
+import time
+import threading
+
+try:
+    import hou
+except ImportError: # bookkeeping and scheduler run without Houdini, with a stand-in event source
+    hou = None
+
+class DebounceScheduler:
+    """
+    Collects dirty keys and fires the callback once no new key was marked for `delay` seconds.
+    tick() is called from the Houdini event loop (idle time), or by hand with a fake clock.
+    """
+    def __init__(self, delay, callback, clock=time.monotonic):
+        self.delay = delay
+        self.callback = callback
+        self.clock = clock
+        self.pending = set()
+        self.last_mark = None
+        self.fired = 0
+
+    def mark(self, key):
+        self.pending.add(key)
+        self.last_mark = self.clock()
+
+    def is_due(self):
+        return bool(self.pending) and self.clock() - self.last_mark >= self.delay
+
+    def tick(self):
+        if not self.is_due():
+            return False
+        keys = self.pending
+        self.pending = set()
+        self.fired += 1
+        self.callback(keys)
+        return True
+
+    def cancel(self):
+        self.pending = set()
+
+class ManualEventSource:
+    """
+    Stand-in event source, events are sent with emit(). Used to drive a WatchManager without Houdini.
+    """
+    def __init__(self):
+        self.handlers = {}
+
+    def subscribe(self, network_path, handler):
+        self.handlers[network_path] = handler
+
+    def unsubscribe(self, network_path):
+        self.handlers.pop(network_path, None)
+
+    def emit(self, network_path, node_path, event_name):
+        handler = self.handlers.get(network_path)
+        if handler:
+            handler(network_path, node_path, event_name)
+
+class HouEventSource:
+    """
+    Registers node event callbacks on a network and its children, and forwards them as
+    handler(network_path, node_path, event_name).
+    """
+    # event types are looked up by name, some of them do not exist in older Houdini versions
+    NETWORK_EVENTS = ["ChildCreated", "ChildDeleted", "NetworkBoxCreated", "NetworkBoxDeleted",
+                      "StickyNoteCreated", "StickyNoteDeleted", "StickyNoteChanged"]
+    NODE_EVENTS = ["ParmTupleChanged", "InputRewired", "NameChanged", "PositionChanged", "AppearanceChanged"]
+
+    def __init__(self):
+        self.callbacks = {} # network path -> list of (node, event types, callback)
+
+    @staticmethod
+    def event_types(names):
+        types = [getattr(hou.nodeEventType, name, None) for name in names]
+        return tuple(t for t in types if t is not None)
+
+    def subscribe(self, network_path, handler):
+        network = hou.node(network_path)
+        if network is None:
+            return
+        registered = []
+
+        def onNodeEvent(event_type, **kwargs):
+            node = kwargs.get("node")
+            handler(network_path, node.path() if node else network_path, event_type.name())
+
+        def onNetworkEvent(event_type, **kwargs):
+            child = kwargs.get("child_node")
+            if event_type == hou.nodeEventType.ChildCreated and child is not None:
+                self.register(registered, child, HouEventSource.NODE_EVENTS, onNodeEvent)
+            handler(network_path, child.path() if child else network_path, event_type.name())
+
+        self.register(registered, network, HouEventSource.NETWORK_EVENTS, onNetworkEvent)
+        for child in network.children():
+            self.register(registered, child, HouEventSource.NODE_EVENTS, onNodeEvent)
+        self.callbacks[network_path] = registered
+
+    def register(self, registered, node, event_names, callback):
+        types = HouEventSource.event_types(event_names)
+        node.addEventCallback(types, callback)
+        registered.append((node, types, callback))
+
+    def unsubscribe(self, network_path):
+        for node, types, callback in self.callbacks.pop(network_path, []):
+            try:
+                node.removeEventCallback(types, callback)
+            except hou.ObjectWasDeleted:
+                pass # deleted nodes drop their callbacks
+
+class WatchManager:
+    """
+    Watch mode: tracks the dirty nodes of the exported networks and re-exports them once edits settle.
+    Snapshots of the networks that did not change are kept, so a re-export only captures dirty networks,
+    and the export cache only renders the dirty units.
+    Events changing a single node (NODE_EVENTS) keep the snapshot, only the dirty nodes are captured again
+    into it (see SceneSnapshot.refresh_nodes). Any other event drops the snapshot of the network.
+    The export callback runs on the event loop, it may return a job running the rest of the export on a
+    background thread: no other export starts until the job is done.
+    """
+    NODE_EVENTS = {"ParmTupleChanged", "PositionChanged", "AppearanceChanged"}
+
+    def __init__(self, network_paths, exportCallback, eventSource=None, delay=1.0, clock=time.monotonic):
+        self.network_paths = list(network_paths)
+        self.exportCallback = exportCallback # exportCallback(dirty network paths, snapshots, dirty nodes) -> job or None
+        self.eventSource = eventSource if eventSource else HouEventSource()
+        self.scheduler = DebounceScheduler(delay, self.export_dirty, clock)
+        self.dirty_nodes = {} # network path -> set of node paths edited since the last export
+        self.snapshots = {} # network path -> last captured SceneSnapshot, filled by the export
+        self.worker = None # thread running the job of the last export
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        for network_path in self.network_paths:
+            self.eventSource.subscribe(network_path, self.on_event)
+            # first export captures every network
+            self.scheduler.mark(network_path)
+        self.running = True
+
+    def stop(self):
+        for network_path in self.network_paths:
+            self.eventSource.unsubscribe(network_path)
+        self.scheduler.cancel()
+        self.running = False
+
+    def on_event(self, network_path, node_path, event_name):
+        if event_name in WatchManager.NODE_EVENTS and network_path in self.snapshots:
+            self.dirty_nodes.setdefault(network_path, set()).add(node_path)
+        else:
+            # the network has to be captured again, its old snapshot is stale
+            self.snapshots.pop(network_path, None)
+            self.dirty_nodes.pop(network_path, None)
+        self.scheduler.mark(network_path)
+
+    def busy(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def tick(self):
+        # edits made during an export are exported once it is done
+        if self.busy():
+            return False
+        return self.scheduler.tick()
+
+    def wait(self, timeout=None):
+        if self.worker is not None:
+            self.worker.join(timeout)
+        return not self.busy()
+
+    def export_dirty(self, network_paths):
+        dirtyNodes = {path: self.dirty_nodes.pop(path) for path in network_paths if path in self.dirty_nodes}
+        job = self.exportCallback(sorted(network_paths), self.snapshots, dirtyNodes)
+        if job is not None:
+            self.worker = threading.Thread(target=job, name="WatchManager.export", daemon=True)
+            self.worker.start()
+
+# ==================================
+# ========= Houdini session
+# ==================================
+
+# one watch per HDA node path
+_watches = {}
+
+def start(hdaSettings, exportCallback):
+    stop(hdaSettings)
+    hdaPath = hdaSettings.hdaNode.path()
+    watch = WatchManager(hdaSettings.nodePaths, exportCallback, delay=hdaSettings.watchDebounce)
+    watch.start()
+    _watches[hdaPath] = watch
+    # debounced exports start when Houdini is idle, only capturing runs on the event loop
+    hou.ui.addEventLoopCallback(watch.tick)
+    hdaSettings.consoleLogInfo(f"=== Houdini2Chat.Watch started on {len(watch.network_paths)} network(s)")
+    return watch
+
+def stop(hdaSettings):
+    watch = _watches.pop(hdaSettings.hdaNode.path(), None)
+    if watch is None:
+        return
+    watch.stop()
+    if watch.tick in hou.ui.eventLoopCallbacks():
+        hou.ui.removeEventLoopCallback(watch.tick)
+    hdaSettings.consoleLogInfo("=== Houdini2Chat.Watch stopped")
+
+def get_watch(hdaNodePath):
+    return _watches.get(hdaNodePath)
@@ -0,0 +1,285 @@
+"""
+Test fixtures: the export runs on SceneSnapshots built by hand, so no Houdini session is needed.
+A minimal stand-in for the hou module is installed when the tests do not run in hython,
+and the HDA settings and templates come from a fake HDA node whose definition reads the hda_scripts files.
+"""
+import glob
+import os
+import sys
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, "hda_scripts")
+sys.path.insert(0, SCRIPTS)
+
+def make_hou():
+    hou = types.ModuleType("hou")
+    class Error(Exception):
+        pass
+    class OperationFailed(Error):
+        pass
+    class ObjectWasDeleted(Error):
+        pass
+    hou.Error = Error
+    hou.OperationFailed = OperationFailed
+    hou.ObjectWasDeleted = ObjectWasDeleted
+    hou.Parm = type("Parm", (), {})
+    hou.Ramp = type("Ramp", (), {})
+    hou.Vector2 = hou.Vector3 = hou.Vector4 = tuple
+    def pwd():
+        raise Error("no current node outside Houdini")
+    def readFile(path):
+        raise Error(f"cannot read {path}")
+    hou.pwd = pwd
+    hou.readFile = readFile
+    hou.node = lambda path: None
+    hou.applicationVersionString = lambda: "test"
+    return hou
+
+try:
+    import hou
+except ImportError:
+    sys.modules["hou"] = make_hou()
+
+import hda_manager as hdam
+import node_graph as ng
+import render_manager as rm
+import scene_snapshot as ss
+import output_writer as ow
+import main
+
+# ==================================
+# ========= Fake HDA
+# ==================================
+
+class FakeSection:
+    def __init__(self, contents):
+        self._contents = contents
+
+    def contents(self):
+        return self._contents
+
+class FakeDefinition:
+    """
+    HDA definition whose sections are the files of hda_scripts: templates, template bundle and modules.
+    """
+    def __init__(self):
+        self._sections = {}
+        for filename in glob.glob(os.path.join(SCRIPTS, "templates", "*")):
+            with open(filename, "r", encoding="utf-8") as f:
+                self._sections[os.path.basename(filename)] = FakeSection(f.read())
+        for filename in glob.glob(os.path.join(SCRIPTS, "*.py")):
+            with open(filename, "r", encoding="utf-8") as f:
+                self._sections[os.path.splitext(os.path.basename(filename))[0]] = FakeSection(f.read())
+
+    def sections(self):
+        return self._sections
+
+    def modificationTime(self):
+        return 0
+
+class FakeNodeType:
+    def __init__(self, definition):
+        self._definition = definition
+
+    def definition(self):
+        return self._definition
+
+class FakeParm:
+    def __init__(self, value):
+        self.value = value
+
+    def eval(self):
+        return self.value
+
+class FakeHDANode:
+    def __init__(self, parms, definition):
+        self.parms = parms
+        self._type = FakeNodeType(definition)
+
+    def path(self):
+        return "/obj/houdini_2_chat1"
+
+    def evalParm(self, name):
+        return self.parms[name]
+
+    def parm(self, name):
+        return FakeParm(self.parms[name]) if name in self.parms else None
+
+    def type(self):
+        return self._type
+
+# parms of the HDA, optional parms set so the tests do not depend on their defaults
+DEFAULT_PARMS = {
+    "group_by_network_box_l1": 0,
+    "include_nodes_outside_boxes": 1,
+    "link_sticky_notes_to_boxes": 0,
+    "link_left_sticky_notes": 0,
+    "link_right_sticky_notes": 0,
+    "link_top_sticky_notes": 0,
+    "sticky_notes_distance": 3.0,
+    "break_by_node_path": 1,
+    "auto_node_folder": 0,
+    "break_by_network_box": 0,
+    "default_filename_format": "all.py",
+    "node_filename_format": "[node.name].py",
+    "netbox_filename_format": "[node.name]_[netbox.name].py",
+    "filter_network_boxes": 0,
+    "network_box_filter": "",
+    "include_notes": 1,
+    "nodes_to_extract": 2,
+    "node_path_1": "/obj/a",
+    "node_path_2": "/obj/b",
+    "header_text": "# header",
+    "footer_text": "# footer",
+    "action_selected": 1,
+    "export_this_node": 0,
+    "no_bmi": 0,
+    "lean_parm_extraction": 1,
+    "use_export_cache": 0,
+    "shared_fan_out": 1,
+    "pipeline_workers": 0,
+    "pipeline_queue_depth": 2,
+    "render_processes": 0,
+    "render_chunk_size": 500,
+    "render_python": "",
+    "export_profile": 0,
+    "export_debug_files": 0,
+    "print_debug_messages": 0
+}
+
+@pytest.fixture(scope="session")
+def definition():
+    return FakeDefinition()
+
+@pytest.fixture
+def make_settings(tmp_path, definition):
+    """
+    Returns a function building the HDA settings from DEFAULT_PARMS and the given parms.
+    """
+    def make(**parms):
+        values = dict(DEFAULT_PARMS, project_location=str(tmp_path / "export"))
+        values.update(parms)
+        return hdam.HDAManager(FakeHDANode(values, definition))
+    return make
+
+# ==================================
+# ========= Networks
+# ==================================
+
+def make_property(label, value, parmType="Float", changed=True):
+    return {"label": label, "value": value, "actual_value": value, "changed": changed, "user_created": False,
+            "reference": None, "unexpanded": None, "expression": None, "type": f"parmTemplateType.{parmType}"}
+
+def make_snapshot(parent_path, nodes, positions=None):
+    """
+    Snapshot of a network from (name, type, input names) tuples, outputs are derived from the inputs.
+    Nodes are placed on a column, unless positions (name -> position) is given.
+    """
+    outputs = {name: [] for name, _, _ in nodes}
+    for name, _, inputs in nodes:
+        for inp in inputs:
+            outputs[inp].append(name)
+    records = {}
+    for i, (name, nodeType, inputs) in enumerate(nodes):
+        path = f"{parent_path}/{name}"
+        records[path] = {
+            "path": path, "type": nodeType, "name": name, "comment": "",
+            "position": list(positions[name]) if positions else [0, -2 * i],
+            "inputs": [f"{parent_path}/{n}" for n in inputs], "outputs": [f"{parent_path}/{n}" for n in outputs[name]],
+            "network_box": None, "block_path": None, "properties": {"scale": make_property("scale", float(i))}
+        }
+    return ss.SceneSnapshot.fromDict({"parent_path": parent_path, "parent_name": parent_path.split("/")[-1],
+                                      "parent_type": "geo", "nodes": records, "network_boxes": {}, "sticky_notes": []})
+
+def make_network(parent_path):
+    """
+    Snapshot of a network with a for each loop holding a nested loop, a dangling branch,
+    a merge, two network boxes and a sticky note:
+    box -> fb -> xf -> [ib -> mtn -> ie] -> fe -> merge -> out, fb -> dangle, other -> merge
+    """
+    nodes = [("box", "box", [], ["fb"]), ("fb", "block_begin", ["box"], ["xf", "dangle"]), ("xf", "xform", ["fb"], ["ib"]),
+             ("dangle", "null", ["fb"], []), ("ib", "block_begin", ["xf"], ["mtn"]), ("mtn", "mountain", ["ib"], ["ie"]),
+             ("ie", "block_end", ["mtn"], ["fe"]), ("fe", "block_end", ["ie"], ["merge"]), ("other", "sphere", [], ["merge"]),
+             ("merge", "merge", ["fe", "other"], ["out"]), ("out", "null", ["merge"], [])]
+    blockPaths = {"fb": "../fe", "ib": "../ie"}
+    loopParms = ["itermethod", "method", "startvalue", "increment", "iterations", "class", "attrib", "useattrib",
+                 "maxiter", "usemaxiter", "singlepass", "dosinglepass", "stopcondition"]
+    boxes = {"first": ["box", "fb", "xf", "dangle", "ib", "mtn", "ie", "fe"], "second": ["other"]}
+    records = {}
+    for i, (name, nodeType, inputs, outputs) in enumerate(nodes):
+        properties = {"scale": make_property("scale", 2.0), "t": make_property("t", (1.0, 0.0, float(i)))}
+        if nodeType == "block_end":
+            properties.update({parm: make_property(parm, 0, "Int", False) for parm in loopParms})
+        path = f"{parent_path}/{name}"
+        records[path] = {
+            "path": path, "type": nodeType, "name": name, "comment": "", "position": [i % 3, -i],
+            "inputs": [f"{parent_path}/{n}" for n in inputs], "outputs": [f"{parent_path}/{n}" for n in outputs],
+            "network_box": next((box for box, members in boxes.items() if name in members), None),
+            "block_path": blockPaths.get(name), "properties": properties
+        }
+    return ss.SceneSnapshot.fromDict({
+        "parent_path": parent_path,
+        "parent_name": parent_path.split("/")[-1],
+        "parent_type": "geo",
+        "nodes": records,
+        "network_boxes": {
+            "first": {"name": "first", "comment": "first box", "parent_box": None, "position": [0, -8], "size": [3, 9],
+                      "nodes": [f"{parent_path}/{n}" for n in boxes["first"]]},
+            "second": {"name": "second", "comment": "second box", "parent_box": None, "position": [5, -9], "size": [1, 1],
+                       "nodes": [f"{parent_path}/{n}" for n in boxes["second"]]}
+        },
+        "sticky_notes": [{"text": "loop over the pieces", "position": [0, -3.5], "size": [1, 0.5],
+                          "closest_node": None, "distance": None}]
+    })
+
+@pytest.fixture
+def networks():
+    """
+    Returns a function building the snapshots of the exported networks (node path -> SceneSnapshot).
+    """
+    def make(node_paths=("/obj/a", "/obj/b")):
+        return {node_path: make_network(node_path) for node_path in node_paths}
+    return make
+
+@pytest.fixture
+def compose(make_settings):
+    """
+    Returns a function composing the NodeGraph of a snapshot (all its nodes by default), as main does.
+    """
+    def run(snapshot, nodeList=None, **parms):
+        settings = make_settings(**parms)
+        with hdam.settingsScope(settings):
+            return ng.NodeGraph(snapshot.parent_path, snapshot.parent_path, nodeList or snapshot.get_children(),
+                                hdaSettings=settings, snapshot=snapshot)
+    return run
+
+# ==================================
+# ========= Export
+# ==================================
+
+def read_export(folder):
+    # exported files (path relative to the export folder -> text), bookkeeping files excluded
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = [name for name in dirnames if name != ow.OutputWriter.STATE_FOLDER]
+        for name in filenames:
+            with open(os.path.join(dirpath, name), "r", encoding="utf-8") as f:
+                files[os.path.relpath(os.path.join(dirpath, name), folder).replace(os.sep, "/")] = f.read()
+    return files
+
+@pytest.fixture
+def export(monkeypatch, definition):
+    """
+    Returns a function running the export of snapshots with the given settings, as main.main does,
+    and returning the exported files.
+    """
+    def run(settings, snapshots, dirtyNodes=None):
+        monkeypatch.setattr(main, "hda", settings)
+        rm.TemplateCache.invalidateCheck(definition)
+        with hdam.settingsScope(settings):
+            settings.initOnce()
+            main.extractFromNodes(snapshots, dirtyNodes)
+        return read_export(settings.projectLocation)
+    return run
@@ -0,0 +1,39 @@
+from conftest import make_snapshot
+
+def branch_names(graph):
+    return [[graph.get_node(path).getName() for path in branch] for branch in graph.branches]
+
+def network_graph(compose, nodes, **parms):
+    return compose(make_snapshot("/obj/geo", nodes), **parms).graphList[-1]
+
+def test_chain_is_one_branch(compose):
+    graph = network_graph(compose, [("c", "null", ["b"]), ("a", "box", []), ("b", "xform", ["a"])])
+    # branches follow the edges, not the node order
+    assert branch_names(graph) == [["a", "b", "c"]]
+    assert graph.cycles == []
+
+def test_merge_ends_the_incoming_branches_and_starts_its_own(compose):
+    graph = network_graph(compose, [("a", "box", []), ("b", "sphere", []), ("m", "merge", ["a", "b"]), ("out", "null", ["m"])],
+                          no_bmi=1)
+    assert branch_names(graph) == [["a", "m"], ["b", "m"], ["m", "out"]]
+
+def test_branches_are_in_topological_order(compose):
+    graph = network_graph(compose, [("late", "null", ["m"]), ("m", "merge", ["x", "y"]), ("x", "box", []), ("y", "sphere", []),
+                                    ("z", "null", ["late"])], no_bmi=1)
+    order = [branch[0] for branch in branch_names(graph)]
+    assert order.index("m") > order.index("x") and order.index("m") > order.index("y")
+    assert ["m", "late", "z"] in branch_names(graph)
+
+def test_cycles_are_collapsed_into_cycle_units(compose):
+    # b -> c -> d -> b, fed by a
+    graph = network_graph(compose, [("a", "box", []), ("b", "merge", ["a", "d"]), ("c", "xform", ["b"]), ("d", "null", ["c"])],
+                          no_bmi=1)
+    assert [[graph.get_node(path).getName() for path in cycle] for cycle in graph.cycles] == [["b", "c", "d"]]
+    assert graph.decompositionStats["cycles"] == 1
+    # the branch entering the cycle stops at the cycle node
+    assert branch_names(graph) == [["a", "b"]]
+
+def test_strongly_connected_components(compose):
+    graph = network_graph(compose, [("a", "box", []), ("b", "merge", ["a", "c"]), ("c", "null", ["b"])], no_bmi=1)
+    components = sorted(sorted(graph.get_node(p).getName() for p in c) for c in graph.find_strongly_connected_components())
+    assert components == [["a"], ["b", "c"]]
@@ -0,0 +1,83 @@
+import os
+import pytest
+import main
+import export_cache as ec
+import output_writer as ow
+
+@pytest.fixture
+def cacheStats(monkeypatch):
+    # stats of each export cache, in export order
+    stats = []
+    close = ec.ExportCache.close
+
+    def closeAndRecord(self):
+        if self.connection is not None:
+            stats.append(dict(self.stats))
+        close(self)
+
+    monkeypatch.setattr(ec.ExportCache, "close", closeAndRecord)
+    return stats
+
+def test_cached_export_matches_fresh_export(tmp_path, make_settings, networks, export, cacheStats):
+    fresh = export(make_settings(project_location=str(tmp_path / "fresh"), use_export_cache=0), networks())
+    settings = make_settings(project_location=str(tmp_path / "cached"), use_export_cache=1)
+    snapshots = networks()
+    assert export(settings, snapshots) == fresh
+    # snapshots kept between exports (watch mode), then captured again
+    assert export(settings, snapshots) == fresh
+    assert export(settings, networks()) == fresh
+    nodeCount = sum(len(snapshot.nodes) for snapshot in snapshots.values())
+    assert cacheStats[0]["cached_units"] == 0
+    assert cacheStats[0]["dirty_nodes"] == nodeCount
+    assert cacheStats[0]["built_networks"] == 2
+    for stats in cacheStats[1:]:
+        # every node is hashed, kept snapshots included
+        assert (stats["dirty_nodes"], stats["clean_nodes"]) == (0, nodeCount)
+        # unchanged networks are restored without being composed
+        assert (stats["built_networks"], stats["cached_networks"]) == (0, 2)
+        assert stats["rendered_units"] == stats["cached_units"] == 0
+
+def test_edited_node_renders_its_units_again(tmp_path, make_settings, networks, export, cacheStats):
+    settings = make_settings(project_location=str(tmp_path / "cached"), use_export_cache=1)
+    export(settings, networks())
+    edited = networks()
+    edited["/obj/b"].nodes["/obj/b/other"]["properties"]["scale"]["value"] = 5.0
+    fresh = export(make_settings(project_location=str(tmp_path / "fresh"), use_export_cache=0), edited)
+    assert export(settings, edited) == fresh
+    assert "5.0" in fresh["b.py"]
+    stats = cacheStats[-1]
+    assert stats["dirty_nodes"] == 1
+    assert (stats["built_networks"], stats["cached_networks"]) == (1, 1)
+    assert 0 < stats["rendered_units"] < cacheStats[0]["rendered_units"]
+    # the units of the restored network are kept
+    edited["/obj/a"].nodes["/obj/a/other"]["properties"]["scale"]["value"] = 5.0
+    edited["/obj/a"].nodeHashes.clear()
+    export(settings, edited)
+    assert cacheStats[-1]["rendered_units"] > 0 and cacheStats[-1]["cached_units"] > 0
+
+def test_unchanged_network_is_not_composed(tmp_path, monkeypatch, make_settings, networks, export, cacheStats):
+    built = []
+    build = main.buildNodePathNetwork
+
+    def buildAndRecord(nodePath, snapshot=None):
+        built.append(nodePath)
+        return build(nodePath, snapshot)
+
+    monkeypatch.setattr(main, "buildNodePathNetwork", buildAndRecord)
+    settings = make_settings(use_export_cache=1, break_by_node_path=0)
+    first = export(settings, networks())
+    edited = networks()
+    edited["/obj/b"].nodes["/obj/b/other"]["properties"]["scale"]["value"] = 5.0
+    del built[:]
+    cached = export(settings, edited)
+    assert built == ["/obj/b"]
+    # the all nodes file splices the output of /obj/a back
+    assert cached == export(make_settings(project_location=str(tmp_path / "fresh"), break_by_node_path=0), edited)
+    assert export(settings, networks()) == first
+
+def test_bookkeeping_files_are_in_the_state_folder(tmp_path, make_settings, networks, export):
+    settings = make_settings(use_export_cache=1, export_profile=1)
+    export(settings, networks())
+    assert sorted(os.listdir(settings.projectLocation)) == [ow.OutputWriter.STATE_FOLDER, "a.py", "b.py"]
+    stateFolder = ow.OutputWriter.state_folder(settings.projectLocation)
+    assert sorted(os.listdir(stateFolder)) == [ec.ExportCache.FILENAME, "export_profile.json", ow.OutputWriter.MANIFEST]
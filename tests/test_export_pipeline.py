@@ -0,0 +1,41 @@
+import pytest
+import export_pipeline as ep
+
+LAYOUTS = [
+    {"break_by_node_path": 1},
+    {"break_by_node_path": 0},
+    {"break_by_node_path": 1, "group_by_network_box_l1": 1, "break_by_network_box": 1},
+    {"break_by_node_path": 0, "group_by_network_box_l1": 1}
+]
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_pipelined_export_matches_serial(tmp_path, make_settings, networks, export, layout):
+    node_paths = ["/obj/a", "/obj/b", "/obj/c"]
+    paths = {f"node_path_{i}": path for i, path in enumerate(node_paths, 1)}
+    serial = export(make_settings(project_location=str(tmp_path / "serial"), pipeline_workers=0,
+                                  nodes_to_extract=3, **paths, **layout), networks(node_paths))
+    pipelined = export(make_settings(project_location=str(tmp_path / "pipelined"), pipeline_workers=2, pipeline_queue_depth=1,
+                                     nodes_to_extract=3, **paths, **layout), networks(node_paths))
+    assert pipelined == serial
+    assert serial
+
+def test_pipeline_keeps_the_input_order():
+    def process(item, value):
+        return value * 10
+
+    consumed = []
+    pipeline = ep.ExportPipeline(lambda item: item, process, lambda item, result: consumed.append((item, result)), 3, 1)
+    assert list(pipeline.run(range(8))) == [i * 10 for i in range(8)]
+    assert consumed == [(i, i * 10) for i in range(8)]
+
+def test_pipeline_raises_the_first_error():
+    def process(item, value):
+        if item == 3:
+            raise ValueError("bad network")
+        return value
+
+    consumed = []
+    pipeline = ep.ExportPipeline(lambda item: item, process, lambda item, result: consumed.append(item), 2, 1)
+    with pytest.raises(ValueError, match="bad network"):
+        pipeline.run(range(6))
+    assert 3 not in consumed
@@ -0,0 +1,31 @@
+from conftest import make_snapshot
+
+NODES = [("src", "box", []), ("x", "xform", ["src"]), ("y", "null", ["src"]), ("z", "null", ["src"])]
+
+def network_graph(compose, **parms):
+    return compose(make_snapshot("/obj/geo", NODES), **parms).graphList[-1]
+
+def test_shared_fan_out_uses_one_reference_node(compose):
+    graph = network_graph(compose, shared_fan_out=1)
+    references = [path for path in graph.gNodes if graph.get_node(path).isReference()]
+    assert references == ["/obj/geo/src@1"]
+    assert graph.fanOuts == {"/obj/geo/src@1"}
+    assert list(graph.edges.successors("/obj/geo/src@1")) == ["/obj/geo/x", "/obj/geo/y", "/obj/geo/z"]
+    assert graph.edges.out_degree("/obj/geo/src") == 0
+    # every output starts its own branch from the shared reference
+    assert graph.branches == [["/obj/geo/src@1", "/obj/geo/x"], ["/obj/geo/src@1", "/obj/geo/y"], ["/obj/geo/src@1", "/obj/geo/z"]]
+    # placed above its first output
+    assert graph.get_node("/obj/geo/src@1").getPosition() == [0, -2 + 0.4]
+
+def test_legacy_fan_out_uses_one_reference_per_output(compose):
+    graph = network_graph(compose, shared_fan_out=0)
+    references = [path for path in graph.gNodes if graph.get_node(path).isReference()]
+    assert references == ["/obj/geo/src@1", "/obj/geo/src@2", "/obj/geo/src@3"]
+    assert graph.fanOuts == set()
+    assert graph.branches == [["/obj/geo/src@1", "/obj/geo/x"], ["/obj/geo/src@2", "/obj/geo/y"], ["/obj/geo/src@3", "/obj/geo/z"]]
+
+def test_shared_fan_out_renders_the_reference_once(make_settings, export):
+    snapshots = {"/obj/a": make_snapshot("/obj/a", NODES)}
+    text = export(make_settings(nodes_to_extract=1, shared_fan_out=1), snapshots)["a.py"]
+    assert text.count("(src, \"box\")") == 3
+    assert text.count("src = box_Node") == 1
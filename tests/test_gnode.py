@@ -0,0 +1,41 @@
+import gnode as gn
+from conftest import make_snapshot
+
+def table_snapshot():
+    snapshot = make_snapshot("/obj/geo", [("a", "box", []), ("b", "xform", ["a"]), ("c", "merge", ["a", "b"])])
+    # inputs may come from outside the network, or be disconnected
+    snapshot.nodes["/obj/geo/a"]["inputs"] = ["/obj/other/x", None]
+    return snapshot
+
+def test_paths_are_interned_once():
+    table = gn.NodeTable.fromSnapshot(table_snapshot())
+    # ids are given in the order the paths are met, inputs included
+    assert [table.get_id(path) for path in ["/obj/geo/a", "/obj/other/x", "/obj/geo/b", "/obj/geo/c"]] == [0, 1, 2, 3]
+    assert table.types[table.get_id("/obj/other/x")] is None
+    assert table.paths[2] == "/obj/geo/b" and table.names[2] == "b"
+    assert len(table) == 4
+    assert table.get_id("/obj/geo/missing") is None
+    assert table.to_paths(table.inputs[0]) == ["/obj/other/x", None]
+    assert table.to_paths(table.outputs[0]) == ["/obj/geo/b", "/obj/geo/c"]
+
+def test_gnode_reads_its_table_row():
+    snapshot = table_snapshot()
+    table = snapshot.get_node_table()
+    node = gn.GNode(table, table.get_id("/obj/geo/c"))
+    assert (node.getName(), node.getType(), node.getPath()) == ("c", "merge", "/obj/geo/c")
+    assert node.getPosition() == [0, -4]
+    assert node.getHProps() is snapshot.nodes["/obj/geo/c"]["properties"]
+    assert node.inputsToString() == "a, b"
+    # the table is built once per snapshot
+    assert snapshot.get_node_table() is table
+
+def test_references_share_the_row_and_keep_their_own_state():
+    table = gn.NodeTable.fromSnapshot(table_snapshot())
+    node = gn.GNode(table, table.get_id("/obj/geo/b"))
+    node.update(note="hello")
+    reference = node.alias(2)
+    reference.update(position=[5, 5])
+    assert reference.isReference() and not node.isReference()
+    assert (reference.getPath(), reference.getOriginalPath(), reference.getReference()) == ("/obj/geo/b@2", "/obj/geo/b", "/obj/geo/b")
+    assert reference.getId() == node.getId() and reference.getNote() == "hello"
+    assert node.getPosition() == [0, -2] and reference.getPosition() == [5, 5]
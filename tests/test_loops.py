@@ -0,0 +1,31 @@
+import re
+
+def names(graph, paths):
+    return [graph.get_node(path).getName() for path in paths]
+
+def test_loop_nesting_tree(networks, compose):
+    graph = compose(networks(["/obj/a"])["/obj/a"])
+    assert [loop["end"] for loop in graph.loopTree] == ["/obj/a/fe"]
+    outer = graph.loopTree[0]
+    assert [child["end"] for child in outer["children"]] == ["/obj/a/ie"]
+    assert outer["children"][0]["parent"] is outer
+    # nested loops first, so they are defined before the loops using them
+    assert [loop["end"] for loop in graph.loopUnits] == ["/obj/a/ie", "/obj/a/fe"]
+    assert graph.get_node("/obj/a/mtn").getLoopId() == "/obj/a/ie"
+    assert graph.get_node("/obj/a/xf").getLoopId() == "/obj/a/fe"
+    assert names(graph, graph.noLoopNodes) == ["box", "dangle", "other", "merge", "out"]
+
+def test_outer_loop_unit_does_not_render_the_nested_loop_nodes(networks, compose):
+    inner, outer, network = compose(networks(["/obj/a"])["/obj/a"]).graphList
+    assert [data["name"] for data in inner.getNodesRenderData(True)] == ["ib", "mtn"]
+    assert [data["name"] for data in outer.getNodesRenderData(True)] == ["fb", "xf"]
+    # the nested loop unit stays in the branches of the outer one
+    assert ["/obj/a/ie", "/obj/a/fe"] in outer.branches
+
+def test_nested_loop_nodes_are_defined_once(make_settings, networks, export):
+    text = export(make_settings(nodes_to_extract=1), networks(["/obj/a"]))["a.py"]
+    definitions = re.findall(r"^(\w+) = (\w+)", text, re.MULTILINE)
+    assert [name for name, _ in definitions].count("ib") == 1
+    assert dict(definitions)["ie"] == "loopBegin_Node"
+    assert dict(definitions)["fe"] == "loopBegin_Node"
+    assert '(ie, "block_end"),\n        (fe, "block_end")' in text
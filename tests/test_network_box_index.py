@@ -0,0 +1,38 @@
+import network_box_index as nbi
+
+def box(name, comment, parent, nodes):
+    return {"name": name, "comment": comment, "parent_box": parent, "nodes": nodes, "position": [0, 0], "size": [1, 1]}
+
+# outer holds inner (nested), side is another root box
+BOXES = [box("outer", "Main Setup", None, ["a", "b", "c"]), box("inner", "detail", "outer", ["b", "c"]),
+         box("side", "helpers", None, ["d"])]
+NODES = ["a", "b", "c", "d", "e"]
+
+def test_hierarchy():
+    index = nbi.NetworkBoxIndex(BOXES, NODES)
+    assert [netbox["name"] for netbox in index.get_root_boxes()] == ["outer", "side"]
+    assert [netbox["name"] for netbox in index.get_child_boxes("outer")] == ["inner"]
+    assert index.get_box_chain("inner") == ("inner", "outer")
+    # innermost box of each node
+    assert index.get_node_box_chain("b") == ("inner", "outer")
+    assert index.get_node_box_chain("a") == ("outer",)
+    assert index.get_node_box_chain("e") == ()
+
+def test_members_at_any_depth():
+    index = nbi.NetworkBoxIndex(BOXES, ["a", "c", "d", "e"])
+    assert index.get_box_nodes("outer") == ["a", "c"]
+    assert index.get_nodes_outside_boxes() == ["e"]
+
+def test_title_filters():
+    index = nbi.NetworkBoxIndex(BOXES, NODES)
+    assert index.filter_nodes("Main*", NODES) == ["a", "b", "c"]
+    assert index.filter_nodes("det* help*", NODES) == ["b", "c", "d"]
+    assert index.filter_nodes("", NODES) == []
+    assert index.get_filter("det* help*") is index.get_filter("det* help*")
+
+def test_from_snapshot(networks):
+    snapshot = networks(["/obj/a"])["/obj/a"]
+    index = snapshot.get_network_box_index()
+    assert snapshot.get_network_box_index() is index
+    assert index.get_node_box_chain("/obj/a/mtn") == ("first",)
+    assert index.get_nodes_outside_boxes() == ["/obj/a/merge", "/obj/a/out"]
@@ -0,0 +1,30 @@
+import pytest
+import node_graph as ng
+
+def test_view_reads_the_parent_members_in_order():
+    parent = {"a": 1, "b": 2, "c": 3}
+    view = ng.NodeView(parent, ["c", "a", "missing"])
+    assert "a" in view and "b" not in view
+    assert view["c"] == 3
+    with pytest.raises(KeyError):
+        view["b"]
+
+def test_overlay_does_not_touch_the_parent():
+    parent = {"a": 1, "b": 2}
+    view = ng.NodeView(parent, ["a", "b"])
+    view["a@1"] = 10
+    view["b"] = 20
+    assert parent == {"a": 1, "b": 2}
+    assert dict(view.items()) == {"a": 1, "b": 20, "a@1": 10}
+    del view["a"]
+    del view["a@1"]
+    assert "a" in parent and list(view) == ["b"] and len(view) == 1
+
+def test_unit_graphs_share_the_nodes_of_the_network(networks, compose):
+    graph = compose(networks(["/obj/a"])["/obj/a"])
+    inner, outer, network = graph.graphList
+    assert isinstance(inner.gNodes, ng.NodeView)
+    assert inner.get_node("/obj/a/mtn") is graph.get_node("/obj/a/mtn")
+    assert network.get_node("/obj/a/box") is graph.get_node("/obj/a/box")
+    # reference nodes only exist in the unit that created them
+    assert "/obj/a/fb@1" in network.gNodes and "/obj/a/fb@1" not in graph.gNodes
@@ -0,0 +1,34 @@
+import hda_manager as hdam
+import node_graph as ng
+
+def analyzed(snapshot, settings):
+    graph = ng.NodeGraph(snapshot.parent_path, snapshot.parent_path, hdaSettings=settings, snapshot=snapshot)
+    return graph.analyze(snapshot.get_children())
+
+def test_partition_keeps_the_loops_ending_in_it(make_settings, networks):
+    snapshot = networks(["/obj/a"])["/obj/a"]
+    settings = make_settings()
+    with hdam.settingsScope(settings):
+        network = analyzed(snapshot, settings)
+        first = network.partition("first", snapshot.get_network_box_children(snapshot.network_boxes["first"]))
+        second = network.partition("second", snapshot.get_network_box_children(snapshot.network_boxes["second"]))
+    assert [graph.loop_end for graph in first.graphList[:-1]] == ["/obj/a/ie", "/obj/a/fe"]
+    assert first.noLoopNodes == ["/obj/a/box", "/obj/a/dangle"]
+    assert [graph.is_loop_graph for graph in second.graphList] == [False]
+    # the loop analysis is shared, not redone per partition
+    assert first.graphList[0].get_node("/obj/a/mtn") is network.get_node("/obj/a/mtn")
+
+def test_inputs_from_outside_the_partition_become_references(make_settings, networks):
+    snapshot = networks(["/obj/a"])["/obj/a"]
+    settings = make_settings(no_bmi=1)
+    with hdam.settingsScope(settings):
+        outside = analyzed(snapshot, settings).partition("/obj/a", snapshot.get_nodes_not_in_network_boxes())
+    graph = outside.graphList[-1]
+    assert [path for path in graph.gNodes if graph.get_node(path).isReference()] == ["/obj/a/fe@1", "/obj/a/other@1"]
+    assert list(graph.edges.predecessors("/obj/a/merge")) == ["/obj/a/fe@1", "/obj/a/other@1"]
+
+def test_network_box_files(make_settings, networks, export):
+    files = export(make_settings(nodes_to_extract=1, group_by_network_box_l1=1, break_by_network_box=1), networks(["/obj/a"]))
+    assert sorted(files) == ["a_first.py", "a_second.py"]
+    assert "fe = loopBegin_Node" in files["a_first.py"] and "loopBegin_Node" not in files["a_second.py"]
+    assert "other = sphere_Node" in files["a_second.py"]
@@ -0,0 +1,67 @@
+import os
+import pytest
+import main
+import render_manager as rm
+import render_pool as rp
+
+LAYOUTS = [
+    {"break_by_node_path": 1},
+    {"break_by_node_path": 0, "group_by_network_box_l1": 1, "break_by_network_box": 1}
+]
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_pool_export_matches_in_process(tmp_path, monkeypatch, make_settings, networks, export, layout):
+    rendered = []
+    renderUnits = rp.RenderPool.render_units
+
+    def countUnits(self, payloads):
+        payloads = list(payloads)
+        rendered.extend(payloads)
+        return renderUnits(self, payloads)
+
+    monkeypatch.setattr(rp.RenderPool, "render_units", countUnits)
+    inProcess = export(make_settings(project_location=str(tmp_path / "in_process"), render_processes=0, **layout), networks())
+    # small chunks, so the units of a network are split across the workers
+    pooled = export(make_settings(project_location=str(tmp_path / "pool"), render_processes=2, render_chunk_size=1,
+                                  **layout), networks())
+    assert pooled == inProcess
+    assert rendered
+    assert inProcess
+
+@pytest.fixture
+def poolExecutable(monkeypatch, make_settings, definition):
+    # starts the render pool as the Houdini application does, returns the executable given to the workers
+    started = []
+
+    class Pool:
+        def __init__(self, sources, processes, chunkSize, executable, moduleSource):
+            started.append(executable)
+
+        def start(self):
+            return self
+
+    monkeypatch.setattr(rp, "RenderPool", Pool)
+    monkeypatch.setattr(main.sys, "executable", "/opt/hfs/bin/houdini")
+    monkeypatch.setattr(main, "hda", make_settings(render_processes=2))
+    rm.TemplateCache.invalidateCheck(definition)
+
+    def run():
+        main.startRenderPool()
+        return started[-1]
+    return run
+
+def test_pool_runs_the_hython_of_hfs(tmp_path, monkeypatch, poolExecutable):
+    hython = tmp_path / "bin" / ("hython.exe" if os.name == "nt" else "hython")
+    hython.parent.mkdir()
+    hython.write_text("")
+    hython.chmod(0o755)
+    monkeypatch.setenv("HFS", str(tmp_path))
+    assert os.path.normcase(poolExecutable()) == os.path.normcase(str(hython))
+
+def test_missing_hython_is_reported(tmp_path, monkeypatch, poolExecutable):
+    monkeypatch.setenv("HFS", str(tmp_path))
+    with pytest.raises(RuntimeError, match="hython not found"):
+        poolExecutable()
+    monkeypatch.delenv("HFS")
+    with pytest.raises(RuntimeError, match="HFS is not set"):
+        poolExecutable()
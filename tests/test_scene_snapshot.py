@@ -0,0 +1,28 @@
+import scene_snapshot as ss
+
+def test_save_load_round_trip(tmp_path, networks):
+    snapshot = networks(["/obj/a"])["/obj/a"]
+    filename = tmp_path / "snapshot.json"
+    snapshot.save(filename)
+    loaded = ss.SceneSnapshot.load(filename)
+    assert loaded.toDict() == snapshot.toDict()
+    # tuples render differently than lists, they have to survive json
+    assert loaded.get_node("/obj/a/xf")["properties"]["t"]["value"] == (1.0, 0.0, 2.0)
+
+def test_loaded_snapshot_renders_the_same(tmp_path, make_settings, networks, export):
+    snapshots = networks()
+    expected = export(make_settings(project_location=str(tmp_path / "captured")), snapshots)
+    loaded = {}
+    for node_path, snapshot in snapshots.items():
+        filename = tmp_path / f"{snapshot.parent_name}.json"
+        snapshot.save(filename)
+        loaded[node_path] = ss.SceneSnapshot.load(filename)
+    assert export(make_settings(project_location=str(tmp_path / "loaded")), loaded) == expected
+    assert sorted(expected) == ["a.py", "b.py"]
+    assert "loop over the pieces" in expected["a.py"]
+
+def test_network_box_queries(networks):
+    snapshot = networks(["/obj/a"])["/obj/a"]
+    assert [netbox["name"] for netbox in snapshot.get_root_network_boxes()] == ["first", "second"]
+    assert snapshot.get_nodes_not_in_network_boxes() == ["/obj/a/merge", "/obj/a/out"]
+    assert snapshot.filter_by_network_boxes("sec*", snapshot.get_children()) == ["/obj/a/other"]
@@ -0,0 +1,56 @@
+import numpy as np
+import spatial_index as si
+from conftest import make_snapshot
+
+def test_grid_query_matches_brute_force():
+    rng = np.random.default_rng(7)
+    positions = rng.uniform(-20, 20, size=(500, 2))
+    grid = si.SpatialGrid(positions, 3.0)
+    for point in rng.uniform(-20, 20, size=(50, 2)):
+        indices, distances = grid.query(point, 3.0)
+        expected = np.hypot(*(positions - point).T)
+        inside = np.flatnonzero(expected <= 3.0)
+        assert sorted(indices.tolist()) == sorted(inside.tolist())
+        assert np.all(np.diff(distances) >= 0)
+        assert np.allclose(distances, expected[indices])
+    assert len(grid.query((0, 0), 3.0, k=2)[0]) <= 2
+
+def note(text, x, y):
+    # 1x0.5 note whose center is (x, y)
+    return {"text": text, "position": [x - 0.5, y - 0.25], "size": [1, 0.5], "closest_node": None, "distance": None}
+
+def linker(make_settings, snapshot, nodePaths=None, **parms):
+    return si.StickyNoteLinker(snapshot, make_settings(**parms), nodePaths).link()
+
+def notes_snapshot():
+    snapshot = make_snapshot("/obj/geo", [("a", "box", []), ("b", "null", ["a"])], positions={"a": (0, 0), "b": (10, 0)})
+    snapshot.sticky_notes = [note("below a", 0, -1), note("above b", 10, 1), note("far", 30, 30)]
+    return snapshot
+
+def test_notes_link_to_the_closest_node_not_below_them(make_settings):
+    notes = linker(make_settings, notes_snapshot())
+    assert notes.get_node_note("/obj/geo/a") == "below a"
+    # a note above its node is only linked with link_top_sticky_notes
+    assert notes.get_node_note("/obj/geo/b") is None
+    notes = linker(make_settings, notes_snapshot(), link_top_sticky_notes=1)
+    assert notes.get_node_note("/obj/geo/b") == "above b"
+
+def test_notes_link_to_rendered_nodes_only(make_settings):
+    snapshot = notes_snapshot()
+    snapshot.sticky_notes = [note("between", 4, -1)]
+    assert linker(make_settings, snapshot, sticky_notes_distance=7.0).get_node_note("/obj/geo/a") == "between"
+    notes = linker(make_settings, snapshot, {"/obj/geo/b"}, sticky_notes_distance=7.0)
+    assert notes.get_node_note("/obj/geo/b") == "between"
+
+def test_unlinked_notes_go_to_their_network_box(make_settings):
+    snapshot = notes_snapshot()
+    snapshot.network_boxes = {"box1": {"name": "box1", "comment": "far box", "parent_box": None, "nodes": [],
+                                       "position": [25, 25], "size": [10, 10]}}
+    assert linker(make_settings, snapshot).get_box_notes("box1") == []
+    assert linker(make_settings, snapshot, link_sticky_notes_to_boxes=1).get_box_notes("box1") == ["far"]
+
+def test_linkers_are_shared_per_settings_and_rendered_nodes(make_settings):
+    snapshot = notes_snapshot()
+    settings = make_settings()
+    assert snapshot.get_note_linker(settings) is snapshot.get_note_linker(settings)
+    assert snapshot.get_note_linker(settings, {"/obj/geo/b"}) is not snapshot.get_note_linker(settings)
@@ -0,0 +1,44 @@
+import json
+import jinja2
+import hda_manager as hdam
+import render_manager as rm
+import template_compiler as tc
+from conftest import FakeSection
+
+def write_templates(folder, sources):
+    for name, source in sources.items():
+        (folder / name).write_text(source, encoding="utf-8")
+
+def test_bundle_keeps_the_builds_of_other_jinja_versions(tmp_path, monkeypatch):
+    write_templates(tmp_path, {"a.j2": "{{ a }}", "b.j2": "{{ b }}"})
+    monkeypatch.setattr(jinja2, "__version__", "0.0-houdini")
+    tc.write_bundle(str(tmp_path))
+    monkeypatch.undo()
+    write_templates(tmp_path, {"b.j2": "{{ b }} edited"})
+    output, bundle = tc.write_bundle(str(tmp_path))
+    assert sorted(bundle["builds"]) == sorted(["0.0-houdini", jinja2.__version__])
+    # the code of the edited template is stale for the other version
+    assert sorted(bundle["builds"]["0.0-houdini"]["templates"]) == ["a.j2"]
+    with open(output, encoding="utf-8") as f:
+        text = f.read()
+    assert sorted(tc.load_bundle(text)["templates"]) == ["a.j2", "b.j2"]
+
+def test_shipped_bundle_precompiles_the_templates(definition):
+    sources = {name: section.contents() for name, section in definition.sections().items() if name.endswith(".j2")}
+    loader = tc.PrecompiledLoader(sources, tc.load_bundle(definition.sections()[tc.BUNDLE_NAME].contents()))
+    env = jinja2.Environment(loader=loader)
+    for name in sources:
+        env.get_template(name)
+    assert (loader.precompiled, loader.compiled) == (len(sources), 0)
+
+def test_rejected_bundle_is_reported(monkeypatch, capsys, make_settings):
+    bundle = {"version": tc.VERSION, "builds": {"0.0-houdini": {"templates": {}}}}
+
+    class Definition:
+        def sections(self):
+            return {tc.BUNDLE_NAME: FakeSection(json.dumps(bundle))}
+
+    monkeypatch.setattr(rm.TemplateCache, "_definition", Definition())
+    with hdam.settingsScope(make_settings()):
+        assert rm.TemplateCache.read_bundle() is None
+    assert "0.0-houdini" in capsys.readouterr().out
@@ -0,0 +1,122 @@
+import threading
+import pytest
+import main
+from conftest import read_export
+import watch_manager as wm
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def start_watch(network_paths=("/obj/a", "/obj/b"), delay=1.0):
+    clock = FakeClock()
+    exports = []
+    source = wm.ManualEventSource()
+
+    def export(paths, snapshots, dirtyNodes):
+        exports.append((paths, dict(dirtyNodes)))
+        for path in paths:
+            snapshots.setdefault(path, object())
+
+    watch = wm.WatchManager(network_paths, export, source, delay, clock)
+    watch.start()
+    return watch, source, clock, exports
+
+def test_debounce_fires_once_edits_settle():
+    watch, source, clock, exports = start_watch()
+    # first export captures every network
+    assert not watch.tick()
+    clock.now = 1.0
+    assert watch.tick()
+    assert exports == [(["/obj/a", "/obj/b"], {})]
+
+    source.emit("/obj/a", "/obj/a/xf", "ParmTupleChanged")
+    clock.now = 1.5
+    source.emit("/obj/a", "/obj/a/mtn", "ParmTupleChanged")
+    clock.now = 2.2
+    # 0.7s since the last edit
+    assert not watch.tick()
+    clock.now = 2.5
+    assert watch.tick()
+    assert not watch.tick()
+    assert exports[1] == (["/obj/a"], {"/obj/a": {"/obj/a/xf", "/obj/a/mtn"}})
+    assert watch.scheduler.fired == 2
+
+def test_network_events_drop_the_snapshot():
+    watch, source, clock, exports = start_watch()
+    clock.now = 1.0
+    watch.tick()
+    snapshot = watch.snapshots["/obj/b"]
+    source.emit("/obj/b", "/obj/b/xf", "ParmTupleChanged")
+    source.emit("/obj/b", "/obj/b/new", "ChildCreated")
+    clock.now = 3.0
+    watch.tick()
+    # captured again as a whole, no dirty nodes
+    assert exports[1] == (["/obj/b"], {})
+    assert watch.snapshots["/obj/b"] is not snapshot
+
+def test_stop_cancels_pending_exports():
+    watch, source, clock, exports = start_watch()
+    watch.stop()
+    source.emit("/obj/a", "/obj/a/xf", "ParmTupleChanged")
+    clock.now = 5.0
+    assert not watch.tick()
+    assert exports == []
+    assert source.handlers == {}
+
+def test_export_job_runs_off_the_tick():
+    clock = FakeClock()
+    source = wm.ManualEventSource()
+    release = threading.Event()
+    exports = []
+
+    def export(paths, snapshots, dirtyNodes):
+        exports.append(paths)
+        return release.wait
+
+    watch = wm.WatchManager(["/obj/a"], export, source, 1.0, clock)
+    watch.start()
+    clock.now = 1.0
+    assert watch.tick()
+    assert watch.busy()
+    # edits made during the export wait for it
+    source.emit("/obj/a", "/obj/a/xf", "ParmTupleChanged")
+    clock.now = 3.0
+    assert not watch.tick()
+    release.set()
+    assert watch.wait(5.0)
+    assert watch.tick()
+    assert exports == [["/obj/a"], ["/obj/a"]]
+    watch.wait(5.0)
+
+@pytest.mark.parametrize("layout", [
+    {"break_by_node_path": 1},
+    {"break_by_node_path": 0},
+    {"break_by_node_path": 0, "pipeline_workers": 2, "group_by_network_box_l1": 1}
+])
+def test_watch_export_restores_the_networks_not_edited(tmp_path, monkeypatch, make_settings, networks, export, layout):
+    monkeypatch.setattr(main, "hda", None)
+    built = []
+    build = main.buildNodePathNetwork
+
+    def buildAndRecord(nodePath, snapshot=None):
+        built.append(nodePath)
+        return build(nodePath, snapshot)
+
+    monkeypatch.setattr(main, "buildNodePathNetwork", buildAndRecord)
+    settings = make_settings(**layout)
+    callback = main.watchExportCallback(settings.hdaNode)
+    snapshots = networks()
+    callback(["/obj/a", "/obj/b"], snapshots, {})()
+    assert sorted(built) == ["/obj/a", "/obj/b"]
+
+    snapshots["/obj/b"].nodes["/obj/b/other"]["properties"]["scale"]["value"] = 5.0
+    del built[:]
+    callback(["/obj/b"], snapshots, {})()
+    assert built == ["/obj/b"]
+    fresh = export(make_settings(project_location=str(tmp_path / "fresh"), **layout), snapshots)
+    assert "5.0" in "".join(fresh.values())
+    assert read_export(settings.projectLocation) == fresh
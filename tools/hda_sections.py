@@ -0,0 +1,270 @@
+"""
+Reads and writes the sections of the Houdini 2 Chat HDA file without Houdini, to build the asset from hda_scripts.
+
+    python tools/hda_sections.py list hda/sop_rendermagix.houdini_2_chat.0.1.0.hdalc
+    python tools/hda_sections.py extract hda/sop_rendermagix.houdini_2_chat.0.1.0.hdalc DialogScript -o DialogScript
+    python tools/hda_sections.py sync hda/sop_rendermagix.houdini_2_chat.0.1.0.hdalc
+    python tools/hda_sections.py sync hda/sop_rendermagix.houdini_2_chat.0.1.0.hdalc --python /opt/hfs20.5/bin/hython
+
+sync copies into the asset the DialogScript, PythonModule, the module sections listed in PythonModule.MODULE_SECTIONS,
+the jinja templates of hda_scripts and their precompiled bundle (built first, see template_compiler).
+The bundle holds a build per jinja version: it is built with this interpreter, then with each --python interpreter,
+hython by default (from $HFS/bin or the PATH) when it is found, as Houdini runs the templates with its own jinja.
+Sections are only rewritten when their content changed.
+"""
+import argparse
+import ast
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = os.path.join(os.path.dirname(HERE), "hda_scripts")
+
+class IndexFile:
+    """
+    INDX container of the HDA files: a header, a table of (name, offset, size, modification time)
+    and the section data. The asset file holds one INDX per definition, nested in the library INDX.
+    """
+    MAGIC = b"INDX"
+
+    def __init__(self, header, sections):
+        self.header = header # bytes between the magic and the section count
+        self.sections = sections # list of [name, data, modification time]
+
+    @staticmethod
+    def parse(data):
+        if data[:4] != IndexFile.MAGIC:
+            raise ValueError("not an INDX file")
+        header = data[4:12]
+        count = struct.unpack(">I", data[12:16])[0]
+        pos = 16
+        table = []
+        for _ in range(count):
+            length = struct.unpack(">I", data[pos:pos + 4])[0]
+            name = data[pos + 4:pos + 4 + length].decode("utf-8")
+            offset, size, mtime = struct.unpack(">III", data[pos + 4 + length:pos + 16 + length])
+            table.append((name, offset, size, mtime))
+            pos += 16 + length
+        sections = [[name, data[pos + offset:pos + offset + size], mtime] for name, offset, size, mtime in table]
+        return IndexFile(header, sections)
+
+    def toBytes(self):
+        table = []
+        offset = 0
+        for name, data, mtime in self.sections:
+            encoded = name.encode("utf-8")
+            table.append(struct.pack(">I", len(encoded)) + encoded + struct.pack(">III", offset, len(data), mtime))
+            offset += len(data)
+        return (IndexFile.MAGIC + self.header + struct.pack(">I", len(self.sections)) + b"".join(table) +
+                b"".join(data for _, data, _ in self.sections))
+
+    def names(self):
+        return [name for name, _, _ in self.sections]
+
+    def get(self, name):
+        for section in self.sections:
+            if section[0] == name:
+                return section[1]
+        return None
+
+    def set(self, name, data, mtime=None):
+        """
+        Sets the data of a section, appended if new. Returns True if the data changed.
+        """
+        mtime = int(time.time()) if mtime is None else mtime
+        for section in self.sections:
+            if section[0] == name:
+                if section[1] == data:
+                    return False
+                section[1] = data
+                section[2] = mtime
+                return True
+        self.sections.append([name, data, mtime])
+        return True
+
+class FileOptions:
+    """
+    ExtraFileOptions section: per section editor options (name/IsPython, name/Source...), binary UT_Options.
+    Values are kept as raw bytes, only their type is needed to split them.
+    """
+    INT_VECTOR = 13 # cursor position
+    BOOL = 1
+    STRING = 3
+
+    def __init__(self, options):
+        self.options = options # list of (name, type, raw value)
+
+    @staticmethod
+    def parse(data):
+        count = struct.unpack(">I", data[:4])[0]
+        pos = 4
+        options = []
+        for _ in range(count):
+            length = struct.unpack(">H", data[pos:pos + 2])[0]
+            name = data[pos + 2:pos + 2 + length].decode("utf-8")
+            pos += 2 + length
+            optionType = struct.unpack(">I", data[pos:pos + 4])[0]
+            pos += 4
+            if optionType == FileOptions.STRING:
+                size = 2 + struct.unpack(">H", data[pos:pos + 2])[0]
+            elif optionType == FileOptions.INT_VECTOR:
+                size = 8 + 8 * struct.unpack(">Q", data[pos:pos + 8])[0]
+            elif optionType == FileOptions.BOOL:
+                size = 4
+            else:
+                raise ValueError(f"unknown option type {optionType} for {name}")
+            options.append((name, optionType, data[pos:pos + size]))
+            pos += size
+        return FileOptions(options)
+
+    def toBytes(self):
+        parts = [struct.pack(">I", len(self.options))]
+        for name, optionType, value in self.options:
+            encoded = name.encode("utf-8")
+            parts.append(struct.pack(">H", len(encoded)) + encoded + struct.pack(">I", optionType) + value)
+        return b"".join(parts)
+
+    def sections(self):
+        return {name.split("/")[0] for name, _, _ in self.options}
+
+    def add_section(self, section, like, source):
+        """
+        Adds the options of a section, copied from the section like, with its Source file.
+        """
+        for name, optionType, value in list(self.options):
+            prefix, option = name.split("/", 1)
+            if prefix != like:
+                continue
+            if option == "Source":
+                encoded = source.encode("utf-8")
+                value = struct.pack(">H", len(encoded)) + encoded
+            self.options.append((f"{section}/{option}", optionType, value))
+
+def module_sections(scriptsFolder):
+    # the module sections are the ones PythonModule registers
+    with open(os.path.join(scriptsFolder, "PythonModule.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, "id", None) == "MODULE_SECTIONS" for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError("MODULE_SECTIONS not found in PythonModule.py")
+
+def read_text(filename):
+    with open(filename, "rb") as f:
+        return f.read()
+
+def find_hython():
+    hfs = os.environ.get("HFS")
+    if hfs:
+        hython = shutil.which("hython", path=os.path.join(hfs, "bin"))
+        if hython:
+            return hython
+    return shutil.which("hython")
+
+def build_bundle(scriptsFolder, interpreters=()):
+    # the bundle is built with the template_compiler of the synced scripts
+    sys.path.insert(0, scriptsFolder)
+    try:
+        import template_compiler
+    finally:
+        sys.path.remove(scriptsFolder)
+    templatesFolder = os.path.join(scriptsFolder, "templates")
+    bundleFile = template_compiler.write_bundle(templatesFolder)[0]
+    # each interpreter adds the build of its jinja version to the bundle file
+    for interpreter in interpreters:
+        subprocess.run([interpreter, os.path.join(scriptsFolder, "template_compiler.py"), templatesFolder, "-o", bundleFile],
+                       check=True)
+    return bundleFile
+
+def sync(assetFile, scriptsFolder=SCRIPTS, interpreters=()):
+    bundleFile = build_bundle(scriptsFolder, interpreters)
+    with open(assetFile, "rb") as f:
+        library = IndexFile.parse(f.read())
+    # library sections: INDEX_SECTION, houdini.hdalibrary, then the definition
+    definitionName = library.sections[-1][0]
+    definition = IndexFile.parse(library.sections[-1][1])
+
+    files = {"DialogScript": os.path.join(scriptsFolder, "DialogScript"),
+             "PythonModule": os.path.join(scriptsFolder, "PythonModule.py")}
+    for name in module_sections(scriptsFolder):
+        files[name] = os.path.join(scriptsFolder, name + ".py")
+    templatesFolder = os.path.join(scriptsFolder, "templates")
+    for name in sorted(os.listdir(templatesFolder)):
+        if name.endswith(".j2"):
+            files[name] = os.path.join(templatesFolder, name)
+    files[os.path.basename(bundleFile)] = bundleFile
+
+    changed = []
+    for name, filename in files.items():
+        if definition.set(name, read_text(filename)):
+            changed.append(name)
+
+    # new sections get the editor options of the existing ones, linked to their file like the others
+    options = FileOptions.parse(definition.get("ExtraFileOptions"))
+    sourceRoot = None
+    for name, optionType, value in options.options:
+        if name == "PythonModule/Source":
+            sourceRoot = os.path.dirname(value[2:].decode("utf-8"))
+    for name, filename in files.items():
+        if name in options.sections() or name == "DialogScript" or sourceRoot is None:
+            continue
+        like = "nodes_unit.py.j2" if name.endswith(".j2") else "gnode"
+        relative = os.path.relpath(filename, scriptsFolder).replace(os.sep, "/")
+        options.add_section(name, like, f"{sourceRoot}/{relative}")
+    definition.set("ExtraFileOptions", options.toBytes())
+
+    library.set(definitionName, definition.toBytes(), library.sections[-1][2])
+    tempFilename = assetFile + ".partial"
+    with open(tempFilename, "wb") as f:
+        f.write(library.toBytes())
+    os.replace(tempFilename, assetFile)
+    return changed
+
+def load_definition(assetFile):
+    with open(assetFile, "rb") as f:
+        library = IndexFile.parse(f.read())
+    return IndexFile.parse(library.sections[-1][1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lists, extracts and syncs the sections of the HDA file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    listCommand = commands.add_parser("list")
+    listCommand.add_argument("asset")
+    extractCommand = commands.add_parser("extract")
+    extractCommand.add_argument("asset")
+    extractCommand.add_argument("section")
+    extractCommand.add_argument("-o", "--output", help="file receiving the section, stdout by default")
+    syncCommand = commands.add_parser("sync")
+    syncCommand.add_argument("asset")
+    syncCommand.add_argument("--scripts", default=SCRIPTS, help="hda_scripts folder")
+    syncCommand.add_argument("--python", action="append", dest="interpreters", metavar="INTERPRETER",
+                             help="other interpreter building the templates with its jinja version, repeatable "
+                                  "(hython by default when found)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, data, mtime in load_definition(args.asset).sections:
+            print(f"{len(data):>8}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))}  {name}")
+    elif args.command == "extract":
+        data = load_definition(args.asset).get(args.section)
+        if data is None:
+            parser.error(f"no section {args.section}")
+        if args.output:
+            with open(args.output, "wb") as f:
+                f.write(data)
+        else:
+            sys.stdout.buffer.write(data)
+    elif args.command == "sync":
+        interpreters = args.interpreters
+        if interpreters is None:
+            hython = find_hython()
+            interpreters = [hython] if hython else []
+        changed = sync(args.asset, args.scripts, interpreters)
+        print(f"{len(changed)} sections updated: {', '.join(changed)}")
+
+if __name__ == "__main__":
+    main()